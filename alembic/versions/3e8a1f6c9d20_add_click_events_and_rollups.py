@@ -0,0 +1,57 @@
+"""Add click events and rollups
+
+Revision ID: 3e8a1f6c9d20
+Revises: 7c2d9e4b1a3f
+Create Date: 2026-10-18 14:03:12.518330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8a1f6c9d20'
+down_revision: Union[str, Sequence[str], None] = '7c2d9e4b1a3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('click_events',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('event_id', sqlmodel.sql.sqltypes.AutoString(length=32), nullable=False),
+    sa.Column('alias', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('clicked_at', sa.DateTime(), nullable=False),
+    sa.Column('referrer', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('user_agent', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('country', sqlmodel.sql.sqltypes.AutoString(length=2), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id')
+    )
+    op.create_index(op.f('ix_click_events_alias'), 'click_events', ['alias'], unique=False)
+    op.create_index(op.f('ix_click_events_clicked_at'), 'click_events', ['clicked_at'], unique=False)
+    op.create_table('click_rollups_hourly',
+    sa.Column('alias', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('hour', sa.DateTime(), nullable=False),
+    sa.Column('clicks', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('alias', 'hour')
+    )
+    op.create_table('click_rollups_daily',
+    sa.Column('alias', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('clicks', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('alias', 'day')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('click_rollups_daily')
+    op.drop_table('click_rollups_hourly')
+    op.drop_index(op.f('ix_click_events_clicked_at'), table_name='click_events')
+    op.drop_index(op.f('ix_click_events_alias'), table_name='click_events')
+    op.drop_table('click_events')
@@ -0,0 +1,34 @@
+"""Add urls alias sequence
+
+Revision ID: 7c2d9e4b1a3f
+Revises: 25f0972a44a5
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2d9e4b1a3f'
+down_revision: Union[str, Sequence[str], None] = '25f0972a44a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Sequences are Postgres only, elsewhere the sequence allocator falls back to random aliases
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    # Source of ids for ALIAS_ALLOCATOR=sequence, reserved in blocks by the workers
+    op.execute(sa.schema.CreateSequence(sa.Sequence('urls_alias_seq', start=1)))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute(sa.schema.DropSequence(sa.Sequence('urls_alias_seq')))
@@ -0,0 +1,41 @@
+"""Add click country rollup
+
+Revision ID: 9b4d2c7e5f18
+Revises: 3e8a1f6c9d20
+Create Date: 2026-10-18 16:41:07.204719
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4d2c7e5f18'
+down_revision: Union[str, Sequence[str], None] = '3e8a1f6c9d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('click_rollups_country_daily',
+    sa.Column('alias', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('country', sqlmodel.sql.sqltypes.AutoString(length=2), nullable=False),
+    sa.Column('clicks', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('alias', 'day', 'country')
+    )
+    # Backfill from the events stored so far, later batches are added incrementally
+    op.execute(
+        "INSERT INTO click_rollups_country_daily (alias, day, country, clicks) "
+        "SELECT alias, CAST(clicked_at AS DATE), COALESCE(country, ''), COUNT(*) "
+        "FROM click_events GROUP BY alias, CAST(clicked_at AS DATE), COALESCE(country, '')"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('click_rollups_country_daily')
@@ -0,0 +1,67 @@
+"""Partition urls by alias
+
+Revision ID: c81f4a2d6e35
+Revises: 9b4d2c7e5f18
+Create Date: 2026-10-18 19:22:48.906114
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.databases.partitioning import (
+    INITIAL_COLUMNS, create_mirror_trigger, create_partitioned_table, drop_mirror_trigger, is_partitioned,
+    swap_tables, table_exists
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f4a2d6e35'
+down_revision: Union[str, Sequence[str], None] = '9b4d2c7e5f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    # Hash partitioning is Postgres only, other databases keep the plain table
+    if connection.dialect.name != "postgresql":
+        return
+    create_partitioned_table(connection, settings.URLS_PARTITIONS)
+    # Offline (--sql) the rows can't be counted, take the online path
+    if context.is_offline_mode() or connection.execute(sa.text("SELECT EXISTS (SELECT 1 FROM urls)")).scalar():
+        # Existing rows are copied online by `python -m app.databases.partitioning`,
+        # new writes are mirrored until the tables are swapped
+        # urls has no expires_at yet, the next migration mirrors it too
+        create_mirror_trigger(connection, INITIAL_COLUMNS)
+    else:
+        swap_tables(connection)
+        op.drop_table('urls_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    if connection.dialect.name != "postgresql":
+        return
+    if not is_partitioned(connection):
+        # Not swapped yet
+        drop_mirror_trigger(connection)
+        op.drop_table('urls_partitioned')
+        return
+    # Copies every row while holding the lock, meant for small tables
+    op.execute("LOCK TABLE urls IN ACCESS EXCLUSIVE MODE")
+    if table_exists(connection, "urls_unpartitioned"):
+        op.drop_table('urls_unpartitioned')
+    op.execute("CREATE TABLE urls_unpartitioned (LIKE urls INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO urls_unpartitioned SELECT * FROM urls")
+    # Otherwise dropping the table drops the sequence too
+    op.execute("ALTER SEQUENCE urls_id_seq OWNED BY NONE")
+    op.drop_table('urls')
+    op.rename_table('urls_unpartitioned', 'urls')
+    op.create_primary_key('urls_pkey', 'urls', ['id'])
+    op.create_index(op.f('ix_urls_alias'), 'urls', ['alias'], unique=True)
+    op.execute("ALTER SEQUENCE urls_id_seq OWNED BY urls.id")
@@ -0,0 +1,52 @@
+"""Add urls expires_at
+
+Revision ID: e5a7c3b9d1f2
+Revises: c81f4a2d6e35
+Create Date: 2026-10-18 21:05:33.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from app.databases.partitioning import INITIAL_COLUMNS, create_expires_at_index, create_mirror_function, table_exists
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c3b9d1f2'
+down_revision: Union[str, Sequence[str], None] = 'c81f4a2d6e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def moving_to_partitions(connection) -> bool:
+    # Offline (--sql) the previous migration took the online path, the move is in progress
+    return context.is_offline_mode() or table_exists(connection, "urls_partitioned")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    if connection.dialect.name != "postgresql":
+        op.add_column('urls', sa.Column('expires_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_urls_expires_at', 'urls', ['expires_at'])
+        return
+    # An empty database was swapped to the partitioned table, which has it already
+    op.execute("ALTER TABLE urls ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITHOUT TIME ZONE")
+    create_expires_at_index(connection, "urls")
+    if moving_to_partitions(connection):
+        # Both tables have it now, mirror it and let the copy carry it over
+        op.execute("ALTER TABLE urls_partitioned ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITHOUT TIME ZONE")
+        create_expires_at_index(connection, "urls_partitioned")
+        create_mirror_function(connection)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    if connection.dialect.name == "postgresql" and moving_to_partitions(connection):
+        create_mirror_function(connection, INITIAL_COLUMNS)
+        op.drop_column('urls_partitioned', 'expires_at')
+    op.drop_index('ix_urls_expires_at', table_name='urls')
+    op.drop_column('urls', 'expires_at')
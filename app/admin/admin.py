@@ -1,11 +1,29 @@
 from sqladmin import ModelView
 
+from app.databases.general import invalidate_alias, register_alias
 from app.databases.models import Urls, User
 
 
 class UrlsAdmin(ModelView, model=Urls):
-    column_list = [Urls.alias, Urls.original_url, Urls.created_at, Urls.total_clicks]
-    column_default_sort = ("created_at", True)
+    column_list = [Urls.alias, Urls.original_url, Urls.created_at, Urls.expires_at, Urls.total_clicks]
+    # Newest first, ids follow creation and are indexed in every partition
+    column_default_sort = ("id", True)
+
+    async def on_model_change(self, data, model, is_created, request):
+        # Remember the alias before the edit, it may be renamed
+        request.state.previous_alias = None if is_created else model.alias
+
+    async def after_model_change(self, data, model, is_created, request):
+        previous_alias = getattr(request.state, "previous_alias", None)
+        if previous_alias and previous_alias != model.alias:
+            await invalidate_alias(previous_alias)
+        await invalidate_alias(model.alias)
+        if is_created or previous_alias != model.alias:
+            # A new alias, it must reach every worker's Bloom filter
+            await register_alias(model.alias)
+
+    async def after_model_delete(self, model, request):
+        await invalidate_alias(model.alias)
 
 # class UserAdmin(ModelView, model=User):
 #     column_list = [User.username, User.email, User.disabled, User.is_admin]
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from app.api.v1 import routers as v1_endpoints
 from app.api.health_checks import routers as health_check_endpoints
+from app.api.metrics import routers as metrics_endpoints
 
 api_router = APIRouter(
     prefix="/api",
@@ -10,5 +11,10 @@ health_router = APIRouter(
     prefix="/health",
 )
 
+metrics_router = APIRouter(
+    prefix="",
+)
+
 api_router.include_router(v1_endpoints.router, prefix="/v1.0", tags=["v1.0"])
 health_router.include_router(health_check_endpoints.router,  tags=["health"])
+metrics_router.include_router(metrics_endpoints.router, tags=["metrics"])
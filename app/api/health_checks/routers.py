@@ -1,11 +1,16 @@
-from fastapi import APIRouter, status, Request, Depends, HTTPException
-from typing import Dict, Union
+import asyncio
+import json
+from fastapi import APIRouter, status, Request, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Optional, Union
 
 from fastapi.security import APIKeyHeader
 
 from app.core.config import settings
 from app.databases.general import DBActions
-from app.databases.redis import redis_cache
+from app.databases.local_cache import alias_cache
+from app.databases.redis import cache_nodes, redis_cache, url_cache
+from app.databases.warming import warming_status
 from app.core.rate_limit import limiter, rate_limit_response
 
 router = APIRouter()
@@ -24,77 +29,142 @@ async def psql_status() -> Dict[str, Union[bool, str]]:
     """
     try:
         actions = DBActions()
-        last_id = actions.get_last_id()
+        last_id = await actions.get_last_id()
         return {"healthy": True}
     except Exception as e:
         return {"healthy": False, "error": str(e)}
 
 
+async def check_redis_nodes(main_check, node_check) -> dict:
+    """
+    Run a check on the main Redis node and on every cache node, returns
+    {"healthy": all passed, "nodes": {node: {"healthy": ..., "error": ...}}}
+    """
+    async def run(check):
+        try:
+            return {"healthy": bool(await check)}
+        except Exception as e:
+            return {"healthy": False, "error": str(e)}
+
+    main_node = f"{settings.REDIS_CACHE_HOST}:{settings.REDIS_CACHE_PORT}"
+    results = {main_node: await run(main_check())}
+    try:
+        nodes = [node for node in await cache_nodes.nodes() if node != main_node]
+    except Exception as e:
+        # The cluster topology couldn't be read
+        nodes, results["cluster"] = [], {"healthy": False, "error": str(e)}
+    results.update(zip(nodes, await asyncio.gather(*(run(node_check(node)) for node in nodes))))
+    return {"healthy": all(result["healthy"] for result in results.values()), "nodes": results}
+
+
 @router.get("/redis", responses=rate_limit_response, dependencies=[Depends(internal_only)])
 @limiter.limit("30/minute")
-async def redis_health_check(request: Request) -> Dict[str, Union[bool, str]]:
+async def redis_health_check(request: Request) -> Dict[str, Union[bool, dict]]:
     """
-    Health check endpoint for Redis connectivity.
+    Health check endpoint for Redis connectivity, per node.
 
     Args:
         request (Request): The incoming FastAPI request object.
 
     Returns:
-        dict: {"healthy": True} if Redis is reachable,
-              {"healthy": False, "error": "..."} otherwise.
+        dict: {"healthy": True, "nodes": {...}} if every node is reachable,
+              {"healthy": False, "nodes": {...}} otherwise, the failing
+              nodes have an "error".
 
     Possible Responses:
         - 200: Redis health status
         - 429: Too Many Requests (rate limit exceeded)
     """
-    try:
-        await redis_cache.ping()
-        return {"healthy": True}
-    except Exception as e:
-        return {"healthy": False, "error": str(e)}
+    return await check_redis_nodes(redis_cache.ping, cache_nodes.ping)
 
 
 @router.get("/redis_rw", responses=rate_limit_response, dependencies=[Depends(internal_only)])
 @limiter.limit("10/minute")
-async def redis_health_read_write_check(request: Request) -> Dict[str, Union[bool, str]]:
+async def redis_health_read_write_check(request: Request) -> Dict[str, Union[bool, dict]]:
     """
-    Health check endpoint for Redis read/write operations.
+    Health check endpoint for Redis read/write operations, per node.
 
-    Writes a temporary key-value pair, reads it back, and
+    Writes a temporary key-value pair on every node, reads it back, and
     validates read/write functionality.
 
     Args:
         request (Request): The incoming FastAPI request object.
 
     Returns:
-        dict: {"healthy": True} if read/write works,
-              {"healthy": False, "error": "..."} otherwise.
+        dict: {"healthy": True, "nodes": {...}} if read/write works on
+              every node, {"healthy": False, "nodes": {...}} otherwise.
 
     Possible Responses:
         - 200: Redis read/write health status
         - 429: Too Many Requests (rate limit exceeded)
     """
-    try:
-        test_key = "health:check"
-        test_value = "ok"
+    async def main_check():
+        await redis_cache.set("health:check", "ok", ex=5)
+        return await redis_cache.get("health:check") == "ok"
 
-        await redis_cache.set(test_key, test_value, ex=5)
-        value = await redis_cache.get(test_key)
+    return await check_redis_nodes(main_check, cache_nodes.read_write_check)
 
-        return {"healthy": True} if value == test_value else {"healthy": False}
-    except Exception as e:
-        return {"healthy": False, "error": str(e)}
+@router.get("/local_cache", dependencies=[Depends(internal_only)])
+async def local_cache_stats() -> Dict[str, int]:
+    """
+    Hit/miss/eviction counters of this worker's in-process alias cache.
+    """
+    return alias_cache.stats()
+
+@router.get("/cache_warming", dependencies=[Depends(internal_only)])
+async def cache_warming_status() -> Dict[str, Union[bool, int, float, str, None]]:
+    """
+    Progress and duration of this worker's last cache warming run.
+    """
+    return warming_status
 
 @router.get("/redis_data", responses=rate_limit_response, dependencies=[Depends(internal_only)])
-async def list_all_redis_data():
+async def list_all_redis_data(
+    match: Optional[str] = None,
+    cursor: str = Query("0", pattern=r"^\d+(:\d+)?$"),
+    count: int = Query(1000, ge=1, le=10000),
+    limit: Optional[int] = Query(None, ge=1),
+):
     """
-    Lists all key-value pairs in the Redis database.
+    Streams the cached urls of the Redis cache as NDJSON.
+
+    Walks the url keys, or the url bucket hashes, of every cache node in
+    turn with SCAN and fetches every batch with one round trip, so only one
+    batch is ever held in memory. Locks, stats, rate limits and the other
+    keys sharing the nodes are left out.
+
+    Args:
+        match (str): Optional glob pattern the aliases must match.
+        cursor (str): Cursor to resume from, "0" starts a new scan.
+        count (int): COUNT hint passed to every SCAN call.
+        limit (int): Stop after about this many keys. The last batch is
+            always sent whole, so slightly more keys may be returned.
 
     Returns:
-        dict: Dictionary of {key: value} for all string keys.
+        One {"key": alias, "value": url} line per cached url. The last line
+        is {"cursor": ...}, pass it back to get the next page, "0" means the
+        scan is complete.
     """
-    data = {}
-    async for key in redis_cache.scan_iter():
-        value = await redis_cache.get(key)
-        data[key] = value
-    return data
+    return StreamingResponse(
+        stream_redis_data(match, cursor, count, limit),
+        media_type="application/x-ndjson",
+    )
+
+
+async def stream_redis_data(match: Optional[str], cursor: str, count: int, limit: Optional[int]):
+    # "<node number>:<SCAN cursor of that node>"
+    nodes = await cache_nodes.nodes()
+    index, _, node_cursor = cursor.partition(":")
+    index, node_cursor = int(index), int(node_cursor or 0)
+    sent = 0
+    while index < len(nodes):
+        node = nodes[index]
+        node_cursor, urls = await url_cache.scan_urls(node, node_cursor, match=match, count=count)
+        if urls:
+            yield "".join(json.dumps({"key": alias, "value": url}) + "\n" for alias, url in urls)
+            sent += len(urls)
+        if node_cursor == 0:
+            index += 1
+        if limit and sent >= limit:
+            break
+    yield json.dumps({"cursor": f"{index}:{node_cursor}" if index < len(nodes) else "0"}) + "\n"
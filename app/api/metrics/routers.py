@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+from starlette.responses import PlainTextResponse
+
+from app.api.health_checks.routers import internal_only
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", dependencies=[Depends(internal_only)], response_class=PlainTextResponse)
+async def metrics():
+    """
+    Metrics of this worker in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,14 +1,19 @@
 import logging
-from fastapi import APIRouter, BackgroundTasks, Request
+from typing import Literal
+
+from fastapi import APIRouter, BackgroundTasks, Query, Request
 
 from app.core.config import settings
 from app.core.rate_limit import rate_limit_response, limiter
-from app.databases.general import resolve_url_from_dbs, DBActions, increase_click
-from app.databases.redis import save_to_cache
-from app.databases.serializers import UrlRequestRecord
+from app.databases.allocators import alias_allocator
+from app.databases.click_events import record_click
+from app.databases.clicks import increase_click
+from app.databases.general import AliasExpired, resolve_url_from_dbs, DBActions
+from app.databases.redis import save_to_cache, save_many_to_cache
+from app.databases.serializers import UrlRequestRecord, UrlBatchRequest
+from app.databases.stats import get_alias_stats
 
-from app.utils.generators import get_random_url_string
-from app.errors.api_errors import NotFound
+from app.errors.api_errors import BadRequest, Conflict, Gone, NotFound
 
 
 logger = logging.getLogger(__name__)
@@ -23,39 +28,140 @@ async def minify_url(request: Request, item: UrlRequestRecord, background_tasks:
     Minify a provided url
     """
     actions = DBActions()
+    item.url = f"{item.url}".rstrip('/').strip()
+
+    # The unique index on alias is the only check, the insert is awaited so
+    # the alias is stored and registered with every worker's Bloom filter
+    # before the client can follow the link.
     if item.preferred_alias:
-        exists = actions.get_url_by_alias(item.preferred_alias)
-        if exists:
-            raise ValueError(f"Alias '{item.preferred_alias}' already exists.")
+        alias = item.preferred_alias
+        try:
+            await actions.add_url(alias, item.url, item.description, item.expires_at)
+        except ValueError as exc:
+            raise Conflict(detail=str(exc)) from exc
     else:
-        item.preferred_alias = get_random_url_string(6)
+        # Only a random alias can collide, retry with a fresh one
+        for attempt in range(3):
+            alias = await alias_allocator.allocate()
+            try:
+                await actions.add_url(alias, item.url, item.description, item.expires_at)
+                break
+            except ValueError:
+                logger.warning(f"Generated alias already exists: {alias}")
+        else:
+            raise Conflict(detail="Could not allocate a free alias, try again.")
 
-    item.url = f"{item.url}".rstrip('/').strip()
+    # Cache writes can happen after the response
+    background_tasks.add_task(save_to_cache, key=alias, value=item.url, expires_at=item.expires_at)
 
-    # Save to cache/db in the background so we don't block the response
-    background_tasks.add_task(save_to_cache, key=item.preferred_alias, value=item.url)
-
-    # This way there is a chance of data lose if the alias already exists
-    # User is not informed.
-    background_tasks.add_task(actions.add_url, item.preferred_alias, item.url, item.description)
     base_url = settings.BASE_URL
     return {
-        "minified_url": f"{base_url}/{item.preferred_alias}",
+        "minified_url": f"{base_url}/{alias}",
     }
 
+@router.post("/minify/batch", responses=rate_limit_response)
+@limiter.limit("10/minute")
+async def minify_urls(request: Request, batch: UrlBatchRequest, background_tasks: BackgroundTasks):
+    """
+    Minify many urls at once.
+
+    Preferred aliases are checked with one query and everything is inserted
+    with multi-row inserts, so a batch costs a few round trips in total.
+    Results are returned per item, in the same order as the request.
+    """
+    actions = DBActions()
+    base_url = settings.BASE_URL
+    results = [None] * len(batch.items)
+
+    preferred = [item.preferred_alias for item in batch.items if item.preferred_alias]
+    taken = await actions.get_existing_aliases(preferred)
+
+    generated = iter(await alias_allocator.allocate_many(len(batch.items) - len(preferred)))
+
+    pending = {}  # alias -> (position, row)
+    for position, item in enumerate(batch.items):
+        url = f"{item.url}".rstrip('/').strip()
+        alias = item.preferred_alias
+        if alias and (alias in taken or alias in pending):
+            results[position] = {"url": url, "error": f"Alias '{alias}' already exists."}
+            continue
+        if not alias:
+            alias = next(generated)
+        while alias in pending:
+            alias = await alias_allocator.allocate()
+        pending[alias] = (position, {
+            "alias": alias, "original_url": url, "description": item.description, "expires_at": item.expires_at,
+        })
+
+    saved, expiring = {}, {}
+    for attempt in range(3):
+        inserted = await actions.add_urls([row for _, row in pending.values()])
+        retry = {}
+        for alias, (position, row) in pending.items():
+            if alias in inserted:
+                saved[alias] = row["original_url"]
+                if row["expires_at"]:
+                    expiring[alias] = row["expires_at"]
+                results[position] = {"url": row["original_url"], "minified_url": f"{base_url}/{alias}"}
+            elif batch.items[position].preferred_alias or attempt == 2:
+                # Taken meanwhile, or no free alias found
+                results[position] = {"url": row["original_url"], "error": f"Alias '{alias}' already exists."}
+            else:
+                new_alias = await alias_allocator.allocate()
+                while new_alias in retry or new_alias in saved:
+                    new_alias = await alias_allocator.allocate()
+                retry[new_alias] = (position, {**row, "alias": new_alias})
+        if not retry:
+            break
+        pending = retry
+
+    # All the cache entries go out in a single pipeline
+    background_tasks.add_task(save_many_to_cache, saved, expires_at=expiring)
+
+    return {"results": results}
+
 @router.get("/{alias}", responses=rate_limit_response)
 @limiter.limit("30/minute")
-async def resolve_url(request: Request, alias: str, background_tasks: BackgroundTasks):
+async def resolve_url(request: Request, alias: str):
     """
     Resolve a minified url alias to its original url.
     No redirect, just return the original URL in JSON.
     """
-    original_url = await resolve_url_from_dbs(alias)
-    background_tasks.add_task(increase_click, alias)
+    original_url = await resolve_url_or_gone(alias)
 
     if not original_url:
         raise NotFound("Requested url not found")
-    
-    background_tasks.add_task(save_to_cache, alias, original_url)
+
+    increase_click(alias)
+    record_click(alias, request)
 
     return {"url": original_url}
+
+
+@router.get("/{alias}/stats", responses=rate_limit_response)
+@limiter.limit("30/minute")
+async def alias_stats(
+    request: Request,
+    alias: str,
+    granularity: Literal["day", "hour"] = "day",
+    days: int = Query(30, ge=1, le=settings.STATS_MAX_DAYS),
+):
+    """
+    Clicks of an alias per day (or hour) over the last `days` days,
+    with the top countries. Served from the click rollups.
+    """
+    if granularity == "hour" and days > settings.STATS_MAX_HOURLY_DAYS:
+        raise BadRequest(f"Hourly stats cover at most {settings.STATS_MAX_HOURLY_DAYS} days")
+
+    if not await resolve_url_or_gone(alias):
+        raise NotFound("Requested url not found")
+
+    return await get_alias_stats(alias, granularity, days)
+
+
+async def resolve_url_or_gone(alias: str):
+    """resolve_url_from_dbs, raises Gone when the link expired"""
+    try:
+        return await resolve_url_from_dbs(alias)
+    except AliasExpired as exc:
+        raise Gone("Requested url has expired") from exc
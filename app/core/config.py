@@ -17,6 +17,55 @@ class EnvSettings(BaseSettings):
     REDIS_CACHE_PASSWORD: str = os.getenv("REDIS_CACHE_PASSWORD", "")
     REDIS_CACHE_DB: int = int(os.getenv("REDIS_CACHE_DB", 0))
     REDIS_CACHE_URL: str = os.getenv("REDIS_CACHE_URL", f"redis://redis-cache:{REDIS_CACHE_PORT}/0")
+    # Cached aliases and stats may be spread over more nodes, "host:port"
+    # comma separated: standalone nodes picked by consistent hashing, or the
+    # startup nodes of a Redis Cluster when REDIS_CACHE_CLUSTER=1. Locks, rate
+    # limits, streams and pub/sub stay on the REDIS_CACHE_HOST node
+    REDIS_CACHE_NODES: str = os.getenv("REDIS_CACHE_NODES", "")
+    REDIS_CACHE_CLUSTER: bool = bool(int(os.getenv("REDIS_CACHE_CLUSTER", 0)))
+    # "keys": one Redis key per cached alias. "buckets": aliases are fields of
+    # CACHE_BUCKETS small hashes, far less memory per alias, expiring in
+    # generations of CACHE_BUCKET_TTL seconds (entries live 1 to 2 of them).
+    # CACHE_COMPRESSION=1 deflates the urls with a dictionary of common parts
+    CACHE_ENCODING: str = os.getenv("CACHE_ENCODING", "keys")
+    CACHE_BUCKETS: int = int(os.getenv("CACHE_BUCKETS", 65536))
+    CACHE_BUCKET_TTL: int = int(os.getenv("CACHE_BUCKET_TTL", 43200))
+    CACHE_COMPRESSION: bool = bool(int(os.getenv("CACHE_COMPRESSION", 0)))
+
+    # In-process (L1) alias cache, per worker. Size 0 disables it
+    LOCAL_CACHE_SIZE: int = int(os.getenv("LOCAL_CACHE_SIZE", 10000))
+    LOCAL_CACHE_TTL: int = int(os.getenv("LOCAL_CACHE_TTL", 60))
+    # Per worker cache of aliases known not to exist
+    NEGATIVE_CACHE_SIZE: int = int(os.getenv("NEGATIVE_CACHE_SIZE", 100000))
+    NEGATIVE_CACHE_TTL: int = int(os.getenv("NEGATIVE_CACHE_TTL", 30))
+    # Cached urls live CACHE_TTL_MIN seconds, longer the more they were clicked
+    # (with the square root of total_clicks) up to CACHE_TTL_MAX. Aliases read
+    # close to their expiry are reloaded early by one request (XFetch), a
+    # CACHE_XFETCH_BETA above 1 reloads earlier
+    CACHE_TTL_MIN: int = int(os.getenv("CACHE_TTL_MIN", 3600))
+    CACHE_TTL_MAX: int = int(os.getenv("CACHE_TTL_MAX", 7 * 86400))
+    CACHE_XFETCH_BETA: float = float(os.getenv("CACHE_XFETCH_BETA", 1.0))
+    # On a cache miss one worker fills the cache under a short lock,
+    # the others wait up to CACHE_FILL_WAIT_MS for it before hitting the db
+    CACHE_FILL_LOCK_TTL_MS: int = int(os.getenv("CACHE_FILL_LOCK_TTL_MS", 500))
+    CACHE_FILL_WAIT_MS: int = int(os.getenv("CACHE_FILL_WAIT_MS", 200))
+    # Cache warming at startup and after a Redis restart, 0 and 0 disables it
+    WARM_TOP_N: int = int(os.getenv("WARM_TOP_N", 10000))
+    WARM_RECENT_N: int = int(os.getenv("WARM_RECENT_N", 10000))
+    WARM_BATCH_SIZE: int = int(os.getenv("WARM_BATCH_SIZE", 1000))
+    WARM_CHECK_INTERVAL: int = int(os.getenv("WARM_CHECK_INTERVAL", 30))
+    # Expired links answer 410 Gone for EXPIRED_URLS_RETENTION seconds, then
+    # they are deleted every PURGE_INTERVAL seconds (0 disables the purge),
+    # PURGE_BATCH_SIZE rows per transaction, giving up on a batch when its
+    # row locks aren't granted within PURGE_LOCK_TIMEOUT (Postgres)
+    EXPIRED_URLS_RETENTION: int = int(os.getenv("EXPIRED_URLS_RETENTION", 7 * 24 * 3600))
+    PURGE_INTERVAL: int = int(os.getenv("PURGE_INTERVAL", 300))
+    PURGE_BATCH_SIZE: int = int(os.getenv("PURGE_BATCH_SIZE", 1000))
+    PURGE_LOCK_TIMEOUT: str = os.getenv("PURGE_LOCK_TIMEOUT", "2s")
+    # Bloom filter of existing aliases: "memory", "redis" or "off"
+    BLOOM_BACKEND: str = os.getenv("BLOOM_BACKEND", "memory")
+    BLOOM_CAPACITY: int = int(os.getenv("BLOOM_CAPACITY", 10_000_000))
+    BLOOM_ERROR_RATE: float = float(os.getenv("BLOOM_ERROR_RATE", 0.01))
 
     # Postgres
     POSTGRES_HOST: str = os.getenv("POSTGRES_HOST", "postgres")
@@ -28,6 +77,45 @@ class EnvSettings(BaseSettings):
         "DATABASE_URL",
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
+    # Async engine used by the API. When empty it is derived from DATABASE_URL
+    # by swapping the driver (postgresql -> postgresql+asyncpg).
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    # Optional read replicas, comma separated urls. Lookups, stats and cache
+    # warming read from them ("round_robin" or "least_connections"), a failing
+    # replica is skipped for DB_REPLICA_RETRY_AFTER seconds. Aliases written or
+    # invalidated in the last DB_REPLICA_MAX_LAG seconds are read from the primary
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    DB_REPLICA_POLICY: str = os.getenv("DB_REPLICA_POLICY", "round_robin")
+    DB_REPLICA_RETRY_AFTER: int = int(os.getenv("DB_REPLICA_RETRY_AFTER", 30))
+    DB_REPLICA_MAX_LAG: int = int(os.getenv("DB_REPLICA_MAX_LAG", 5))
+    # Hash partitions of the urls table (Postgres), used by the migration
+    # creating them. A power of two lets partitions be split evenly later
+    URLS_PARTITIONS: int = int(os.getenv("URLS_PARTITIONS", 16))
+    # Connections opened at startup, so the first requests don't pay for them
+    DB_POOL_PREWARM: int = int(os.getenv("DB_POOL_PREWARM", 2))
+    REDIS_POOL_PREWARM: int = int(os.getenv("REDIS_POOL_PREWARM", 2))
+
+    # Clicks are buffered per worker and flushed every interval (seconds)
+    # or as soon as this many distinct aliases are pending
+    CLICK_FLUSH_INTERVAL: float = float(os.getenv("CLICK_FLUSH_INTERVAL", 5))
+    CLICK_FLUSH_THRESHOLD: int = int(os.getenv("CLICK_FLUSH_THRESHOLD", 1000))
+    # Per click events (referrer, user agent, country) appended to a Redis
+    # Stream, or to segment files in CLICK_SPOOL_DIR while Redis is down
+    CLICK_EVENTS_ENABLED: bool = bool(int(os.getenv("CLICK_EVENTS_ENABLED", 1)))
+    CLICK_STREAM_KEY: str = os.getenv("CLICK_STREAM_KEY", "miniurl:clicks")
+    CLICK_STREAM_MAXLEN: int = int(os.getenv("CLICK_STREAM_MAXLEN", 1_000_000))
+    CLICK_EVENTS_FLUSH_INTERVAL: float = float(os.getenv("CLICK_EVENTS_FLUSH_INTERVAL", 0.5))
+    CLICK_SPOOL_DIR: str = os.getenv("CLICK_SPOOL_DIR", "spool/clicks")
+    CLICK_SPOOL_SEGMENT_SIZE: int = int(os.getenv("CLICK_SPOOL_SEGMENT_SIZE", 16 * 1024 * 1024))
+    # Header set by the CDN / proxy with the visitor's country code
+    CLICK_COUNTRY_HEADER: str = os.getenv("CLICK_COUNTRY_HEADER", "cf-ipcountry")
+    # Consumer group worker: python -m app.databases.click_events
+    CLICK_AGGREGATOR_GROUP: str = os.getenv("CLICK_AGGREGATOR_GROUP", "click-aggregators")
+    CLICK_AGGREGATOR_BATCH: int = int(os.getenv("CLICK_AGGREGATOR_BATCH", 1000))
 
     # CRITICAL = 50
     # FATAL = CRITICAL
@@ -38,8 +126,48 @@ class EnvSettings(BaseSettings):
     LOG_LEVEL : int = int(os.getenv("LOG_LEVEL", 30))
     SQL_LOG_LEVEL : int = int(os.getenv("SQL_LOG_LEVEL", 30))
 
+    # How aliases are generated: "random" or "sequence" (Postgres
+    # sequence reserved in blocks per worker, needs the urls_alias_seq migration)
+    ALIAS_ALLOCATOR: str = os.getenv("ALIAS_ALLOCATOR", "random")
+    ALIAS_LENGTH: int = int(os.getenv("ALIAS_LENGTH", 6))
+    ALIAS_BLOCK_SIZE: int = int(os.getenv("ALIAS_BLOCK_SIZE", 1000))
+    # Makes sequence aliases non guessable. Up to 64 chars, never change it
+    # once aliases have been handed out. Empty disables scrambling
+    ALIAS_SCRAMBLE_KEY: str = os.getenv("ALIAS_SCRAMBLE_KEY", "")
+    ALIAS_SCRAMBLE_BITS: int = int(os.getenv("ALIAS_SCRAMBLE_BITS", 34))
+
+    # GET /api/v1.0/{alias}/stats: longest window and how long responses are cached
+    STATS_MAX_DAYS: int = int(os.getenv("STATS_MAX_DAYS", 366))
+    STATS_MAX_HOURLY_DAYS: int = int(os.getenv("STATS_MAX_HOURLY_DAYS", 7))
+    STATS_CACHE_TTL: int = int(os.getenv("STATS_CACHE_TTL", 60))
+
+    # Rate limits are enforced in Redis for the whole fleet. Keys refused by
+    # Redis are remembered per worker (up to this many) until they may retry
+    RATE_LIMIT_ENABLED: bool = bool(int(os.getenv("RATE_LIMIT_ENABLED", 1)))
+    RATE_LIMIT_LOCAL_SIZE: int = int(os.getenv("RATE_LIMIT_LOCAL_SIZE", 10000))
+    # GET /{alias} answered by a pure ASGI middleware, skipping FastAPI's
+    # routing and validation. Same responses, set to 0 to use the route
+    FAST_REDIRECT: bool = bool(int(os.getenv("FAST_REDIRECT", 1)))
+
+    # Max number of urls accepted by POST /api/v1.0/minify/batch
+    MINIFY_BATCH_MAX: int = int(os.getenv("MINIFY_BATCH_MAX", 10000))
+
+    # Production server (python -m app.server). WEB_CONCURRENCY=0 sizes the
+    # workers from the CPUs available to the container
+    BIND: str = os.getenv("BIND", "0.0.0.0:8000")
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", 0))
+    KEEPALIVE: int = int(os.getenv("KEEPALIVE", 5))
+    BACKLOG: int = int(os.getenv("BACKLOG", 2048))
+    WORKER_TIMEOUT: int = int(os.getenv("WORKER_TIMEOUT", 60))
+    # On shutdown in-flight requests get DRAIN_TIMEOUT seconds, the rest of
+    # GRACEFUL_TIMEOUT is left for flushing the click buffers
+    DRAIN_TIMEOUT: int = int(os.getenv("DRAIN_TIMEOUT", 20))
+    GRACEFUL_TIMEOUT: int = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+    MAX_REQUESTS: int = int(os.getenv("MAX_REQUESTS", 0))
+
     DB_NAME: str = os.getenv("DB_NAME", "miniurl.db")
     APP_API_TOKEN: str = os.getenv("APP_API_TOKEN", secrets.token_urlsafe(32))
-    ADMIN_URL: str = os.getenv("ADMIN_URL", secrets.token_urlsafe(32))
+    # Path the admin panel is mounted on (e.g. "/some-secret-path"), empty disables it
+    ADMIN_URL: str = os.getenv("ADMIN_URL", "")
 
 settings = EnvSettings()
@@ -0,0 +1,88 @@
+import logging
+from functools import lru_cache
+
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+from starlette.routing import Mount
+
+try:
+    from fastapi.routing import iter_route_contexts
+except ImportError:
+    # FastAPI before lazily included routers, app.routes is already flat
+    from types import SimpleNamespace
+
+    def iter_route_contexts(routes):
+        for route in routes:
+            yield SimpleNamespace(route=route, path=route.path, endpoint=getattr(route, "endpoint", None))
+
+from app.core.rate_limit import RateLimitExceeded, limiter
+from app.errors.api_errors import Gone, NotFound
+from app.router import resolve_redirect, resolve_url
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=10000)
+def redirect_headers(url: str) -> list:
+    """Raw headers of the 301 to url, exactly those of resolve_url's RedirectResponse"""
+    return RedirectResponse(url=url, status_code=301).raw_headers
+
+
+def reserved_paths(app) -> set:
+    """Single segment paths routed before /{alias}, to a route or a mount"""
+    paths = set()
+    for route in iter_route_contexts(app.routes):
+        if route.endpoint is resolve_url:
+            break
+        if isinstance(route.route, Mount) or ("{" not in route.path and route.path.count("/") == 1):
+            paths.add(route.path)
+    return paths
+
+
+class FastRedirectMiddleware:
+    """
+    Pure ASGI middleware answering GET /{alias} without FastAPI's routing,
+    parameter validation and response objects. Same rate limit, cache tiers,
+    click counting and responses as app.router.resolve_url, with the 301
+    headers built once per url. Every other request goes to the app.
+    """
+
+    enabled = True
+
+    def __init__(self, app):
+        self.app = app
+        self.reserved = None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        alias = scope["path"][1:]
+        if not alias or "/" in alias:
+            return await self.app(scope, receive, send)
+        if self.reserved is None:
+            self.reserved = reserved_paths(scope["app"])
+        if scope["path"] in self.reserved:
+            return await self.app(scope, receive, send)
+
+        # What routing would have set, MetricsMiddleware labels requests with it
+        scope["endpoint"] = resolve_url
+        scope["path_params"] = {"alias": alias}
+        request = Request(scope, receive)
+        try:
+            await limiter.check(request, *resolve_url.rate_limit)
+            original_url = await resolve_redirect(request, alias)
+        except (RateLimitExceeded, NotFound, Gone) as exc:
+            response = await handle_exception(scope["app"], request, exc)
+            return await response(scope, receive, send)
+
+        await send({"type": "http.response.start", "status": 301, "headers": redirect_headers(original_url)})
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def handle_exception(app, request: Request, exc: Exception):
+    """The response of the app's own handler for exc"""
+    for cls in type(exc).__mro__:
+        handler = app.exception_handlers.get(cls)
+        if handler is not None:
+            return await handler(request, exc)
+    raise exc
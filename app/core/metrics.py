@@ -0,0 +1,186 @@
+import logging
+from bisect import bisect_left
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from sub-millisecond cache hits to slow db queries
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REGISTRY = []
+
+
+def _format_labels(labelnames, labelvalues, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter, optionally labelled.
+    Increments are a dict lookup and an addition, cheap enough for the hot path.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for labelvalues, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, optionally labelled"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labelvalues):
+        series = self._values.get(labelvalues)
+        if series is None:
+            # One slot per bucket plus +Inf, then the sum
+            series = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labelvalues, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{bound}"')
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, series[-1]
+
+
+class CallbackMetric:
+    """
+    Metric whose values are read at scrape time, for state that is already
+    tracked elsewhere (pool usage, cache counters), so it costs nothing
+    outside of a scrape. The callback returns {labelvalues tuple: value}.
+    """
+
+    def __init__(self, name: str, documentation: str, type: str, callback, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.callback = callback
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    def samples(self):
+        for labelvalues, value in self.callback().items():
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        try:
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        except Exception as e:
+            logger.error(f"Failed to collect metric {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+CACHE_REQUESTS = Counter(
+    "miniurl_cache_requests_total",
+    "Alias lookups per cache tier and result",
+    labelnames=("tier", "result"),
+)
+DB_QUERY_DURATION = Histogram(
+    "miniurl_db_query_duration_seconds",
+    "Duration of the queries run by the async engine",
+)
+RATE_LIMITED = Counter(
+    "miniurl_rate_limited_total",
+    "Requests rejected by the rate limiter",
+)
+REQUEST_DURATION = Histogram(
+    "miniurl_request_duration_seconds",
+    "Duration of HTTP requests per route",
+    labelnames=("method", "route", "status"),
+)
+
+
+def instrument_engine(engine):
+    """Time every query of a (sync or async) SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.observe(perf_counter() - context._query_started)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording the duration of every HTTP request,
+    labelled with the route template so aliases don't explode cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.observe(perf_counter() - started, scope["method"], route_template(scope), status)
+
+
+def route_template(scope) -> str:
+    """
+    Path of the matched route with its parameters put back,
+    e.g. /api/v1.0/abc123 -> /api/v1.0/{alias}
+    """
+    if "endpoint" not in scope:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        head, sep, tail = path.rpartition(f"/{value}")
+        if sep:
+            path = f"{head}/{{{name}}}{tail}"
+    return path
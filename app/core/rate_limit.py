@@ -1,15 +1,157 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import functools
+import logging
+import math
+import re
+from time import monotonic
 
-limiter = Limiter(key_func=get_remote_address, enabled=True)
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.metrics import RATE_LIMITED
+from app.databases.local_cache import LocalCache
+from app.databases.redis import redis_cache
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# GCRA: the key holds the theoretical arrival time (TAT) of the next request.
+# A limit of N per period allows bursts of N and then one request every
+# period / N. Redis' clock is used so every worker and node agrees on "now".
+# Returns {allowed, retry after ms when denied / remaining when allowed}
+GCRA_SCRIPT = """
+local emission = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+local new_tat = tat + emission
+local allow_at = new_tat - period
+if allow_at > now then
+    return {0, math.ceil(allow_at - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil(new_tat - now))
+return {1, math.floor((now - allow_at) / emission)}
+"""
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, rate: str, retry_after: float):
+        self.rate = rate
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit exceeded: {rate}")
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate: str) -> tuple[int, int]:
+    """'60/minute' -> (60, 60), '100/5 minutes' -> (100, 300)"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*", rate)
+    if not match:
+        raise ValueError(f"Invalid rate limit: {rate}")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def get_remote_address(request: Request) -> str:
+    return request.client.host if request.client else "127.0.0.1"
+
+
+class RateLimiter:
+    """
+    Rate limits shared by every worker and node, one Lua script (a single
+    round trip) per check.
+
+    Keys that Redis refused are remembered per worker until they may retry,
+    so a client hammering a limited route is turned away without touching
+    Redis. When Redis is unreachable requests are let through.
+    """
+
+    def __init__(self, key_func=get_remote_address, enabled: bool = True, local_size: int = 10000,
+                 prefix: str = "ratelimit"):
+        self.key_func = key_func
+        self.enabled = enabled
+        self.prefix = prefix
+        # Refused keys until they may retry, the values are that time
+        self._blocked = LocalCache(maxsize=local_size, ttl=PERIODS["day"])
+        self._script = None
+        self._error_logged_at = 0
+
+    async def hit(self, key: str, count: int, period: int) -> tuple[bool, float]:
+        """Count a request, returns (allowed, seconds to wait when refused)"""
+        blocked_until = self._blocked.get(key)
+        if blocked_until is not None:
+            return False, max(0, blocked_until - monotonic())
+
+        if self._script is None:
+            self._script = redis_cache.register_script(GCRA_SCRIPT)
+        try:
+            allowed, value = await self._script(keys=[key], args=[period * 1000 / count, period * 1000])
+        except Exception as e:
+            if monotonic() - self._error_logged_at > 10:
+                self._error_logged_at = monotonic()
+                logger.error(f"Rate limiter unavailable, letting requests through: {e}")
+            return True, 0
+        if allowed:
+            return True, 0
+        retry_after = int(value) / 1000
+        self._blocked.set(key, monotonic() + retry_after, ttl=retry_after)
+        return False, retry_after
+
+    async def check(self, request: Request, scope: str, rate: str):
+        """Count a request against the `rate` of scope, raises RateLimitExceeded when refused"""
+        if not self.enabled:
+            return
+        count, period = parse_rate(rate)
+        allowed, retry_after = await self.hit(f"{self.prefix}:{scope}:{self.key_func(request)}", count, period)
+        if not allowed:
+            raise RateLimitExceeded(rate, retry_after)
+
+    def limit(self, rate: str):
+        """
+        Decorator for endpoints taking a `request: Request` argument.
+        The (scope, rate) pair is kept as the endpoint's `rate_limit`, for
+        checks made outside of FastAPI.
+        """
+        parse_rate(rate)
+
+        def decorator(func):
+            scope = f"{func.__module__}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if self.enabled:
+                    request = kwargs.get("request") or next(a for a in args if isinstance(a, Request))
+                    await self.check(request, scope, rate)
+                return await func(*args, **kwargs)
+
+            wrapper.rate_limit = (scope, rate)
+            return wrapper
+
+        return decorator
+
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    RATE_LIMITED.inc()
+    return JSONResponse(
+        {"error": str(exc)},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+limiter = RateLimiter(enabled=settings.RATE_LIMIT_ENABLED, local_size=settings.RATE_LIMIT_LOCAL_SIZE)
 
 rate_limit_response = {
     429: {
         "description": "Too Many Requests - rate limit exceeded",
         "content": {
             "application/json": {
-                "example": {"error": "Rate limit exceeded: 10 per 1 minute"}
+                "example": {"error": "Rate limit exceeded: 10/minute"}
             }
         },
     }
-}
\ No newline at end of file
+}
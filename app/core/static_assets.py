@@ -0,0 +1,143 @@
+"""
+Front end assets served from memory.
+
+Every file is read once at startup, fingerprinted and compressed with
+gzip (and brotli when installed). Assets get a content hashed url,
+e.g. /static/css/styles.1a2b3c4d5e6f.css, cached by browsers for a year;
+index.html points at those urls and is revalidated with its ETag.
+"""
+import copy
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+from pathlib import Path
+
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Hashed urls never change content
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Stable urls (index.html, unhashed assets) are checked on every use, a 304 when unchanged
+REVALIDATE = "no-cache"
+
+
+class Asset:
+    """One file: its encodings, best first, and their ETags"""
+
+    def __init__(self, content: bytes, media_type: str, cache_control: str):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        self.encodings = {}
+        if brotli is not None:
+            self.add_encoding("br", brotli.compress(content, quality=11), content)
+        self.add_encoding("gzip", gzip.compress(content, compresslevel=9, mtime=0), content)
+        self.encodings["identity"] = content
+        self.etags = {f'"{self.digest}-{encoding}"' for encoding in self.encodings}
+
+    def add_encoding(self, name: str, compressed: bytes, content: bytes):
+        # Tiny files can grow when compressed
+        if len(compressed) < len(content):
+            self.encodings[name] = compressed
+
+    def response(self, request: Request) -> Response:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), self.encodings)
+        etag = f'"{self.digest}-{encoding}"'
+        headers = {"etag": etag, "cache-control": self.cache_control, "vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or self.etags & parse_etags(if_none_match)):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+        body = self.encodings[encoding]
+        if request.method == "HEAD":
+            headers["content-length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+def parse_etags(header: str) -> set:
+    # If-None-Match compares weakly, W/"x" matches "x"
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def negotiate_encoding(accept_encoding: str, available) -> str:
+    """br, then gzip, when accepted with a non zero q, else identity"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip())
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    """
+    ASGI app serving the files under static_dir, mounted at `prefix`, by
+    their stable and hashed paths. index_file is served by `index_response`
+    with its asset references rewritten to the hashed urls.
+    """
+
+    def __init__(self, static_dir, index_file=None, prefix: str = "/static"):
+        self.prefix = prefix
+        self.assets = {}
+        self.urls = {}
+        for path in sorted(Path(static_dir).rglob("*")):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            relative = path.relative_to(static_dir).as_posix()
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            self.assets[f"/{relative}"] = asset = Asset(path.read_bytes(), media_type, REVALIDATE)
+            # Same encodings, cached for good
+            hashed = copy.copy(asset)
+            hashed.cache_control = IMMUTABLE
+            stem, dot, suffix = relative.rpartition(".")
+            hashed_path = f"/{stem}.{hashed.digest}.{suffix}" if dot else f"/{relative}.{hashed.digest}"
+            self.assets[hashed_path] = hashed
+            self.urls[relative] = f"{prefix}{hashed_path}"
+
+        self.index = None
+        if index_file is not None:
+            html = Path(index_file).read_text()
+            for relative, url in self.urls.items():
+                # Relative (../static/x) or absolute (/static/x) references
+                reference = rf"""(?:\.\./|/){re.escape(prefix.strip("/"))}/{re.escape(relative)}(?=["'])"""
+                html = re.sub(reference, url, html)
+            self.index = Asset(html.encode(), "text/html; charset=utf-8", REVALIDATE)
+        logger.info(f"Loaded {len(self.urls)} static assets")
+
+    def url_for(self, relative: str) -> str:
+        """Hashed url of a file, e.g. css/styles.css"""
+        return self.urls[relative]
+
+    def index_response(self, request: Request) -> Response:
+        return self.index.response(request)
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if request.method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+        else:
+            asset = self.assets.get(scope["path"].removeprefix(scope.get("root_path", "")))
+            if asset is None:
+                raise HTTPException(status_code=404)
+            response = asset.response(request)
+        await response(scope, receive, send)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from collections import deque
+
+from sqlalchemy.exc import ProgrammingError
+
+from app.core.config import settings
+from app.databases.general import DBActions
+from app.utils.generators import encode_base62, get_random_url_string, scramble_id
+
+logger = logging.getLogger(__name__)
+
+# Postgres undefined_table, raised for a missing sequence too
+UNDEFINED_TABLE = "42P01"
+
+
+class RandomAliasAllocator:
+    """
+    Random aliases. Collisions are only detected when inserting,
+    so callers have to retry with a new alias on conflict.
+    """
+
+    def __init__(self, length: int):
+        self.length = length
+
+    async def allocate(self) -> str:
+        return get_random_url_string(self.length)
+
+    async def allocate_many(self, count: int) -> list[str]:
+        return [get_random_url_string(self.length) for _ in range(count)]
+
+
+class SequenceAliasAllocator:
+    """
+    Aliases built from a Postgres sequence, base62 encoded.
+
+    Every worker reserves ids in blocks, so most allocations cost no round
+    trip at all, and ids never repeat so there is nothing to check. With a
+    scramble key the ids go through a keyed permutation first, which makes
+    consecutive aliases non guessable. The key must never change once
+    aliases have been handed out.
+
+    Without the sequence (not Postgres, or the urls_alias_seq migration not
+    applied) it hands out random aliases instead, like RandomAliasAllocator.
+    """
+
+    def __init__(self, block_size: int, min_length: int, scramble_key: str = "", scramble_bits: int = 34):
+        self.block_size = block_size
+        self.min_length = min_length
+        self.scramble_key = scramble_key
+        self.scramble_bits = scramble_bits
+        self._ids = deque()
+        self._lock = asyncio.Lock()
+        # Set once the sequence turned out to be missing
+        self.fallback = None
+
+    def encode(self, number: int) -> str:
+        if self.scramble_key:
+            number = scramble_id(number, self.scramble_key, bits=self.scramble_bits)
+        return encode_base62(number, self.min_length)
+
+    async def allocate(self) -> str:
+        return (await self.allocate_many(1))[0]
+
+    async def allocate_many(self, count: int) -> list[str]:
+        async with self._lock:
+            if self.fallback is None and len(self._ids) < count:
+                reserve = max(self.block_size, count - len(self._ids))
+                try:
+                    self._ids.extend(await self.reserve(reserve))
+                    logger.debug(f"Reserved {reserve} alias ids")
+                except LookupError as e:
+                    logger.warning(f"No alias sequence ({e}), allocating random aliases instead")
+                    self.fallback = RandomAliasAllocator(self.min_length)
+            if self.fallback is not None:
+                return await self.fallback.allocate_many(count)
+            return [self.encode(self._ids.popleft()) for _ in range(count)]
+
+    async def reserve(self, count: int) -> list[int]:
+        """`count` ids of the sequence, LookupError when there is no sequence"""
+        actions = DBActions()
+        if actions.db_session.dialect.name != "postgresql":
+            raise LookupError(f"{actions.db_session.dialect.name} has no sequences")
+        try:
+            return await actions.reserve_alias_ids(count)
+        except ProgrammingError as exc:
+            if getattr(exc.orig, "sqlstate", None) == UNDEFINED_TABLE:
+                raise LookupError("urls_alias_seq doesn't exist") from exc
+            raise
+
+
+def setup_alias_allocator(mode: str):
+    if mode == "sequence":
+        return SequenceAliasAllocator(
+            block_size=settings.ALIAS_BLOCK_SIZE,
+            min_length=settings.ALIAS_LENGTH,
+            scramble_key=settings.ALIAS_SCRAMBLE_KEY,
+            scramble_bits=settings.ALIAS_SCRAMBLE_BITS,
+        )
+    if mode == "random":
+        return RandomAliasAllocator(length=settings.ALIAS_LENGTH)
+    raise ValueError(f"Unknown alias allocator: {mode}")
+
+
+alias_allocator = setup_alias_allocator(settings.ALIAS_ALLOCATOR)
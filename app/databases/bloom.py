@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+from hashlib import blake2b
+from typing import Iterable
+
+from app.core.config import settings
+from app.databases.redis import redis_cache
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    In-memory Bloom filter of every existing alias.
+
+    A negative answer is definitive, so unknown aliases can be rejected
+    without touching Redis or the db. Until the filter has been built
+    it answers "maybe" for everything.
+    """
+    # Whether every worker sees the same filter
+    shared = False
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.ready = False
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> list[int]:
+        # Kirsch-Mitzenmacher: k positions out of two 64bit hashes
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def _warn_if_full(self):
+        if self.count == self.capacity + 1:
+            logger.warning(
+                f"Bloom filter holds more than {self.capacity} aliases, "
+                f"increase BLOOM_CAPACITY to keep the false positive rate"
+            )
+
+    async def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        self._warn_if_full()
+
+    async def add_many(self, keys: Iterable[str]):
+        for key in keys:
+            await self.add(key)
+
+    async def might_contain(self, key: str) -> bool:
+        if not self.ready:
+            return True
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    async def is_built(self) -> bool:
+        return self.ready
+
+    async def mark_built(self):
+        self.ready = True
+
+
+class RedisBloomFilter(BloomFilter):
+    """
+    Same filter kept in a Redis bitmap, shared by every worker and node.
+    Costs one pipelined round trip per check instead of none.
+    """
+    shared = True
+
+    def __init__(self, capacity: int, error_rate: float, key: str = "bloom:aliases"):
+        super().__init__(capacity, error_rate)
+        self._bits = None
+        self.key = key
+        self.ready_key = f"{key}:ready"
+
+    async def add(self, key: str):
+        await self.add_many([key])
+
+    async def add_many(self, keys: Iterable[str]):
+        pipe = redis_cache.pipeline(transaction=False)
+        for key in keys:
+            for position in self._positions(key):
+                pipe.setbit(self.key, position, 1)
+        await pipe.execute()
+
+    async def might_contain(self, key: str) -> bool:
+        pipe = redis_cache.pipeline(transaction=False)
+        pipe.exists(self.ready_key)
+        for position in self._positions(key):
+            pipe.getbit(self.key, position)
+        try:
+            ready, *bits = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to check Bloom filter in Redis: {e}")
+            return True
+        return not ready or all(bits)
+
+    async def is_built(self) -> bool:
+        return bool(await redis_cache.exists(self.ready_key))
+
+    async def mark_built(self):
+        await redis_cache.set(self.ready_key, 1)
+
+
+def setup_bloom_filter(backend: str):
+    if backend == "redis":
+        return RedisBloomFilter(settings.BLOOM_CAPACITY, settings.BLOOM_ERROR_RATE)
+    if backend == "memory":
+        return BloomFilter(settings.BLOOM_CAPACITY, settings.BLOOM_ERROR_RATE)
+    return None
+
+
+alias_filter = setup_bloom_filter(settings.BLOOM_BACKEND)
+
+
+async def build_alias_filter(batch_size: int = 10000):
+    """Load every alias of the urls table into the filter"""
+    from app.databases.general import DBActions
+
+    loaded = 0
+    async for aliases in DBActions().iter_aliases(batch_size=batch_size):
+        await alias_filter.add_many(aliases)
+        loaded += len(aliases)
+    await alias_filter.mark_built()
+    logger.info(f"Bloom filter built with {loaded} aliases")
+    return loaded
+
+
+async def maintain_alias_filter(subscribed: asyncio.Event, check_interval: float = 5):
+    """
+    Long running task that (re)builds the filter whenever it is not ready.
+
+    A worker-local filter only learns about aliases added elsewhere through
+    the alias events, so it is built once the subscription is up and again
+    after every reconnect. The Redis backend is lost whenever Redis
+    restarts and is rebuilt by a single worker.
+    """
+    if alias_filter is None:
+        return
+    while True:
+        try:
+            if alias_filter.shared:
+                lock_key = f"{alias_filter.key}:lock"
+                if not await alias_filter.is_built() and await redis_cache.set(lock_key, 1, nx=True, ex=600):
+                    try:
+                        await build_alias_filter()
+                    finally:
+                        await redis_cache.delete(lock_key)
+            else:
+                await subscribed.wait()
+                if not alias_filter.ready:
+                    await build_alias_filter()
+                    if not subscribed.is_set():
+                        # Events may have been missed while building
+                        alias_filter.ready = False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to build Bloom filter: {e}")
+        await asyncio.sleep(check_interval)
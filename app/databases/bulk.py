@@ -0,0 +1,336 @@
+"""
+Bulk import and export of urls, streamed in chunks so memory stays flat
+however large the file:
+
+    python -m app.databases.bulk import links.csv --warm --report report.csv
+    python -m app.databases.bulk export urls.jsonl
+
+CSV files start with a header row, JSONL files hold one object per line.
+The fields are alias, original_url (or url), description, created_at,
+total_clicks and expires_at, only the url is required and missing aliases
+are generated.
+On Postgres every chunk is COPYed into a temporary table and moved into
+urls with one INSERT ... ON CONFLICT (alias) DO NOTHING. Aliases that
+already exist are left untouched and reported as conflicts.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import logging.config
+import re
+import sys
+from contextlib import asynccontextmanager, nullcontext
+from datetime import UTC, datetime
+from itertools import islice
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("alias", "original_url", "description", "created_at", "total_clicks", "expires_at")
+# A single path segment
+ALIAS_PATTERN = re.compile(r"[^/\s?#]{1,255}")
+# Invalid lines logged one by one, the rest are only counted
+MAX_LOGGED_INVALID = 20
+
+CREATE_STAGING_TABLE = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS urls_import (
+        alias VARCHAR, original_url VARCHAR, description VARCHAR,
+        created_at TIMESTAMP WITHOUT TIME ZONE, total_clicks INTEGER, expires_at TIMESTAMP WITHOUT TIME ZONE
+    ) ON COMMIT DELETE ROWS
+"""
+INSERT_FROM_STAGING_TABLE = """
+    INSERT INTO urls (alias, original_url, description, created_at, total_clicks, expires_at)
+    SELECT alias, original_url, description, created_at, total_clicks, expires_at FROM urls_import
+    ON CONFLICT (alias) DO NOTHING
+    RETURNING alias
+"""
+
+
+def detect_format(path: str, fmt: str = None) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_records(stream, fmt: str):
+    """(line number, record) of every input record, None for lines that aren't a JSON object"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def parse_timestamp(value):
+    """Naive UTC datetime of an ISO 8601 string, None for an empty one"""
+    if not value:
+        return None
+    value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+
+def clean_record(record) -> dict | None:
+    """The urls row of an input record, None when it isn't valid"""
+    if record is None:
+        return None
+    url = str(record.get("original_url") or record.get("url") or "").rstrip("/").strip()
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    alias = str(record.get("alias") or "").strip() or None
+    if alias is not None and not ALIAS_PATTERN.fullmatch(alias):
+        return None
+    description = record.get("description") or None
+    if description is not None and len(description) > 255:
+        return None
+    try:
+        # Naive UTC like every timestamp column
+        created_at = parse_timestamp(record.get("created_at")) or datetime.now(UTC).replace(tzinfo=None)
+        # Already expired links are imported too, they answer 410 until purged
+        expires_at = parse_timestamp(record.get("expires_at"))
+        total_clicks = int(record.get("total_clicks") or 0)
+    except (TypeError, ValueError):
+        return None
+    if total_clicks < 0:
+        return None
+    return {
+        "alias": alias,
+        "original_url": url,
+        "description": description,
+        "created_at": created_at,
+        "total_clicks": total_clicks,
+        "expires_at": expires_at,
+    }
+
+
+class BulkImporter:
+    """
+    Writes chunks of cleaned rows to urls, returns the aliases inserted.
+    COPY through a staging table on Postgres, multi-row inserts elsewhere.
+    """
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.engine = actions.db_session
+        self.connection = None
+
+    @asynccontextmanager
+    async def connect(self):
+        if self.engine.dialect.name != "postgresql":
+            yield self
+            return
+        async with self.engine.connect() as connection:
+            self.connection = (await connection.get_raw_connection()).driver_connection
+            await self.connection.execute(CREATE_STAGING_TABLE)
+            try:
+                yield self
+            finally:
+                self.connection = None
+
+    async def insert(self, rows: list[dict]) -> set[str]:
+        from app.databases.general import register_aliases
+
+        if self.connection is None:
+            return await self.actions.add_urls(rows)
+        # The staging table empties itself on commit
+        async with self.connection.transaction():
+            await self.connection.copy_records_to_table(
+                "urls_import", records=[tuple(row[field] for field in FIELDS) for row in rows], columns=FIELDS
+            )
+            inserted = {record["alias"] for record in await self.connection.fetch(INSERT_FROM_STAGING_TABLE)}
+        await register_aliases(list(inserted))
+        return inserted
+
+
+async def import_urls(records, chunk_size: int, warm: bool = False, report=None, warm_batch: int = 10000) -> dict:
+    """
+    Import (line number, record) pairs chunk by chunk. Rows that weren't
+    imported as given (invalid, conflicting alias, generated alias) are
+    written to the `report` csv writer.
+    """
+    from app.databases.allocators import alias_allocator
+    from app.databases.general import DBActions
+    from app.databases.redis import save_many_to_cache
+
+    stats = {"read": 0, "inserted": 0, "conflicts": 0, "invalid": 0}
+    started = perf_counter()
+    records = iter(records)
+    importer = BulkImporter(DBActions())
+    async with importer.connect():
+        while chunk := list(islice(records, chunk_size)):
+            stats["read"] += len(chunk)
+            # Valid rows, their line numbers, the indexes of rows without an alias
+            rows, numbers, generated = [], [], set()
+            taken = set()
+            for number, record in chunk:
+                row = clean_record(record)
+                if row is None:
+                    stats["invalid"] += 1
+                    if stats["invalid"] <= MAX_LOGGED_INVALID:
+                        logger.warning(f"Skipping invalid record on line {number}")
+                    if report:
+                        report.writerow([number, "", "", "invalid"])
+                    continue
+                if row["alias"] in taken:
+                    # Repeated in this chunk, the first one wins
+                    stats["conflicts"] += 1
+                    if report:
+                        report.writerow([number, row["alias"], row["original_url"], "conflict"])
+                    continue
+                if row["alias"] is None:
+                    generated.add(len(rows))
+                else:
+                    taken.add(row["alias"])
+                rows.append(row)
+                numbers.append(number)
+
+            inserted = set()
+            pending = rows
+            for attempt in range(3):
+                unnamed = [row for row in pending if row["alias"] is None]
+                for row, alias in zip(unnamed, await alias_allocator.allocate_many(len(unnamed))):
+                    while alias in taken:
+                        alias = await alias_allocator.allocate()
+                    row["alias"] = alias
+                    taken.add(alias)
+                inserted |= await importer.insert(pending)
+                # Generated aliases may be taken already, those get fresh ones
+                pending = [rows[index] for index in generated if rows[index]["alias"] not in inserted]
+                if not pending or attempt == 2:
+                    break
+                for row in pending:
+                    row["alias"] = None
+
+            stats["inserted"] += len(inserted)
+            for index, row in enumerate(rows):
+                if row["alias"] not in inserted:
+                    stats["conflicts"] += 1
+                    status = "conflict"
+                elif index in generated:
+                    status = "generated"
+                else:
+                    continue
+                if report:
+                    report.writerow([numbers[index], row["alias"], row["original_url"], status])
+
+            if warm and inserted:
+                warmed = [row for row in rows if row["alias"] in inserted]
+                for start in range(0, len(warmed), warm_batch):
+                    batch = warmed[start:start + warm_batch]
+                    await save_many_to_cache(
+                        {row["alias"]: row["original_url"] for row in batch},
+                        expires_at={row["alias"]: row["expires_at"] for row in batch if row["expires_at"]},
+                    )
+
+            elapsed = perf_counter() - started
+            logger.info(
+                f"Read {stats['read']} records, inserted {stats['inserted']}, "
+                f"{stats['conflicts']} conflicts, {stats['invalid']} invalid, {stats['read'] / elapsed:.0f} records/s"
+            )
+    stats["seconds"] = round(perf_counter() - started, 3)
+    return stats
+
+
+async def export_urls(stream, fmt: str, chunk_size: int) -> int:
+    """Write every url to stream, returns how many"""
+    from app.databases.general import DBActions
+    from app.databases.models import Urls
+
+    engine = DBActions().db_session
+    if fmt == "csv" and engine.dialect.name == "postgresql":
+        async with engine.connect() as connection:
+            raw = (await connection.get_raw_connection()).driver_connection
+            result = await raw.copy_from_query(
+                f"SELECT {', '.join(FIELDS)} FROM urls", output=stream.buffer, format="csv", header=True
+            )
+        # "COPY 123"
+        return int(result.split()[-1])
+
+    written = 0
+    writer = csv.writer(stream) if fmt == "csv" else None
+    if writer:
+        writer.writerow(FIELDS)
+    statement = select(*(getattr(Urls, field) for field in FIELDS)).execution_options(yield_per=chunk_size)
+    async with AsyncSession(engine) as session:
+        result = await session.stream(statement)
+        async for rows in result.partitions(chunk_size):
+            for row in rows:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    record = dict(zip(FIELDS, row))
+                    for field in ("created_at", "expires_at"):
+                        record[field] = record[field] and record[field].isoformat()
+                    stream.write(json.dumps(record) + "\n")
+            written += len(rows)
+    return written
+
+
+def open_file(path: str, mode: str):
+    if path == "-":
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+async def run(args) -> dict:
+    from app.databases.manager import DatabaseManager
+    from app.databases.redis import cache_nodes, redis_cache
+
+    fmt = detect_format(args.path, args.format)
+    try:
+        if args.command == "export":
+            with open_file(args.path, "w") as stream:
+                return {"exported": await export_urls(stream, fmt, args.chunk_size)}
+        report_file = open_file(args.report, "w") if args.report else nullcontext()
+        with open_file(args.path, "r") as stream, report_file as report_stream:
+            report = None
+            if report_stream is not None:
+                report = csv.writer(report_stream)
+                report.writerow(["line", "alias", "original_url", "status"])
+            return await import_urls(read_records(stream, fmt), args.chunk_size, args.warm, report)
+    finally:
+        await DatabaseManager.dispose()
+        await cache_nodes.aclose()
+        await redis_cache.aclose()
+
+
+def main(argv=None):
+    from app.loggers import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Import or export urls in bulk")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importing = commands.add_parser("import", help="add the urls of a CSV or JSONL file, - for stdin")
+    importing.add_argument("path")
+    importing.add_argument("--warm", action="store_true", help="also write the imported urls to the Redis cache")
+    importing.add_argument("--report", help="CSV of the records that were invalid, conflicting or got a new alias")
+    exporting = commands.add_parser("export", help="write every url to a CSV or JSONL file, - for stdout")
+    exporting.add_argument("path")
+    for command in (importing, exporting):
+        command.add_argument("--format", choices=("csv", "jsonl"), help="defaults to the file extension")
+        command.add_argument("--chunk-size", type=int, default=50000, help="rows held in memory at a time")
+    args = parser.parse_args(argv)
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    logger.setLevel(logging.INFO)
+    result = asyncio.run(run(args))
+    logger.warning(f"Done: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import logging.config
+import os
+import socket
+from collections import deque
+from datetime import datetime, UTC
+from pathlib import Path
+from time import monotonic, time, time_ns
+from uuid import uuid4
+
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.core.metrics import CallbackMetric
+from app.databases.general import DBActions
+from app.databases.redis import redis_cache
+
+logger = logging.getLogger(__name__)
+
+# Longest referrer / user agent stored per click
+MAX_HEADER_LENGTH = 512
+
+
+def build_click_event(alias: str, request) -> dict:
+    """The fields of a click stream entry, all strings"""
+    headers = request.headers
+    country = headers.get(settings.CLICK_COUNTRY_HEADER, "")[:2].upper()
+    return {
+        "event_id": uuid4().hex,
+        "alias": alias,
+        "ts": f"{time():.3f}",
+        "referrer": headers.get("referer", "")[:MAX_HEADER_LENGTH],
+        "user_agent": headers.get("user-agent", "")[:MAX_HEADER_LENGTH],
+        # "XX" and "T1" are what Cloudflare sends for unknown and Tor
+        "country": country if country.isalpha() and country != "XX" else "",
+    }
+
+
+class ClickSpool:
+    """
+    Append-only NDJSON segment files holding the click events that could
+    not be sent to Redis. Every worker writes its own segments, any worker
+    may replay them once Redis is back: a segment is claimed by renaming
+    it, so only one replays it.
+    """
+
+    # Claimed segments untouched for this long belong to a worker that died replaying them
+    stale_claim_seconds = 600
+
+    def __init__(self, directory: str, segment_size: int):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self._segment = None
+
+    def _new_segment(self) -> Path:
+        return self.directory / f"clicks-{os.getpid()}-{time_ns()}.ndjson"
+
+    def append(self, events: list[dict]):
+        """Blocking, run it in a thread"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._segment is None or (
+            self._segment.exists() and self._segment.stat().st_size >= self.segment_size
+        ):
+            self._segment = self._new_segment()
+        with open(self._segment, "a") as f:
+            f.write("".join(json.dumps(event) + "\n" for event in events))
+
+    def _claimable(self) -> list[Path]:
+        stale = time() - self.stale_claim_seconds
+        paths = list(self.directory.glob("*.ndjson"))
+        paths += [path for path in self.directory.glob("*.replaying") if path.stat().st_mtime < stale]
+        return sorted(paths)
+
+    def claim(self):
+        """Blocking, yields (claimed path, events) of the segments nobody else claimed"""
+        if not self.directory.is_dir():
+            return
+        for path in self._claimable():
+            claimed = self.directory / f"{path.name.split('.')[0]}.{os.getpid()}.replaying"
+            try:
+                path.rename(claimed)
+                claimed.touch()
+            except FileNotFoundError:
+                continue
+            if path == self._segment:
+                self._segment = None
+            with open(claimed) as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            yield claimed, events
+
+    def release(self, claimed: Path):
+        """Put a claimed segment back after a failed replay"""
+        claimed.rename(self._new_segment())
+
+
+class ClickEventSink:
+    """
+    Per worker buffer of click events, appended to the click stream with
+    one pipelined XADD per flush. Recording a click is a deque append, the
+    redirect never waits for Redis or the disk. While Redis is unreachable
+    events go to the spool and are replayed after the next good flush.
+    """
+
+    def __init__(self, stream: str, maxlen: int, flush_interval: float, spool: ClickSpool,
+                 max_pending: int = 100_000):
+        self.stream = stream
+        self.maxlen = maxlen
+        self.flush_interval = flush_interval
+        self.spool = spool
+        # Bounded so a stuck flusher can't eat the memory, the oldest are dropped
+        self._pending = deque(maxlen=max_pending)
+        self._flush_lock = asyncio.Lock()
+        self._replay_checked_at = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, event: dict):
+        self._pending.append(event)
+
+    async def _send(self, events: list[dict]):
+        pipe = redis_cache.pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(self.stream, event, maxlen=self.maxlen, approximate=True)
+        await pipe.execute()
+
+    async def flush(self) -> int:
+        """Send the buffered events, returns how many reached the stream"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            events = list(self._pending)
+            self._pending.clear()
+            try:
+                await self._send(events)
+            except Exception as e:
+                logger.error(f"Failed to append {len(events)} click events to Redis, spooling them: {e}")
+                try:
+                    await asyncio.to_thread(self.spool.append, events)
+                except Exception as e:
+                    logger.error(f"Failed to spool {len(events)} click events, they are lost: {e}")
+                return 0
+            # Redis works, pick up whatever was spooled while it didn't
+            if monotonic() - self._replay_checked_at > 10:
+                self._replay_checked_at = monotonic()
+                await self.replay()
+            return len(events)
+
+    async def replay(self) -> int:
+        """Send the spooled events to the stream, returns how many were sent"""
+        replayed = 0
+        segments = self.spool.claim()
+        while claimed := await asyncio.to_thread(next, segments, None):
+            path, events = claimed
+            try:
+                for start in range(0, len(events), 1000):
+                    await self._send(events[start:start + 1000])
+            except Exception as e:
+                logger.error(f"Failed to replay click spool {path.name}: {e}")
+                await asyncio.to_thread(self.spool.release, path)
+                break
+            await asyncio.to_thread(path.unlink)
+            replayed += len(events)
+        if replayed:
+            logger.info(f"Replayed {replayed} spooled click events")
+        return replayed
+
+    async def run(self):
+        """Long running task that flushes the buffer every flush_interval"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+click_events = ClickEventSink(
+    stream=settings.CLICK_STREAM_KEY,
+    maxlen=settings.CLICK_STREAM_MAXLEN,
+    flush_interval=settings.CLICK_EVENTS_FLUSH_INTERVAL,
+    spool=ClickSpool(settings.CLICK_SPOOL_DIR, settings.CLICK_SPOOL_SEGMENT_SIZE),
+)
+
+
+def record_click(alias: str, request):
+    """
+    Queue a click event for the click stream, returns immediately.
+    """
+    if settings.CLICK_EVENTS_ENABLED:
+        click_events.add(build_click_event(alias, request))
+
+
+CallbackMetric(
+    "miniurl_click_events_pending",
+    "Click events waiting to be appended to the click stream",
+    "gauge",
+    lambda: {(): click_events.pending},
+)
+
+
+def to_click_row(fields: dict) -> dict:
+    return {
+        "event_id": fields["event_id"],
+        "alias": fields["alias"],
+        # Naive UTC like every timestamp column
+        "clicked_at": datetime.fromtimestamp(float(fields["ts"]), UTC).replace(tzinfo=None),
+        "referrer": fields.get("referrer") or None,
+        "user_agent": fields.get("user_agent") or None,
+        "country": fields.get("country") or None,
+    }
+
+
+class ClickAggregator:
+    """
+    Consumer group worker moving the click stream into the click_events
+    table and the hourly/daily rollups.
+
+    Entries are acknowledged only once their transaction committed. Entries
+    left pending by a crashed consumer, or by a failed insert, are claimed
+    again after claim_idle_ms. The insert skips known event ids, so a
+    redelivery never counts a click twice.
+    """
+
+    def __init__(self, stream: str, group: str, consumer: str, batch_size: int,
+                 block_ms: int = 5000, claim_idle_ms: int = 60000):
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self._claimed_at = 0
+
+    async def ensure_group(self):
+        try:
+            await redis_cache.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def process(self, entries: list) -> int:
+        if not entries:
+            return 0
+        ids = [entry_id for entry_id, _ in entries]
+        rows = []
+        for entry_id, fields in entries:
+            try:
+                rows.append(to_click_row(fields))
+            except (KeyError, ValueError) as e:
+                logger.error(f"Dropping malformed click event {entry_id}: {e}")
+        inserted = await DBActions().add_click_events(rows) if rows else 0
+        await redis_cache.xack(self.stream, self.group, *ids)
+        return inserted
+
+    async def claim_stale(self) -> int:
+        _, entries, *_ = await redis_cache.xautoclaim(
+            self.stream, self.group, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.batch_size,
+        )
+        return await self.process(entries)
+
+    async def run_once(self) -> int:
+        processed = 0
+        if monotonic() - self._claimed_at > self.claim_idle_ms / 1000:
+            self._claimed_at = monotonic()
+            processed += await self.claim_stale()
+        response = await redis_cache.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"},
+            count=self.batch_size, block=self.block_ms,
+        )
+        for _, entries in response or []:
+            processed += await self.process(entries)
+        return processed
+
+    async def run(self):
+        """Long running consumer loop"""
+        while True:
+            try:
+                await self.ensure_group()
+                break
+            except Exception as e:
+                logger.error(f"Failed to create click consumer group: {e}")
+                await asyncio.sleep(5)
+        logger.info(f"Click aggregator {self.consumer} consuming {self.stream}")
+        while True:
+            try:
+                processed = await self.run_once()
+                if processed:
+                    logger.debug(f"Aggregated {processed} click events")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to aggregate click events: {e}")
+                await asyncio.sleep(1)
+
+
+def main():
+    from app.loggers import LOGGING_CONFIG
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    aggregator = ClickAggregator(
+        stream=settings.CLICK_STREAM_KEY,
+        group=settings.CLICK_AGGREGATOR_GROUP,
+        consumer=f"{socket.gethostname()}-{os.getpid()}",
+        batch_size=settings.CLICK_AGGREGATOR_BATCH,
+    )
+    asyncio.run(aggregator.run())
+
+
+if __name__ == "__main__":
+    main()
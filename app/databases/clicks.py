@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from collections import Counter
+from time import monotonic
+
+from app.core.config import settings
+from app.core.metrics import CallbackMetric
+from app.databases.general import DBActions
+
+logger = logging.getLogger(__name__)
+
+
+class ClickBuffer:
+    """
+    Counts clicks in memory and writes them to the db in batches.
+
+    Every flush is a single UPDATE for all the aliases clicked since the
+    previous one, so the db write load follows the number of distinct hot
+    aliases instead of the raw redirect traffic. Counts that fail to be
+    written are merged back and retried on the next flush.
+    """
+
+    def __init__(self, flush_interval: float, flush_threshold: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._counts: Counter = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._failed_at = None
+
+    @property
+    def pending(self) -> int:
+        """Number of aliases waiting to be flushed"""
+        return len(self._counts)
+
+    def add(self, alias: str, count: int = 1):
+        self._counts[alias] += count
+        if len(self._counts) >= self.flush_threshold and self._flush_task is None:
+            # Leave it to the timer while the db is failing
+            if self._failed_at and monotonic() - self._failed_at < self.flush_interval:
+                return
+            self._flush_task = asyncio.create_task(self._threshold_flush())
+
+    async def _threshold_flush(self):
+        try:
+            await self.flush()
+        finally:
+            self._flush_task = None
+
+    async def flush(self) -> int:
+        """Write all buffered clicks, returns the number of aliases flushed"""
+        async with self._flush_lock:
+            if not self._counts:
+                return 0
+            counts, self._counts = self._counts, Counter()
+            try:
+                await DBActions().add_clicks(counts)
+            except Exception as e:
+                self._counts.update(counts)
+                self._failed_at = monotonic()
+                logger.error(f"Failed to flush {len(counts)} click counts: {e}")
+                return 0
+            self._failed_at = None
+            logger.debug(f"Flushed click counts for {len(counts)} aliases")
+            return len(counts)
+
+    async def run(self):
+        """Long running task that flushes the buffer every flush_interval"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+click_buffer = ClickBuffer(
+    flush_interval=settings.CLICK_FLUSH_INTERVAL,
+    flush_threshold=settings.CLICK_FLUSH_THRESHOLD,
+)
+
+
+def increase_click(alias: str):
+    """
+    Count a click for a given alias, it reaches the db on the next flush.
+    """
+    click_buffer.add(alias)
+
+
+CallbackMetric(
+    "miniurl_click_buffer_pending",
+    "Aliases with clicks waiting to be flushed to the db",
+    "gauge",
+    lambda: {(): click_buffer.pending},
+)
@@ -0,0 +1,157 @@
+import logging
+import zlib
+from fnmatch import fnmatchcase
+from time import time
+
+from redis.client import NEVER_DECODE
+
+logger = logging.getLogger(__name__)
+
+# Common pieces of shortened urls, the compressor refers back to them.
+# The most likely ones go last, they are the cheapest to reference
+URL_DICTIONARY = b"".join([
+    b"forms.gle/drive.google.com/file/d//view?usp=sharingdocs.google.com/document/d//edit?usp=sharing",
+    b"docs.google.com/forms/d/e//viewformmaps.app.goo.gl/goo.gl/maps/bit.ly/t.me/wa.me/",
+    b"linkedin.com/posts/linkedin.com/in/linkedin.com/company/github.com/medium.com/@",
+    b"amazon.com/dp/ebay.com/itm/tiktok.com/@/video/reddit.com/r//comments/",
+    b"en.wikipedia.org/wiki/el.wikipedia.org/wiki/twitter.com/x.com//status/",
+    b"facebook.com/instagram.com/p/instagram.com/reel/youtu.be/youtube.com/shorts/",
+    b".pdf.html.php?id=/index.html?ref=&fbclid=?si=&t=&feature=share",
+    b"?utm_source=&utm_medium=&utm_campaign=&utm_content=&utm_term=",
+    b".gr/.org/.net/.io/.co.uk/.de/.eu/",
+    b"https://www.youtube.com/watch?v=https://www.google.com/https://",
+    b"http://www.https://www.",
+])
+
+# First byte of compressed values, never the first byte of a url
+COMPRESSED = b"\x00"
+
+
+def compress_url(url: str) -> bytes:
+    # Raw deflate, no header and checksum, they cost as much as they save on short urls
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, URL_DICTIONARY)
+    return COMPRESSED + compressor.compress(url.encode()) + compressor.flush()
+
+
+def decode_url(value):
+    if value is None:
+        return None
+    if value.startswith(COMPRESSED):
+        decompressor = zlib.decompressobj(-15, zdict=URL_DICTIONARY)
+        return (decompressor.decompress(value[1:]) + decompressor.flush()).decode()
+    return value.decode()
+
+
+class BucketedCache:
+    """
+    Cached urls stored as fields of small Redis hashes instead of one key
+    per alias. Small hashes are listpack encoded, a few bytes per field
+    instead of the ~50 bytes of bookkeeping of every top level key.
+    The hashes must fit Redis' hash-max-listpack-entries/-value limits, see
+    docker-compose.yml.
+
+    Expiry uses generations: fields are written to the hashes of the current
+    generation, which expire two generations after they were created. Reads
+    check the current and the previous generation in one round trip, a url
+    found in the previous one only is copied forward. Entries live between
+    one and two `ttl`.
+
+    Same interface as the key per alias cache (ShardedRedis).
+    """
+
+    # Entries expire with their generation, links expiring sooner aren't cached
+    exact_expiry = False
+
+    def __init__(self, nodes, buckets: int, ttl: int, compress: bool = False, prefix: str = "cb"):
+        self.nodes = nodes
+        self.buckets = buckets
+        self.ttl = ttl
+        self.compress = compress
+        self.prefix = prefix
+
+    def generation(self) -> int:
+        return int(time() // self.ttl)
+
+    def bucket_key(self, alias: str, generation: int) -> str:
+        return f"{self.prefix}:{generation}:{zlib.crc32(alias.encode()) % self.buckets}"
+
+    def encode(self, url: str):
+        return compress_url(url) if self.compress else url
+
+    def _write(self, pipe, key: str, alias: str, url: str, nx: bool):
+        if nx:
+            pipe.hsetnx(key, alias, self.encode(url))
+        else:
+            pipe.hset(key, alias, self.encode(url))
+        pipe.expire(key, 2 * self.ttl, nx=True)
+
+    def _read(self, pipe, key: str, alias: str):
+        # Compressed values aren't utf-8, they are decoded here
+        pipe.execute_command("HGET", key, alias, **{NEVER_DECODE: []})
+
+    async def mget(self, aliases: list) -> list:
+        current = self.generation()
+        results = await self.nodes.run_pipelined([
+            (self.bucket_key(alias, generation), lambda pipe, key, alias=alias: self._read(pipe, key, alias))
+            for alias in aliases for generation in (current, current - 1)
+        ])
+        values, stale = [], {}
+        for index, alias in enumerate(aliases):
+            (value,), (previous,) = results[2 * index], results[2 * index + 1]
+            if value is None and previous is not None:
+                stale[alias] = decode_url(previous)
+            values.append(decode_url(value if value is not None else previous))
+        if stale:
+            # Still wanted, keep them for another generation
+            await self.set_many(stale, nx=True)
+        return values
+
+    async def get(self, alias: str):
+        return (await self.mget([alias]))[0]
+
+    async def get_with_ttl(self, alias: str):
+        # Entries expire with their generation, no ttl of their own
+        return await self.get(alias), None
+
+    async def set_many(self, items: dict, expire=None, nx: bool = False) -> list:
+        """`expire` is ignored, entries expire with their generation"""
+        generation = self.generation()
+        results = await self.nodes.run_pipelined([
+            (self.bucket_key(alias, generation),
+             lambda pipe, key, alias=alias, url=url: self._write(pipe, key, alias, url, nx))
+            for alias, url in items.items()
+        ])
+        # HSET counts new fields, an update is a success too
+        return [None if result[0] is None else bool(result[0]) or not nx for result in results]
+
+    async def set(self, name: str, value: str, ex: int = None, nx: bool = False):
+        return (await self.set_many({name: value}, nx=nx))[0]
+
+    async def delete(self, alias: str) -> int:
+        return await self.delete_many([alias])
+
+    async def delete_many(self, aliases: list) -> int:
+        current = self.generation()
+        results = await self.nodes.run_pipelined([
+            (self.bucket_key(alias, generation), lambda pipe, key, alias=alias: pipe.hdel(key, alias))
+            for alias in aliases for generation in (current, current - 1)
+        ])
+        return sum(result[0] or 0 for result in results)
+
+    async def scan_urls(self, node: str, cursor: int, match: str = None, count: int = None):
+        """
+        One SCAN step over the bucket hashes of node, returns the next cursor
+        and a list of (alias, url). `match` applies to the aliases. An alias
+        may be listed twice, from the current and the previous generation.
+        """
+        cursor, keys = await self.nodes.scan(node, cursor, match=f"{self.prefix}:*", count=count, _type="hash")
+        buckets = await self.nodes.run_pipelined([
+            (key, lambda pipe, key: pipe.execute_command("HGETALL", key, **{NEVER_DECODE: []})) for key in keys
+        ])
+        urls = []
+        for (bucket,) in buckets:
+            for alias, value in (bucket or {}).items():
+                alias = alias.decode()
+                if match is None or fnmatchcase(alias, match):
+                    urls.append((alias, decode_url(value)))
+        return cursor, urls
@@ -1,92 +1,524 @@
+import asyncio
 import logging
+from collections import Counter
+from datetime import UTC, datetime
+from time import perf_counter
 from typing import Union
 
 from pydantic import HttpUrl
-from sqlmodel import Session, select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import Integer, String, bindparam, column, func, text, union, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError, TimeoutError as PoolTimeout
 
-from app.databases.redis import get_from_cache
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS, CallbackMetric
+from app.databases.bloom import alias_filter
+from app.databases.local_cache import (
+    alias_cache, missing_aliases, publish_alias_event, publish_alias_events, recently_written
+)
+from app.databases.redis import (
+    acquire_lock, delete_from_cache, delete_many_from_cache, get_fill_state, get_from_cache_with_ttl, release_lock,
+    replace_in_cache, save_to_cache, set_fill_marker
+)
+from app.databases.ttl import adaptive_ttl, cap_ttl, record_fill_duration, should_refresh_early
 from app.databases.manager import DatabaseManager
-from app.databases.models import Urls
+from app.databases.models import ClickCountryDaily, ClickDaily, ClickEvent, ClickHourly, Urls
+from app.utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# In-flight cache misses of this worker, by alias
+alias_flights = SingleFlight()
+CACHE_FILL_POLL_MS = 20
+# Early refreshes running on this worker, by alias
+alias_refreshes: dict[str, asyncio.Task] = {}
+# A refreshed alias isn't refreshed again by any worker for this long
+CACHE_REFRESH_LOCK_TTL_MS = 10000
+
+CallbackMetric(
+    "miniurl_alias_lookups_total",
+    "Redis/db lookups started, or joined while already in flight",
+    "counter",
+    lambda: {("started",): alias_flights.started, ("shared",): alias_flights.shared},
+    labelnames=("kind",),
+)
+CallbackMetric(
+    "miniurl_alias_lookups_in_flight",
+    "Redis/db lookups currently running",
+    "gauge",
+    lambda: {(): len(alias_flights)},
+)
+
+
+class AliasExpired(Exception):
+    """The alias exists but its link expired, answered with 410 Gone"""
+
+
+# Marks expired aliases in missing_aliases, and in the fill marker with MISSING
+EXPIRED = "expired"
+MISSING = "missing"
+
+
+# Errors after which a replica is considered down and the query retried on the primary
+REPLICA_ERRORS = (OperationalError, InterfaceError, PoolTimeout, OSError, asyncio.TimeoutError)
+
 
 class DBActions:
-    def __init__(self, db_session=None):
-        _manager = DatabaseManager()
-        self.db_session = db_session or _manager.get_db_instance()
+    def __init__(self, db_session=None, read_session=None):
+        self.db_session = db_session or DatabaseManager.get_async_db_instance()
+        # Read-only queries go to a replica when there is one
+        self.read_session = read_session or (db_session or DatabaseManager.get_read_db_instance())
 
-    def add_url(self, alias: str, original_url: Union[HttpUrl, str], description: str = None):
+    async def _read(self, query):
+        """
+        Run the read-only query(engine) on the read engine, and again on
+        the primary if that is a replica and it failed.
+        """
+        if self.read_session is self.db_session:
+            return await query(self.db_session)
+        try:
+            return await query(self.read_session)
+        except REPLICA_ERRORS as e:
+            logger.error(f"Replica query failed, retrying on the primary: {e}")
+            DatabaseManager.mark_unhealthy(self.read_session)
+            self.read_session = self.db_session
+            return await query(self.db_session)
+
+    async def add_url(
+        self, alias: str, original_url: Union[HttpUrl, str], description: str = None, expires_at: datetime = None
+    ):
         urls_data = {
             "alias": alias,
             "original_url": original_url,
-            "description": description
+            "description": description,
+            "expires_at": expires_at,
         }
-        with Session(self.db_session) as session:
+        async with AsyncSession(self.db_session, expire_on_commit=False) as session:
             url_obj = Urls(**urls_data)
             session.add(url_obj)
             try:
-                session.commit()
-                return url_obj
+                await session.commit()
             except IntegrityError as exc:
-                session.rollback()
+                await session.rollback()
                 # Check for unique constraint violation
                 # TODO inspect if this can be done better
                 if "unique" in str(exc).lower() or "duplicate" in str(exc).lower():
                     raise ValueError(f"Alias '{alias}' already exists.") from exc
                 raise
+        await register_alias(alias)
+        return url_obj
+
+    async def add_urls(self, rows: list[dict], batch_size: int = 1000) -> set[str]:
+        """
+        Insert many urls with one multi-row
+        INSERT ... ON CONFLICT (alias) DO NOTHING RETURNING alias
+        per batch_size rows. Returns the aliases actually inserted,
+        the missing ones already existed.
+        """
+        dialect = sqlite if self.db_session.dialect.name == "sqlite" else postgresql
+        inserted = set()
+        async with AsyncSession(self.db_session) as session:
+            for start in range(0, len(rows), batch_size):
+                statement = (
+                    dialect.insert(Urls)
+                    .values([{"total_clicks": 0, **row} for row in rows[start:start + batch_size]])
+                    .on_conflict_do_nothing(index_elements=[Urls.alias])
+                    .returning(Urls.alias)
+                )
+                result = await session.exec(statement)
+                inserted.update(result.scalars())
+            await session.commit()
+        await register_aliases(list(inserted))
+        return inserted
+
+    async def reserve_alias_ids(self, count: int) -> list[int]:
+        """Reserve `count` unique ids from the alias sequence, in one round trip"""
+        statement = text("SELECT nextval('urls_alias_seq') FROM generate_series(1, :count)")
+        async with AsyncSession(self.db_session) as session:
+            result = await session.exec(statement, params={"count": count})
+            return list(result.scalars())
+
+    async def get_existing_aliases(self, aliases: list[str]) -> set[str]:
+        """Which of the given aliases are already taken, in one query"""
+        if not aliases:
+            return set()
+        async with AsyncSession(self.db_session) as session:
+            statement = select(Urls.alias).where(Urls.alias.in_(aliases))
+            return set((await session.exec(statement)).all())
+
+    async def get_url_by_alias(self, alias: str, return_object=False):
+        """
+        Get url based on alias.
+        Read from a replica unless the alias was just written here or
+        announced as added by another worker, those may not be replicated yet.
+        """
+        async def query(engine):
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                statement = select(Urls).where(Urls.alias == alias)
+                return (await session.exec(statement)).first()
+
+        if alias in recently_written:
+            result = await query(self.db_session)
+        else:
+            result = await self._read(query)
+        if return_object:
+            return result
+        return result.original_url if result else None
+
+    async def add_clicks(self, counts: dict[str, int], batch_size: int = 1000):
+        """
+        Add click counts to many aliases at once, with one
+        UPDATE urls ... FROM (VALUES ...) per batch_size aliases.
+        """
+        items = sorted(counts.items())
+        updated = 0
+        async with AsyncSession(self.db_session) as session:
+            if self.db_session.dialect.name != "postgresql":
+                # No UPDATE ... FROM (VALUES ...) support, fall back to executemany
+                statement = (
+                    update(Urls.__table__)
+                    .where(Urls.alias == bindparam("_alias"))
+                    .values(total_clicks=Urls.total_clicks + bindparam("_clicks"))
+                )
+                params = [{"_alias": alias, "_clicks": clicks} for alias, clicks in items]
+                connection = await session.connection()
+                updated = (await connection.execute(statement, params)).rowcount
+                await session.commit()
+                return updated
 
-    def get_url_by_alias(self, alias: str, return_object=False):
-        """Get url based on alias"""
-        with Session(self.db_session) as session:
-            statement = select(Urls).where(Urls.alias == alias)
-            result = session.exec(statement).first()
-            if return_object:
-                return result
-            return result.original_url if result else None
-
-    async def increase_click(self, alias: str):
-        url_record = self.get_url_by_alias(alias, return_object=True)
-        if url_record:
-            with Session(self.db_session) as session:
-                url_record.total_clicks = url_record.total_clicks + 1
-                session.add(url_record)
-                session.commit()
-                logger.debug(f"Click count increased for alias: {alias} to {url_record.total_clicks}")
-                return url_record.total_clicks
-
-    def get_last_id(self):
-        """Get the last inserted ID in the Urls table"""
-        with Session(self.db_session) as session:
-            statement = select(Urls).order_by(Urls.id.desc())
-            result = session.exec(statement).first()
-            return result.id if result else None
+            for start in range(0, len(items), batch_size):
+                batch = values(
+                    column("alias", String), column("clicks", Integer), name="batch"
+                ).data(items[start:start + batch_size])
+                statement = (
+                    update(Urls)
+                    .where(Urls.alias == batch.c.alias)
+                    .values(total_clicks=Urls.total_clicks + batch.c.clicks)
+                )
+                result = await session.exec(
+                    statement, execution_options={"synchronize_session": False}
+                )
+                updated += result.rowcount
+            await session.commit()
+        return updated
+
+    async def add_click_events(self, rows: list[dict], batch_size: int = 1000) -> int:
+        """
+        Insert click events and add them to the hourly, daily and per country
+        rollups, in one transaction. Events already stored (same event_id) are
+        skipped and not counted again, so redelivered events are harmless.
+        Returns the number of new events.
+        """
+        dialect = sqlite if self.db_session.dialect.name == "sqlite" else postgresql
+        hourly, daily, countries = Counter(), Counter(), Counter()
+        async with AsyncSession(self.db_session) as session:
+            for start in range(0, len(rows), batch_size):
+                statement = (
+                    dialect.insert(ClickEvent)
+                    .values(rows[start:start + batch_size])
+                    .on_conflict_do_nothing(index_elements=[ClickEvent.event_id])
+                    .returning(ClickEvent.alias, ClickEvent.clicked_at, ClickEvent.country)
+                )
+                for alias, clicked_at, country in (await session.exec(statement)).all():
+                    hourly[(alias, clicked_at.replace(minute=0, second=0, microsecond=0))] += 1
+                    daily[(alias, clicked_at.date())] += 1
+                    countries[(alias, clicked_at.date(), country or "")] += 1
+
+            rollups = (
+                (ClickHourly, ("alias", "hour"), hourly),
+                (ClickDaily, ("alias", "day"), daily),
+                (ClickCountryDaily, ("alias", "day", "country"), countries),
+            )
+            for model, keys, counts in rollups:
+                # Sorted so concurrent aggregators lock rows in the same order
+                items = sorted(counts.items())
+                for start in range(0, len(items), batch_size):
+                    statement = dialect.insert(model).values([
+                        {**dict(zip(keys, key)), "clicks": clicks}
+                        for key, clicks in items[start:start + batch_size]
+                    ])
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[getattr(model, name) for name in keys],
+                        set_={"clicks": model.clicks + statement.excluded.clicks},
+                    )
+                    await session.exec(statement)
+            await session.commit()
+        return sum(daily.values())
+
+    async def get_click_buckets(self, alias: str, granularity: str, since) -> list[tuple]:
+        """(bucket start, clicks) of the hourly or daily rollup since a bucket, oldest first"""
+        model, bucket = (ClickHourly, ClickHourly.hour) if granularity == "hour" else (ClickDaily, ClickDaily.day)
+        statement = (
+            select(bucket, model.clicks)
+            .where(model.alias == alias, bucket >= since)
+            .order_by(bucket)
+        )
+
+        async def query(engine):
+            async with AsyncSession(engine) as session:
+                return list((await session.exec(statement)).all())
+
+        return await self._read(query)
+
+    async def get_click_countries(self, alias: str, since, limit: int = 10) -> list[tuple]:
+        """(country, clicks) of the most clicking countries since a day"""
+        clicks = func.sum(ClickCountryDaily.clicks).label("clicks")
+        statement = (
+            select(ClickCountryDaily.country, clicks)
+            .where(ClickCountryDaily.alias == alias, ClickCountryDaily.day >= since)
+            .group_by(ClickCountryDaily.country)
+            .order_by(clicks.desc())
+            .limit(limit)
+        )
+
+        async def query(engine):
+            async with AsyncSession(engine) as session:
+                return list((await session.exec(statement)).all())
+
+        return await self._read(query)
+
+    async def iter_aliases(self, batch_size: int = 10000):
+        """Yield every alias in batches, paginated on the primary key"""
+        last_id = 0
+        while True:
+            async with AsyncSession(self.db_session) as session:
+                statement = (
+                    select(Urls.id, Urls.alias)
+                    .where(Urls.id > last_id)
+                    .order_by(Urls.id)
+                    .limit(batch_size)
+                )
+                rows = (await session.exec(statement)).all()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [alias for _, alias in rows]
+
+    async def iter_hot_urls(self, top_n: int, recent_n: int, batch_size: int = 1000):
+        """
+        Stream (alias, original_url, total_clicks, expires_at) of the top_n most
+        clicked and the recent_n newest urls that haven't expired, in batches
+        of batch_size rows.
+        """
+        columns = (Urls.alias, Urls.original_url, Urls.total_clicks, Urls.expires_at)
+        live = (Urls.expires_at.is_(None)) | (Urls.expires_at > datetime.now(UTC).replace(tzinfo=None))
+        top = select(*columns).where(live).order_by(Urls.total_clicks.desc()).limit(top_n)
+        recent = select(*columns).where(live).order_by(Urls.created_at.desc()).limit(recent_n)
+        statement = union(select(top.subquery()), select(recent.subquery()))
+        engine = self.read_session
+        while True:
+            started = False
+            try:
+                async with AsyncSession(engine) as session:
+                    result = await session.stream(statement.execution_options(yield_per=batch_size))
+                    async for rows in result.partitions(batch_size):
+                        started = True
+                        yield rows
+                return
+            except REPLICA_ERRORS as e:
+                # Only restart on the primary if nothing was yielded yet
+                if engine is self.db_session or started:
+                    raise
+                logger.error(f"Replica query failed, retrying on the primary: {e}")
+                DatabaseManager.mark_unhealthy(engine)
+                engine = self.db_session
+
+    async def get_last_id(self):
+        """Get the last inserted ID in the Urls table, from the primary"""
+        async with AsyncSession(self.db_session) as session:
+            statement = select(Urls.id).order_by(Urls.id.desc()).limit(1)
+            return (await session.exec(statement)).first()
 
 
 async def resolve_url_from_dbs(alias: str, got_from_cache=False):
     """
     Resolve a minified url alias to its original url.
-    First if it is available in cache, return that. If not, check the db.
+    Lookup order is the in-process cache, then Redis, then the db.
+    Aliases known not to exist are answered without any network I/O.
+    Raises AliasExpired for the aliases of expired links.
     """
-
-    from_cache = await get_from_cache(alias)
+    from_cache = alias_cache.get(alias)
     if from_cache:
-        # TODO: add metrics for cache hits/misses
-        logger.debug("Hit cache for alias: %s", alias)
-        original_url = from_cache
+        logger.debug("Hit local cache for alias: %s", alias)
+        if got_from_cache:
+            return from_cache, from_cache
+        return from_cache
+
+    missing = missing_aliases.get(alias)
+    if missing == EXPIRED:
+        raise AliasExpired(alias)
+    if missing:
+        if got_from_cache:
+            return None, None
+        return None
+
+    if alias_filter is not None and not await alias_filter.might_contain(alias):
+        # Not negative cached, the filter learns of aliases created by other
+        # workers with their "added" event and asking it again is as cheap
+        CACHE_REQUESTS.inc("bloom", "reject")
+        if got_from_cache:
+            return None, None
+        return None
+
+    # Concurrent lookups of the same alias share a single Redis/db round trip
+    try:
+        original_url, from_cache, max_age = await alias_flights.do(alias, fetch_alias, alias)
+    except AliasExpired:
+        missing_aliases.set(alias, EXPIRED)
+        raise
+
+    if original_url:
+        # Expiring links don't outlive their expiry here either
+        alias_cache.set(alias, original_url, ttl=min(max_age, alias_cache.ttl) if max_age else None)
     else:
-        # URL not found in cache, check the db
-        actions = DBActions()
-        original_url = actions.get_url_by_alias(alias=alias)
+        missing_aliases.set(alias, True)
 
     if got_from_cache:
         return original_url, from_cache
     return original_url
 
-async def increase_click(alias: str):
+
+async def fetch_alias(alias: str):
     """
-    Increase click count for a given alias.
+    Redis then db lookup, returns (original_url, value found in Redis,
+    seconds the url may be cached locally or None for as long as usual).
+    Raises AliasExpired when the link expired.
+
+    On a miss a short Redis lock makes sure that only one worker queries
+    the db and fills the cache, the others wait a little for that fill
+    before falling back to the db themselves. Aliases the lock holder found
+    missing or expired are left in a fill marker for the waiters, and they
+    stop waiting as soon as the lock is released. A hit close to its expiry
+    may reload the alias in the background (see refresh_alias).
     """
-    actions = DBActions()
-    await actions.increase_click(alias)
+    from_cache, ttl_ms = await get_from_cache_with_ttl(alias)
+    if from_cache:
+        logger.debug("Hit cache for alias: %s", alias)
+        if should_refresh_early(ttl_ms):
+            schedule_refresh(alias)
+        # Entries of expiring links expire with them
+        return from_cache, from_cache, ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else None
+
+    lock_name = f"lock:alias:{alias}"
+    marker_name = f"fill:{alias}"
+    token = await acquire_lock(lock_name, ttl_ms=settings.CACHE_FILL_LOCK_TTL_MS)
+    if token is None:
+        waited = 0
+        while waited < settings.CACHE_FILL_WAIT_MS:
+            await asyncio.sleep(CACHE_FILL_POLL_MS / 1000)
+            waited += CACHE_FILL_POLL_MS
+            (from_cache, ttl_ms), (held, marker) = await asyncio.gather(
+                get_from_cache_with_ttl(alias), get_fill_state(lock_name, marker_name)
+            )
+            if from_cache:
+                return from_cache, from_cache, ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else None
+            if marker == EXPIRED:
+                raise AliasExpired(alias)
+            if marker == MISSING:
+                return None, None, None
+            if not held:
+                # Released without a result, e.g. the holder failed
+                break
+
+    try:
+        # URL not found in cache, check the db
+        started = perf_counter()
+        url = await DBActions().get_url_by_alias(alias=alias, return_object=True)
+        record_fill_duration(perf_counter() - started)
+        if url is None:
+            if token is not None:
+                await set_fill_marker(marker_name, MISSING, ttl_ms=settings.CACHE_FILL_LOCK_TTL_MS)
+            return None, None, None
+        expire = cap_ttl(adaptive_ttl(url.total_clicks), url.expires_at)
+        if expire is None:
+            if token is not None:
+                await set_fill_marker(marker_name, EXPIRED, ttl_ms=settings.CACHE_FILL_LOCK_TTL_MS)
+            raise AliasExpired(alias)
+        await save_to_cache(alias, url.original_url, expire=expire)
+        return url.original_url, None, expire if url.expires_at else None
+    finally:
+        if token is not None:
+            await release_lock(lock_name, token)
+
+
+def schedule_refresh(alias: str):
+    """Start refresh_alias in the background, once per alias and worker"""
+    if alias in alias_refreshes:
+        return
+    task = asyncio.create_task(refresh_alias(alias))
+    alias_refreshes[alias] = task
+    task.add_done_callback(lambda _: alias_refreshes.pop(alias, None))
+
+
+async def refresh_alias(alias: str):
+    """
+    Reload a cached alias from the db before it expires, with a ttl matching
+    its clicks so far. One worker does it, the lock isn't released and keeps
+    the others from refreshing it again right away.
+    """
+    token = await acquire_lock(f"lock:refresh:{alias}", ttl_ms=CACHE_REFRESH_LOCK_TTL_MS)
+    if token is None:
+        return
+    try:
+        started = perf_counter()
+        url = await DBActions().get_url_by_alias(alias=alias, return_object=True)
+        record_fill_duration(perf_counter() - started)
+        # Deleted aliases are removed from the cache by invalidate_alias
+        if url is None:
+            return
+        expire = cap_ttl(adaptive_ttl(url.total_clicks), url.expires_at)
+        if expire is None:
+            await delete_from_cache(alias)
+        else:
+            await replace_in_cache(alias, url.original_url, expire=expire)
+    except Exception as e:
+        logger.error(f"Failed to refresh alias {alias}: {e}")
+
+async def register_alias(alias: str):
+    """
+    Make a newly created alias resolvable on every worker,
+    it may be sitting in a negative cache or missing from a Bloom filter.
+    """
+    missing_aliases.delete(alias)
+    recently_written.set(alias, True)
+    if alias_filter is not None:
+        await alias_filter.add(alias)
+    await publish_alias_event("added", alias)
+
+
+async def register_aliases(aliases: list[str]):
+    """Same as register_alias for a batch of aliases"""
+    if not aliases:
+        return
+    for alias in aliases:
+        missing_aliases.delete(alias)
+        recently_written.set(alias, True)
+    if alias_filter is not None:
+        await alias_filter.add_many(aliases)
+    await publish_alias_events("added", aliases)
+
+
+async def invalidate_alias(alias: str):
+    """
+    Drop an alias from every cache tier, on every worker.
+    Must be called whenever an alias is changed or deleted.
+    """
+    alias_cache.delete(alias)
+    missing_aliases.delete(alias)
+    recently_written.set(alias, True)
+    await delete_from_cache(alias)
+    await publish_alias_event("invalidate", alias)
+
+
+async def invalidate_aliases(aliases: list[str]):
+    """Same as invalidate_alias for a batch of aliases"""
+    if not aliases:
+        return
+    for alias in aliases:
+        alias_cache.delete(alias)
+        missing_aliases.delete(alias)
+        recently_written.set(alias, True)
+    await delete_many_from_cache(aliases)
+    await publish_alias_events("invalidate", aliases)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Optional
+
+from app.core.config import settings
+from app.core.metrics import CallbackMetric
+from app.databases.bloom import alias_filter
+from app.databases.redis import redis_cache
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub channel used to keep the per-worker caches coherent.
+# Messages are "<event>:<alias>", e.g. "invalidate:abc123" or "added:abc123"
+ALIAS_EVENTS_CHANNEL = "miniurl:alias-events"
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with a TTL per entry.
+
+    Lives inside a single worker, so lookups cost no network I/O at all.
+    Not thread safe, it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > monotonic()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at <= monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        if not self.enabled:
+            return
+        self._data[key] = (monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        return self._data.pop(key, None) is not None
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# alias -> original url, consulted before Redis
+alias_cache = LocalCache(maxsize=settings.LOCAL_CACHE_SIZE, ttl=settings.LOCAL_CACHE_TTL)
+# Aliases recently looked up and not found anywhere
+missing_aliases = LocalCache(maxsize=settings.NEGATIVE_CACHE_SIZE, ttl=settings.NEGATIVE_CACHE_TTL)
+# Aliases just added or changed, read from the primary until the replicas caught up
+recently_written = LocalCache(maxsize=settings.NEGATIVE_CACHE_SIZE, ttl=settings.DB_REPLICA_MAX_LAG)
+CallbackMetric(
+    "miniurl_local_cache_events_total",
+    "Hits, misses, evictions and expirations of the in-process caches",
+    "counter",
+    lambda: {
+        (name, event): value
+        for name, cache in (("alias", alias_cache), ("missing", missing_aliases))
+        for event, value in cache.stats().items()
+        if event not in ("size", "maxsize")
+    },
+    labelnames=("cache", "event"),
+)
+CallbackMetric(
+    "miniurl_local_cache_size",
+    "Entries held by the in-process caches",
+    "gauge",
+    lambda: {("alias",): len(alias_cache), ("missing",): len(missing_aliases)},
+    labelnames=("cache",),
+)
+
+# Set while this worker receives alias events
+alias_events_subscribed = asyncio.Event()
+
+
+async def handle_alias_event(message: str):
+    """Apply an alias event received from another worker"""
+    event, _, alias = message.partition(":")
+    if event == "invalidate":
+        alias_cache.delete(alias)
+        missing_aliases.delete(alias)
+        recently_written.set(alias, True)
+    elif event == "added":
+        missing_aliases.delete(alias)
+        recently_written.set(alias, True)
+        if alias_filter is not None and not alias_filter.shared:
+            await alias_filter.add(alias)
+    else:
+        logger.warning(f"Unknown alias event: {message}")
+
+
+async def publish_alias_event(event: str, alias: str):
+    """Broadcast an alias event to every worker, including this one"""
+    try:
+        return await redis_cache.publish(ALIAS_EVENTS_CHANNEL, f"{event}:{alias}")
+    except Exception as e:
+        logger.error(f"Failed to publish alias event: {e}")
+
+
+async def publish_alias_events(event: str, aliases: list[str]):
+    """Broadcast the same event for many aliases with one pipelined round trip"""
+    try:
+        pipe = redis_cache.pipeline(transaction=False)
+        for alias in aliases:
+            pipe.publish(ALIAS_EVENTS_CHANNEL, f"{event}:{alias}")
+        return await pipe.execute()
+    except Exception as e:
+        logger.error(f"Failed to publish alias events: {e}")
+
+
+async def listen_for_alias_events(retry_delay: float = 1.0):
+    """
+    Long running task that applies alias events published by any worker.
+
+    Messages sent while disconnected are lost, so the whole cache is
+    dropped every time the subscription is (re)established, and a
+    worker-local Bloom filter is disabled until it has been rebuilt.
+    """
+    while True:
+        pubsub = redis_cache.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(ALIAS_EVENTS_CHANNEL)
+            alias_cache.clear()
+            missing_aliases.clear()
+            alias_events_subscribed.set()
+            logger.info(f"Subscribed to {ALIAS_EVENTS_CHANNEL}")
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await handle_alias_event(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Alias events subscription lost: {e}")
+            await asyncio.sleep(retry_delay)
+        finally:
+            alias_events_subscribed.clear()
+            if alias_filter is not None and not alias_filter.shared:
+                alias_filter.ready = False
+            await pubsub.aclose()
@@ -1,13 +1,47 @@
+import asyncio
 import logging
+from itertools import count
+from time import monotonic
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 from app.core.config import settings
+from app.core.metrics import CallbackMetric, instrument_engine
 
 logger = logging.getLogger(__name__)
 
+# Sync driver -> async driver used by the API engine
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(db_url: str) -> str:
+    """Return the async-driver variant of a sync database url"""
+    url = make_url(db_url)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
 class DatabaseManager:
+    """
+    Holds the process wide engines.
+
+    The sync engine is kept for sqladmin and alembic only, everything that
+    runs inside the event loop must use the async engine. Read-only queries
+    may use a replica engine from get_read_db_instance.
+    """
     _db_instance = None
+    _async_db_instance = None
+    _replica_instances = None
+    # replica engine -> monotonic time it may be used again
+    _replica_down_until = {}
+    _replica_turn = count()
 
     @classmethod
     def get_db_instance(cls):
@@ -24,9 +58,138 @@ class DatabaseManager:
 
         return _engine
 
+    @classmethod
+    def get_async_db_instance(cls):
+        if cls._async_db_instance is None:
+            cls._async_db_instance = cls._create_async_db_instance()
+        return cls._async_db_instance
+
+    @staticmethod
+    def _create_async_db_instance(db_url: str = None):
+        db_url = db_url or settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL)
+
+        _engine = create_async_engine(
+            db_url,
+            echo=False,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+        instrument_engine(_engine)
+        logger.info(f"Async engine created for: {make_url(db_url).render_as_string()}")
+
+        return _engine
+
+    @classmethod
+    def get_replica_instances(cls) -> list:
+        if cls._replica_instances is None:
+            urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+            cls._replica_instances = [cls._create_async_db_instance(to_async_url(url)) for url in urls]
+        return cls._replica_instances
+
+    @classmethod
+    def get_read_db_instance(cls):
+        """
+        Engine for read-only queries: a healthy replica picked according to
+        DB_REPLICA_POLICY, or the primary when there is none.
+        """
+        now = monotonic()
+        replicas = [
+            engine for engine in cls.get_replica_instances()
+            if cls._replica_down_until.get(engine, 0) <= now
+        ]
+        if not replicas:
+            return cls.get_async_db_instance()
+        if settings.DB_REPLICA_POLICY == "least_connections":
+            return min(replicas, key=lambda engine: engine.pool.checkedout())
+        return replicas[next(cls._replica_turn) % len(replicas)]
+
+    @classmethod
+    def mark_unhealthy(cls, engine):
+        """Stop reading from a replica for DB_REPLICA_RETRY_AFTER seconds"""
+        cls._replica_down_until[engine] = monotonic() + settings.DB_REPLICA_RETRY_AFTER
+        logger.warning(
+            f"Replica {engine.url.render_as_string()} marked unhealthy "
+            f"for {settings.DB_REPLICA_RETRY_AFTER}s"
+        )
+
     @classmethod
     def get_session(cls):
         engine = cls.get_db_instance()
         return Session(engine)
 
+    @classmethod
+    def get_async_session(cls):
+        engine = cls.get_async_db_instance()
+        return AsyncSession(engine, expire_on_commit=False)
+
+    @classmethod
+    async def warm_up(cls, connections: int) -> int:
+        """Open up to `connections` pooled connections of the primary and of every replica"""
+        connections = min(connections, settings.DB_POOL_SIZE)
+        total = 0
+        for engine in [cls.get_async_db_instance(), *cls.get_replica_instances()]:
+            results = await asyncio.gather(
+                *(engine.connect().start() for _ in range(connections)), return_exceptions=True
+            )
+            opened = [result for result in results if not isinstance(result, BaseException)]
+            # Closing returns them to the pool, still open
+            await asyncio.gather(*(connection.close() for connection in opened))
+            total += len(opened)
+            if len(opened) < len(results):
+                error = next(result for result in results if isinstance(result, BaseException))
+                if engine is cls._async_db_instance:
+                    raise error
+                cls.mark_unhealthy(engine)
+        return total
+
+    @classmethod
+    async def dispose(cls):
+        """Close every pooled connection, called on application shutdown"""
+        if cls._async_db_instance is not None:
+            await cls._async_db_instance.dispose()
+            cls._async_db_instance = None
+        for engine in cls._replica_instances or []:
+            await engine.dispose()
+        cls._replica_instances = None
+        cls._replica_down_until.clear()
+        if cls._db_instance is not None:
+            cls._db_instance.dispose()
+            cls._db_instance = None
+
+
+    @classmethod
+    def after_fork(cls):
+        """
+        Drop the connections inherited from the parent process without
+        closing them, they still belong to the parent.
+        """
+        for engine in [cls._async_db_instance, *(cls._replica_instances or [])]:
+            if engine is not None:
+                engine.sync_engine.dispose(close=False)
+        if cls._db_instance is not None:
+            cls._db_instance.dispose(close=False)
+
+
+def _pool_stats():
+    engines = {"primary": DatabaseManager._async_db_instance}
+    for number, engine in enumerate(DatabaseManager._replica_instances or []):
+        engines[f"replica{number}"] = engine
+    stats = {}
+    for label, engine in engines.items():
+        if engine is None:
+            continue
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            if hasattr(engine.pool, name):
+                stats[(label, name)] = getattr(engine.pool, name)()
+    return stats
+
 
+CallbackMetric(
+    "miniurl_db_pool_connections",
+    "Connections of the async engine pools by state",
+    "gauge",
+    _pool_stats,
+    labelnames=("engine", "state"),
+)
@@ -1,21 +1,71 @@
 import logging
 from typing import Optional
-from datetime import datetime, UTC
+from datetime import date, datetime, UTC
 from sqlmodel import SQLModel, Field
+from sqlalchemy import BigInteger, Index, Integer, text
 from sqlalchemy.sql import func
 
 logger = logging.getLogger(__name__)
 
 class Urls(SQLModel, table=True):
+    # On Postgres the table is hash partitioned on alias and its primary key
+    # is (id, alias), id stays unique as it comes from urls_id_seq
     id: Optional[int] = Field(default=None, primary_key=True)
     alias: str = Field(unique=True, index=True)
     original_url: str
     description: Optional[str] = Field(default=None, nullable=True)
     created_at: datetime = Field(
-        default_factory=lambda: datetime.now(UTC),
+        # Naive UTC, asyncpg rejects aware datetimes for timestamp columns
+        default_factory=lambda: datetime.now(UTC).replace(tzinfo=None),
         sa_column_kwargs={"server_default": func.now()}
     )
     total_clicks: int = Field(default=0)
+    # Naive UTC, redirects answer 410 Gone after it, the purge worker deletes the row later
+    expires_at: Optional[datetime] = Field(default=None, nullable=True)
+
+    __table_args__ = (
+        # Only expiring links are indexed, for the purge worker
+        Index("ix_urls_expires_at", "expires_at", postgresql_where=text("expires_at IS NOT NULL")),
+    )
+
+class ClickEvent(SQLModel, table=True):
+    """One redirect, written by the click aggregator from the click stream"""
+    __tablename__ = "click_events"
+
+    # SQLite only autoincrements INTEGER primary keys
+    id: Optional[int] = Field(
+        default=None, primary_key=True, sa_type=BigInteger().with_variant(Integer, "sqlite")
+    )
+    # Generated when the click happens, makes redelivered events harmless
+    event_id: str = Field(unique=True, max_length=32)
+    alias: str = Field(index=True)
+    clicked_at: datetime = Field(index=True)
+    referrer: Optional[str] = Field(default=None, nullable=True)
+    user_agent: Optional[str] = Field(default=None, nullable=True)
+    country: Optional[str] = Field(default=None, nullable=True, max_length=2)
+
+class ClickHourly(SQLModel, table=True):
+    __tablename__ = "click_rollups_hourly"
+
+    alias: str = Field(primary_key=True)
+    hour: datetime = Field(primary_key=True)
+    clicks: int = Field(default=0)
+
+class ClickDaily(SQLModel, table=True):
+    __tablename__ = "click_rollups_daily"
+
+    alias: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    clicks: int = Field(default=0)
+
+class ClickCountryDaily(SQLModel, table=True):
+    __tablename__ = "click_rollups_country_daily"
+
+    alias: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    # Empty when the country is unknown
+    country: str = Field(primary_key=True, max_length=2)
+    clicks: int = Field(default=0)
 
 class User(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
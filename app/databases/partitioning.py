@@ -0,0 +1,210 @@
+"""
+Online move of the urls table to a table hash partitioned on alias (Postgres).
+
+The alembic migration creates the partitioned table as urls_partitioned and
+a trigger mirroring every write to urls into it. The existing rows are then
+copied in small batches while the app keeps running, and the tables are
+swapped in one short transaction:
+
+    python -m app.databases.partitioning copy --batch-size 10000
+    python -m app.databases.partitioning swap
+
+Migrations adding urls columns while the move is in progress add them to
+both tables and redefine the trigger with create_mirror_function.
+
+The old table is kept as urls_unpartitioned until it is dropped by hand.
+"""
+import argparse
+import logging
+import logging.config
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = "id, alias, original_url, description, created_at, total_clicks, expires_at"
+# The urls columns before expires_at was added (revision e5a7c3b9d1f2), the
+# ones the mirror trigger of the earlier migrations knows about
+INITIAL_COLUMNS = "id, alias, original_url, description, created_at, total_clicks"
+
+
+def is_partitioned(connection, table: str = "urls") -> bool:
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": table},
+    ).scalar()
+
+
+def table_exists(connection, table: str) -> bool:
+    return connection.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table}).scalar()
+
+
+def create_partitioned_table(connection, partitions: int):
+    """
+    urls_partitioned with the urls columns and `partitions` hash partitions.
+    Unique keys of a partitioned table must contain the partition key, so the
+    primary key becomes (id, alias); ids still come from urls_id_seq.
+    """
+    connection.execute(text(
+        "CREATE TABLE urls_partitioned ("
+        " id INTEGER NOT NULL DEFAULT nextval('urls_id_seq'),"
+        " alias VARCHAR NOT NULL,"
+        " original_url VARCHAR NOT NULL,"
+        " description VARCHAR,"
+        " created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),"
+        " total_clicks INTEGER NOT NULL,"
+        " expires_at TIMESTAMP WITHOUT TIME ZONE,"
+        " CONSTRAINT urls_partitioned_pkey PRIMARY KEY (id, alias)"
+        ") PARTITION BY HASH (alias)"
+    ))
+    connection.execute(text("CREATE UNIQUE INDEX ix_urls_partitioned_alias ON urls_partitioned (alias)"))
+    create_expires_at_index(connection, "urls_partitioned")
+    for remainder in range(partitions):
+        connection.execute(text(
+            f"CREATE TABLE urls_p{remainder} PARTITION OF urls_partitioned "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        ))
+
+
+def create_expires_at_index(connection, table: str):
+    """Partial index of the expiring urls, read by the purge worker"""
+    connection.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_expires_at ON {table} (expires_at) WHERE expires_at IS NOT NULL"
+    ))
+
+
+def create_mirror_function(connection, columns: str = COLUMNS):
+    """
+    (Re)define the trigger function copying `columns` of every urls write,
+    the columns both tables have at that revision.
+    """
+    names = [name.strip() for name in columns.split(",")]
+    updates = ",\n".join(f"                    {name} = EXCLUDED.{name}" for name in names if name != "alias")
+    connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION urls_mirror_to_partitioned() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.alias <> NEW.alias) THEN
+                DELETE FROM urls_partitioned WHERE alias = OLD.alias;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO urls_partitioned ({columns})
+                VALUES ({", ".join(f"NEW.{name}" for name in names)})
+                ON CONFLICT (alias) DO UPDATE SET
+{updates};
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+
+
+def create_mirror_trigger(connection, columns: str = COLUMNS):
+    """Apply every insert, update and delete of urls to urls_partitioned too"""
+    create_mirror_function(connection, columns)
+    connection.execute(text(
+        "CREATE TRIGGER urls_mirror AFTER INSERT OR UPDATE OR DELETE ON urls "
+        "FOR EACH ROW EXECUTE FUNCTION urls_mirror_to_partitioned()"
+    ))
+
+
+def drop_mirror_trigger(connection):
+    connection.execute(text("DROP TRIGGER IF EXISTS urls_mirror ON urls"))
+    connection.execute(text("DROP FUNCTION IF EXISTS urls_mirror_to_partitioned()"))
+
+
+def copy_batch(connection, after_id: int, batch_size: int) -> tuple[int, int]:
+    """
+    Copy the next batch_size rows with an id above after_id, returns
+    (last id copied, rows read). The rows are share locked until commit, so
+    an update or delete racing the copy waits and its trigger runs after it.
+    Rows the trigger already mirrored are left alone.
+    """
+    last_id, rows = connection.execute(
+        text(
+            f"WITH batch AS ("
+            f" SELECT {COLUMNS} FROM urls WHERE id > :after_id ORDER BY id LIMIT :batch_size FOR SHARE"
+            f"), copied AS ("
+            f" INSERT INTO urls_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM batch"
+            f" ON CONFLICT (alias) DO NOTHING"
+            f") SELECT max(id), count(*) FROM batch"
+        ),
+        {"after_id": after_id, "batch_size": batch_size},
+    ).one()
+    return last_id or after_id, rows
+
+
+def copy_rows(engine, batch_size: int, after_id: int = 0, pause: float = 0) -> int:
+    """Copy every row of urls to urls_partitioned, one transaction per batch"""
+    copied = 0
+    while True:
+        with engine.begin() as connection:
+            after_id, rows = copy_batch(connection, after_id, batch_size)
+        copied += rows
+        if not rows:
+            return copied
+        logger.info(f"Copied {copied} urls, up to id {after_id}")
+        if pause:
+            time.sleep(pause)
+
+
+def swap_tables(connection, lock_timeout: str = "5s"):
+    """
+    Put urls_partitioned in place of urls. Takes an exclusive lock on urls
+    for the renames only, gives up after lock_timeout rather than queueing
+    every request behind a long running query.
+    """
+    connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    connection.execute(text("LOCK TABLE urls IN ACCESS EXCLUSIVE MODE"))
+    drop_mirror_trigger(connection)
+    for statement in (
+        "ALTER TABLE urls RENAME TO urls_unpartitioned",
+        "ALTER INDEX urls_pkey RENAME TO urls_unpartitioned_pkey",
+        "ALTER INDEX ix_urls_alias RENAME TO ix_urls_unpartitioned_alias",
+        # Missing before the expires_at migration
+        "ALTER INDEX IF EXISTS ix_urls_expires_at RENAME TO ix_urls_unpartitioned_expires_at",
+        "ALTER TABLE urls_partitioned RENAME TO urls",
+        "ALTER INDEX urls_partitioned_pkey RENAME TO urls_pkey",
+        "ALTER INDEX ix_urls_partitioned_alias RENAME TO ix_urls_alias",
+        "ALTER INDEX IF EXISTS ix_urls_partitioned_expires_at RENAME TO ix_urls_expires_at",
+        # Dropping the old table must not drop the sequence with it
+        "ALTER SEQUENCE urls_id_seq OWNED BY urls.id",
+    ):
+        connection.execute(text(statement))
+
+
+def main(argv=None):
+    from app.databases.manager import DatabaseManager
+    from app.loggers import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Move the urls table to its hash partitioned copy")
+    commands = parser.add_subparsers(dest="command", required=True)
+    copy = commands.add_parser("copy", help="copy the existing rows in batches, safe to rerun")
+    copy.add_argument("--batch-size", type=int, default=10000)
+    copy.add_argument("--after-id", type=int, default=0, help="resume after this id")
+    copy.add_argument("--pause", type=float, default=0, help="seconds to sleep between batches")
+    swap = commands.add_parser("swap", help="replace urls with the partitioned table")
+    swap.add_argument("--lock-timeout", default="5s")
+    args = parser.parse_args(argv)
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    logger.setLevel(logging.INFO)
+    engine = DatabaseManager.get_db_instance()
+    with engine.connect() as connection:
+        if is_partitioned(connection):
+            logger.warning("urls is already partitioned, nothing to do")
+            return
+        if not table_exists(connection, "urls_partitioned"):
+            parser.error("urls_partitioned doesn't exist, run the alembic migrations first")
+
+    if args.command == "copy":
+        copied = copy_rows(engine, args.batch_size, args.after_id, args.pause)
+        logger.warning(f"Copied {copied} urls, run `swap` next")
+    else:
+        with engine.begin() as connection:
+            swap_tables(connection, args.lock_timeout)
+        logger.warning("urls is now hash partitioned on alias, drop urls_unpartitioned once happy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import delete, text, tuple_
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import CallbackMetric
+from app.databases.general import DBActions, invalidate_aliases
+from app.databases.models import ClickCountryDaily, ClickDaily, ClickEvent, ClickHourly, Urls
+from app.databases.redis import acquire_lock
+from app.databases.stats import drop_cached_stats
+
+logger = logging.getLogger(__name__)
+
+# Click data kept per alias, deleted with the url so a reused alias starts with no stats
+CLICK_TABLES = (ClickEvent, ClickHourly, ClickDaily, ClickCountryDaily)
+
+# Postgres lock_not_available, raised when lock_timeout runs out
+LOCK_NOT_AVAILABLE = "55P03"
+
+# Totals of this worker's purges
+purge_status = {"purged": 0, "skipped_batches": 0, "last_run": None}
+CallbackMetric(
+    "miniurl_expired_urls_purged_total",
+    "Expired urls deleted by this worker's purges",
+    "counter",
+    lambda: {(): purge_status["purged"]},
+)
+
+
+def is_lock_timeout(exc: DBAPIError) -> bool:
+    return LOCK_NOT_AVAILABLE in (getattr(exc.orig, "sqlstate", None), getattr(exc.orig, "pgcode", None))
+
+
+async def purge_expired(
+    retention: int = None, batch_size: int = None, lock_timeout: str = None, db_session=None
+) -> int:
+    """
+    Delete the urls that expired more than `retention` seconds ago, batch_size
+    rows per transaction so no transaction holds many row locks or runs long.
+
+    Batches are found by keyset pagination on (expires_at, id) over the
+    partial expires_at index. On Postgres a batch whose rows stay locked
+    (e.g. by a running click flush) longer than lock_timeout is skipped, the
+    next run retries it. The click events and rollups of the deleted aliases
+    go in the same transaction, and the aliases and their cached stats are
+    dropped from every cache tier.
+    Returns the number of urls deleted.
+    """
+    retention = settings.EXPIRED_URLS_RETENTION if retention is None else retention
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    lock_timeout = lock_timeout or settings.PURGE_LOCK_TIMEOUT
+    engine = db_session or DBActions().db_session
+    cutoff = datetime.now(UTC).replace(tzinfo=None) - timedelta(seconds=retention)
+
+    purged = 0
+    cursor = None
+    while True:
+        statement = (
+            select(Urls.expires_at, Urls.id, Urls.alias)
+            .where(Urls.expires_at < cutoff)
+            .order_by(Urls.expires_at, Urls.id)
+            .limit(batch_size)
+        )
+        if cursor is not None:
+            statement = statement.where(tuple_(Urls.expires_at, Urls.id) > cursor)
+        async with AsyncSession(engine) as session:
+            rows = (await session.exec(statement)).all()
+        if not rows:
+            break
+        cursor = tuple(rows[-1][:2])
+
+        # By alias, the partition key, and checked again in case the expiry was pushed back since
+        statement = (
+            delete(Urls)
+            .where(Urls.alias.in_([alias for _, _, alias in rows]), Urls.expires_at < cutoff)
+            .returning(Urls.alias)
+        )
+        try:
+            async with AsyncSession(engine) as session:
+                if engine.dialect.name == "postgresql":
+                    await session.exec(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+                deleted = list((await session.exec(statement)).scalars())
+                if deleted:
+                    for table in CLICK_TABLES:
+                        await session.exec(delete(table).where(table.alias.in_(deleted)))
+                await session.commit()
+        except DBAPIError as exc:
+            if not is_lock_timeout(exc):
+                raise
+            purge_status["skipped_batches"] += 1
+            logger.warning(f"Skipping {len(rows)} expired urls, their rows stayed locked over {lock_timeout}")
+            continue
+
+        await asyncio.gather(invalidate_aliases(deleted), drop_cached_stats(deleted))
+        purged += len(deleted)
+        purge_status["purged"] += len(deleted)
+        if len(rows) < batch_size:
+            break
+
+    purge_status["last_run"] = datetime.now(UTC).isoformat()
+    if purged:
+        logger.info(f"Purged {purged} expired urls")
+    return purged
+
+
+async def run_purge_worker(interval: float = None):
+    """
+    Long running task purging expired urls every interval seconds. The lock
+    isn't released, so only one worker purges per interval.
+    """
+    interval = settings.PURGE_INTERVAL if interval is None else interval
+    if not interval:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await acquire_lock("lock:purge", ttl_ms=int(interval * 1000)):
+                await purge_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Purging expired urls failed: {e}")
@@ -1,13 +1,21 @@
+import asyncio
+import bisect
+import hashlib
 import logging
+import secrets
 import redis.asyncio as redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
 
 from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.databases.compact_cache import BucketedCache
+from app.databases.ttl import adaptive_ttl, cap_ttl
 
 
 logger = logging.getLogger(__name__)
 
 # Cache Redis clients, based on environment settings
-def setup_redis(url: str, port: int, db: int, use_ssl: bool = False, password: str = None):
+def create_redis(url: str, port: int, db: int, use_ssl: bool = False, password: str = None):
     client = redis.Redis(
         host=url,
         port=port,
@@ -16,43 +24,515 @@ def setup_redis(url: str, port: int, db: int, use_ssl: bool = False, password: s
         ssl=use_ssl,
         password=password,
     )
-    logger.info(f"Redis connected to: url:{url} port:{port}")
+    logger.info(f"Redis client created for: url:{url} port:{port}")
     return client
 
+
+class LazyClient:
+    """
+    Stands in for a client that is only created on first use, or by
+    setup_redis(), so importing this module creates no client.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+
+    def get(self):
+        if self._client is None:
+            self._client = self._factory()
+        return self._client
+
+    @property
+    def created(self) -> bool:
+        return self._client is not None
+
+    def reset(self):
+        """Forget the client without closing it, e.g. one inherited by a forked worker"""
+        self._client = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
 # Cache Redis (non-persistent)
-redis_cache = setup_redis(
+redis_cache = LazyClient(lambda: create_redis(
     url=settings.REDIS_CACHE_HOST,
     port=settings.REDIS_CACHE_PORT,
     db=settings.REDIS_CACHE_DB,
     use_ssl=settings.REDIS_CACHE_USE_SSL,
     password=settings.REDIS_CACHE_PASSWORD,
-)
+))
+
+
+def parse_nodes(nodes: str) -> list[tuple[str, int]]:
+    """'a:6379,b:6380' -> [('a', 6379), ('b', 6380)]"""
+    parsed = []
+    for node in nodes.split(","):
+        if node.strip():
+            host, _, port = node.strip().rpartition(":")
+            parsed.append((host, int(port)))
+    return parsed
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes. Every node owns `replicas` points
+    of the ring, so adding or removing a node only moves the keys of its
+    own points, about 1/n of them.
+    """
+
+    def __init__(self, nodes: list[str], replicas: int = 160):
+        self._points = sorted((self.hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        # Stable across processes, unlike hash()
+        return int.from_bytes(hashlib.md5(key.encode(), usedforsecurity=False).digest()[:8], "big")
+
+    def get_node(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, self.hash(key)) % len(self._hashes)
+        return self._points[index][1]
+
+
+class ShardedRedis:
+    """
+    Cache keys spread over standalone Redis nodes by consistent hashing.
+
+    Batch operations send one MGET or one pipeline per node, all nodes
+    concurrently. A node that fails only fails its own keys.
+    """
+
+    # Every key expires on its own, at the second
+    exact_expiry = True
+
+    def __init__(self, clients: dict[str, redis.Redis]):
+        self.clients = clients
+        self.ring = HashRing(list(clients))
+
+    async def nodes(self) -> list[str]:
+        return list(self.clients)
+
+    def node_for(self, key: str) -> str:
+        return self.ring.get_node(key)
+
+    def group_by_node(self, keys) -> dict[str, list]:
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.node_for(key), []).append(key)
+        return groups
+
+    async def get(self, key: str):
+        return await self.clients[self.node_for(key)].get(key)
+
+    async def set(self, name: str, value, **kwargs):
+        return await self.clients[self.node_for(name)].set(name, value, **kwargs)
+
+    async def delete(self, key: str):
+        return await self.clients[self.node_for(key)].delete(key)
+
+    async def mget(self, keys: list) -> list:
+        groups = self.group_by_node(keys)
+        results = await asyncio.gather(*(self.clients[node].mget(group) for node, group in groups.items()))
+        values = {}
+        for group, group_values in zip(groups.values(), results):
+            values.update(zip(group, group_values))
+        return [values[key] for key in keys]
+
+    async def run_pipelined(self, commands: list) -> list:
+        """
+        Run (key, add) pairs, add(pipeline, key) queues the commands of that
+        key. One pipeline per node, returns the list of results of every
+        pair's commands, None for the commands of a node that failed.
+        """
+        groups = {}
+        for index, (key, _) in enumerate(commands):
+            groups.setdefault(self.node_for(key), []).append(index)
 
+        async def send(node, indexes):
+            pipe = self.clients[node].pipeline(transaction=False)
+            sizes = []
+            for index in indexes:
+                key, add = commands[index]
+                queued = len(pipe)
+                add(pipe, key)
+                sizes.append(len(pipe) - queued)
+            try:
+                return sizes, await pipe.execute()
+            except Exception as e:
+                logger.error(f"Failed to run {len(pipe)} commands on Redis node {node}: {e}")
+                return sizes, [None] * sum(sizes)
 
-async def save_to_cache(key: str, value: str, expire: int = 86400):
+        results = [None] * len(commands)
+        for indexes, (sizes, values) in zip(
+            groups.values(), await asyncio.gather(*(send(node, indexes) for node, indexes in groups.items()))
+        ):
+            values = iter(values)
+            for index, size in zip(indexes, sizes):
+                results[index] = [next(values) for _ in range(size)]
+        return results
+
+    async def get_with_ttl(self, key: str):
+        """The value of key and its remaining time to live in ms, one round trip"""
+        ((value, ttl),) = await self.run_pipelined([(key, lambda pipe, key: pipe.get(key).pttl(key))])
+        return value, ttl
+
+    async def set_many(self, items: dict, expire, nx: bool = True) -> list:
+        """
+        SET every item, returns the SET results in the order of items.
+        `expire` is in seconds, the same for every key or a dict of key -> seconds.
+        """
+        results = await self.run_pipelined([
+            (key, lambda pipe, key, value=value: pipe.set(
+                name=key, value=value, ex=expire[key] if isinstance(expire, dict) else expire, nx=nx
+            ))
+            for key, value in items.items()
+        ])
+        return [result[0] for result in results]
+
+    async def delete_many(self, keys: list) -> int:
+        results = await self.run_pipelined([(key, lambda pipe, key: pipe.delete(key)) for key in keys])
+        return sum(result[0] or 0 for result in results)
+
+    async def scan(self, node: str, cursor: int, match: str = None, count: int = None, _type: str = None):
+        return await self.clients[node].scan(cursor, match=match, count=count, _type=_type)
+
+    async def scan_urls(self, node: str, cursor: int, match: str = None, count: int = None):
+        """
+        One SCAN step over the cached urls of node, returns the next cursor
+        and a list of (alias, url). Url keys are the bare aliases, every
+        other key the app writes has a "<namespace>:" prefix and is skipped.
+        """
+        cursor, keys = await self.scan(node, cursor, match=match, count=count, _type="string")
+        keys = [key for key in keys if ":" not in key]
+        values = await self.node_mget(node, keys) if keys else []
+        return cursor, [(key, value) for key, value in zip(keys, values) if value is not None]
+
+    async def node_mget(self, node: str, keys: list) -> list:
+        """MGET of keys known to live on node, as returned by scan"""
+        return await self.clients[node].mget(keys)
+
+    async def ping(self, node: str) -> bool:
+        return await self.clients[node].ping()
+
+    async def run_id(self, node: str) -> str:
+        return (await self.clients[node].info("server"))["run_id"]
+
+    async def read_write_check(self, node: str) -> bool:
+        client = self.clients[node]
+        await client.set("health:check", "ok", ex=5)
+        return await client.get("health:check") == "ok"
+
+    async def warm_up(self, connections: int) -> int:
+        opened = 0
+        for client in self.clients.values():
+            if client is not redis_cache:
+                opened += await warm_up_pool(client.connection_pool, connections)
+        return opened
+
+    async def aclose(self):
+        for client in self.clients.values():
+            if client is not redis_cache:
+                await client.aclose()
+
+
+class ClusterRedis(ShardedRedis):
+    """
+    Cache keys on a Redis Cluster. The cluster client routes every key to
+    the primary owning its hash slot and splits MGETs and pipelines per node.
+    """
+
+    def __init__(self, cluster: RedisCluster):
+        self.cluster = cluster
+
+    async def _primaries(self) -> dict[str, ClusterNode]:
+        await self.cluster.initialize()
+        return {node.name: node for node in self.cluster.get_primaries()}
+
+    async def nodes(self) -> list[str]:
+        return list(await self._primaries())
+
+    def node_for(self, key: str) -> str:
+        return self.cluster.get_node_from_key(key).name
+
+    async def get(self, key: str):
+        return await self.cluster.get(key)
+
+    async def set(self, name: str, value, **kwargs):
+        return await self.cluster.set(name, value, **kwargs)
+
+    async def delete(self, key: str):
+        return await self.cluster.delete(key)
+
+    async def mget(self, keys: list) -> list:
+        return await self.cluster.mget_nonatomic(keys)
+
+    async def run_pipelined(self, commands: list) -> list:
+        pipe = self.cluster.pipeline()
+        sizes = []
+        for key, add in commands:
+            queued = len(pipe)
+            add(pipe, key)
+            sizes.append(len(pipe) - queued)
+        values = iter(await pipe.execute(raise_on_error=False))
+        return [
+            [None if isinstance(value, Exception) else value for value in (next(values) for _ in range(size))]
+            for size in sizes
+        ]
+
+    async def _on(self, node: str, *args):
+        return await self.cluster.execute_command(*args, target_nodes=(await self._primaries())[node])
+
+    async def scan(self, node: str, cursor: int, match: str = None, count: int = None, _type: str = None):
+        cursors, keys = await self.cluster.scan(
+            cursor, match=match, count=count, _type=_type, target_nodes=(await self._primaries())[node]
+        )
+        return cursors[node], keys
+
+    async def node_mget(self, node: str, keys: list) -> list:
+        # Keys of different slots can't share one MGET, even on the same node
+        return await self.cluster.mget_nonatomic(keys)
+
+    async def ping(self, node: str) -> bool:
+        return await self._on(node, "PING")
+
+    async def run_id(self, node: str) -> str:
+        return (await self._on(node, "INFO", "server"))["run_id"]
+
+    async def read_write_check(self, node: str) -> bool:
+        # A key whose slot this node owns
+        key = next(
+            f"health:check:{{{number}}}" for number in range(100_000)
+            if self.node_for(f"health:check:{{{number}}}") == node
+        )
+        await self.cluster.set(key, "ok", ex=5)
+        return await self.cluster.get(key) == "ok"
+
+    async def warm_up(self, connections: int) -> int:
+        return len(await self._primaries())
+
+    async def aclose(self):
+        await self.cluster.aclose()
+
+
+def setup_cache_nodes() -> ShardedRedis:
+    nodes = parse_nodes(settings.REDIS_CACHE_NODES)
+    options = dict(
+        decode_responses=True,
+        ssl=settings.REDIS_CACHE_USE_SSL,
+        password=settings.REDIS_CACHE_PASSWORD or None,
+    )
+    if settings.REDIS_CACHE_CLUSTER:
+        return ClusterRedis(RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in nodes], **options
+        ))
+    main_node = (settings.REDIS_CACHE_HOST, settings.REDIS_CACHE_PORT)
+    return ShardedRedis({
+        f"{host}:{port}": redis_cache if (host, port) == main_node
+        else redis.Redis(host=host, port=port, db=settings.REDIS_CACHE_DB, **options)
+        for host, port in nodes or [main_node]
+    })
+
+
+# Cached aliases and stats, the main Redis node alone unless REDIS_CACHE_NODES is set
+cache_nodes = LazyClient(setup_cache_nodes)
+
+
+def setup_url_cache(nodes: ShardedRedis):
+    """Cached urls as one key per alias, or as fields of bucketed hashes"""
+    if settings.CACHE_ENCODING == "buckets":
+        return BucketedCache(
+            nodes,
+            buckets=settings.CACHE_BUCKETS,
+            ttl=settings.CACHE_BUCKET_TTL,
+            compress=settings.CACHE_COMPRESSION,
+        )
+    return nodes
+
+
+url_cache = LazyClient(lambda: setup_url_cache(cache_nodes))
+
+
+def setup_redis():
+    """Create the Redis clients not created yet, called by the lifespan before serving"""
+    for client in (redis_cache, cache_nodes, url_cache):
+        # Left alone when replaced by an other client, e.g. fakeredis in the benchmarks
+        if isinstance(client, LazyClient):
+            client.get()
+
+
+def reset_redis():
+    """Drop the Redis clients inherited from the parent process, in a forked worker"""
+    for client in (redis_cache, cache_nodes, url_cache):
+        if isinstance(client, LazyClient):
+            client.reset()
+
+
+async def warm_up_pool(pool, connections: int) -> int:
+    opened = [await pool.get_connection() for _ in range(connections)]
+    for connection in opened:
+        await pool.release(connection)
+    return len(opened)
+
+
+async def warm_up_redis(connections: int) -> int:
+    """Open `connections` connections of every Redis pool ahead of the first requests"""
+    return await warm_up_pool(redis_cache.connection_pool, connections) + await cache_nodes.warm_up(connections)
+
+
+async def save_to_cache(key: str, value: str, expire: int = None, expires_at=None):
     """
     Save a value to Redis cache.
 
     Args:
         key (str): The key under which the value will be stored.
         value (str): The value to store.
-        expire (int, optional): Expiration time in seconds. If None, no expiration.
+        expire (int, optional): Expiration time in seconds. Defaults to the
+            adaptive ttl of a link nobody clicked yet.
+        expires_at (datetime, optional): When the link expires, the entry
+            doesn't outlive it. Expiring links aren't cached by caches that
+            can't expire keys one by one (bucketed encoding).
     """
-    in_cache = await redis_cache.get(key)
+    if expires_at is not None:
+        expire = cap_ttl(expire or adaptive_ttl(0), expires_at)
+        if expire is None or not url_cache.exact_expiry:
+            return False
+
+    in_cache = await url_cache.get(key)
     if in_cache:
         logger.error(f"Collision! Key already exists in cache: {key}")
         return False
 
     try:
         logger.info(f"Saving to cache: {key}:{value}")
-        return await redis_cache.set(name=key, value=value, ex=expire)
+        return await url_cache.set(name=key, value=value, ex=expire or adaptive_ttl(0))
     except Exception as e:
         logger.error(f"Failed to save to Redis: {e}")
 
 
+async def save_many_to_cache(items: dict, expire=None, expires_at: dict = None):
+    """
+    Save many key/value pairs with one pipelined round trip per node.
+    Existing keys are left untouched, like save_to_cache does.
+    `expire` is in seconds, for every key or a dict of key -> seconds.
+    `expires_at` maps keys of expiring links to their expiry, see save_to_cache.
+    """
+    if expires_at:
+        expire = {key: (expire.get(key) if isinstance(expire, dict) else expire) or adaptive_ttl(0) for key in items}
+        for key, expiry in expires_at.items():
+            if key in expire and expiry is not None:
+                expire[key] = cap_ttl(expire[key], expiry) if url_cache.exact_expiry else None
+        items = {key: value for key, value in items.items() if expire[key] is not None}
+        if not items:
+            return []
+    try:
+        return await url_cache.set_many(items, expire=expire or adaptive_ttl(0), nx=True)
+    except Exception as e:
+        logger.error(f"Failed to save {len(items)} keys to Redis: {e}")
+
+
+async def replace_in_cache(key: str, value: str, expire: int):
+    """Overwrite a cached value and its expiry"""
+    try:
+        return await url_cache.set(name=key, value=value, ex=expire)
+    except Exception as e:
+        logger.error(f"Failed to replace {key} in Redis: {e}")
+
+
 async def get_from_cache(key):
     try:
-        return await redis_cache.get(key)
+        value = await url_cache.get(key)
     except Exception as e:
+        CACHE_REQUESTS.inc("redis", "error")
         logger.error(f"Failed to get from Redis: {e}")
-        return None
\ No newline at end of file
+        return None
+    CACHE_REQUESTS.inc("redis", "hit" if value else "miss")
+    return value
+
+
+async def get_from_cache_with_ttl(key):
+    """
+    The cached value and its remaining time to live in ms, (None, None) when
+    Redis fails. The ttl is None when the cache doesn't expire keys one by
+    one (bucketed encoding).
+    """
+    try:
+        value, ttl = await url_cache.get_with_ttl(key)
+    except Exception as e:
+        CACHE_REQUESTS.inc("redis", "error")
+        logger.error(f"Failed to get from Redis: {e}")
+        return None, None
+    CACHE_REQUESTS.inc("redis", "hit" if value else "miss")
+    return value, ttl
+
+
+async def delete_from_cache(key):
+    try:
+        return await url_cache.delete(key)
+    except Exception as e:
+        logger.error(f"Failed to delete from Redis: {e}")
+        return None
+
+
+async def delete_many_from_cache(keys: list):
+    """Delete many keys with one pipelined round trip per node"""
+    try:
+        return await url_cache.delete_many(keys)
+    except Exception as e:
+        logger.error(f"Failed to delete {len(keys)} keys from Redis: {e}")
+        return None
+
+
+# Delete the lock only if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def acquire_lock(name: str, ttl_ms: int):
+    """
+    Try to take a short lived lock shared by every worker.
+
+    Returns a token to release it with, or None if someone else holds it.
+    When Redis is unreachable a token is returned anyway so callers go on.
+    """
+    token = secrets.token_hex(8)
+    try:
+        if await redis_cache.set(name, token, nx=True, px=ttl_ms):
+            return token
+        return None
+    except Exception as e:
+        logger.error(f"Failed to acquire lock {name}: {e}")
+        return token
+
+
+async def set_fill_marker(name: str, value: str, ttl_ms: int):
+    """Tell the workers waiting on a cache fill lock how the fill ended"""
+    try:
+        return await redis_cache.set(name, value, px=ttl_ms)
+    except Exception as e:
+        logger.error(f"Failed to set {name}: {e}")
+
+
+async def get_fill_state(lock_name: str, marker_name: str):
+    """
+    (whether the lock is still held, fill marker) in one round trip.
+    (False, None) when Redis fails, waiting any longer is pointless.
+    """
+    try:
+        held, marker = await redis_cache.pipeline(transaction=False).exists(lock_name).get(marker_name).execute()
+    except Exception as e:
+        logger.error(f"Failed to check lock {lock_name}: {e}")
+        return False, None
+    return bool(held), marker
+
+
+async def release_lock(name: str, token: str):
+    try:
+        return await redis_cache.eval(RELEASE_LOCK_SCRIPT, 1, name, token)
+    except Exception as e:
+        logger.error(f"Failed to release lock {name}: {e}")
@@ -1,7 +1,28 @@
-from pydantic import BaseModel, HttpUrl, constr
+from datetime import UTC, datetime
+from pydantic import BaseModel, HttpUrl, conlist, constr, field_validator
 from typing import Optional
 
+from app.core.config import settings
+
 class UrlRequestRecord(BaseModel):
     url: HttpUrl
     preferred_alias: Optional[constr(min_length=5, max_length=20)] = None
     description: Optional[constr(max_length=255)] = None
+    # The link answers 410 Gone after it, naive values are UTC
+    expires_at: Optional[datetime] = None
+
+    @field_validator("expires_at")
+    @classmethod
+    def future_naive_utc(cls, value):
+        if value is None:
+            return None
+        if value.tzinfo is not None:
+            # Stored naive UTC like every timestamp column
+            value = value.astimezone(UTC).replace(tzinfo=None)
+        if value <= datetime.now(UTC).replace(tzinfo=None):
+            raise ValueError("expires_at must be in the future")
+        return value
+
+
+class UrlBatchRequest(BaseModel):
+    items: conlist(UrlRequestRecord, min_length=1, max_length=settings.MINIFY_BATCH_MAX)
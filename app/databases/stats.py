@@ -0,0 +1,87 @@
+import json
+import logging
+from datetime import datetime, timedelta, UTC
+
+from app.core.config import settings
+from app.databases.general import DBActions
+from app.databases.redis import cache_nodes
+
+logger = logging.getLogger(__name__)
+
+
+def stats_cache_key(alias: str, granularity: str, days: int) -> str:
+    return f"stats:{alias}:{granularity}:{days}"
+
+
+def stats_index_key(alias: str) -> str:
+    """Set of the alias' cached stats keys, so they can be dropped together"""
+    return f"stats:{alias}"
+
+
+def bucket_range(granularity: str, days: int, now: datetime = None) -> list:
+    """Start of every bucket of the window, oldest first, the current one included"""
+    now = (now or datetime.now(UTC)).replace(tzinfo=None)
+    if granularity == "hour":
+        current = now.replace(minute=0, second=0, microsecond=0)
+        step, count = timedelta(hours=1), days * 24
+    else:
+        current = now.date()
+        step, count = timedelta(days=1), days
+    return [current - step * i for i in range(count - 1, -1, -1)]
+
+
+async def compute_alias_stats(alias: str, granularity: str, days: int) -> dict:
+    """
+    Clicks per bucket and top countries from the rollup tables.
+    Reads one row per non empty bucket, whatever the number of clicks.
+    """
+    actions = DBActions()
+    buckets = bucket_range(granularity, days)
+    clicks = dict(await actions.get_click_buckets(alias, granularity, buckets[0]))
+    countries = await actions.get_click_countries(alias, buckets[0] if granularity == "day" else buckets[0].date())
+
+    series = [{"start": bucket.isoformat(), "clicks": clicks.get(bucket, 0)} for bucket in buckets]
+    return {
+        "alias": alias,
+        "granularity": granularity,
+        "from": buckets[0].isoformat(),
+        "to": buckets[-1].isoformat(),
+        "total": sum(point["clicks"] for point in series),
+        "buckets": series,
+        "countries": [{"country": country or None, "clicks": count} for country, count in countries],
+    }
+
+
+async def get_alias_stats(alias: str, granularity: str, days: int) -> dict:
+    """Same as compute_alias_stats, cached in Redis for STATS_CACHE_TTL seconds"""
+    key = stats_cache_key(alias, granularity, days)
+    try:
+        cached = await cache_nodes.get(key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        logger.error(f"Failed to read cached stats {key}: {e}")
+
+    stats = await compute_alias_stats(alias, granularity, days)
+    ttl = settings.STATS_CACHE_TTL
+    try:
+        await cache_nodes.run_pipelined([
+            (key, lambda pipe, key: pipe.set(key, json.dumps(stats), ex=ttl)),
+            (stats_index_key(alias), lambda pipe, index: pipe.sadd(index, key).expire(index, ttl)),
+        ])
+    except Exception as e:
+        logger.error(f"Failed to cache stats {key}: {e}")
+    return stats
+
+
+async def drop_cached_stats(aliases: list):
+    """Delete the cached stats of aliases, e.g. once their urls are purged"""
+    if not aliases:
+        return
+    indexes = [stats_index_key(alias) for alias in aliases]
+    try:
+        members = await cache_nodes.run_pipelined([(index, lambda pipe, key: pipe.smembers(key)) for index in indexes])
+        keys = [key for result in members if result and result[0] for key in result[0]]
+        await cache_nodes.delete_many(indexes + keys)
+    except Exception as e:
+        logger.error(f"Failed to drop the cached stats of {len(aliases)} aliases: {e}")
@@ -0,0 +1,51 @@
+import math
+import random
+from datetime import UTC, datetime
+
+from app.core.config import settings
+
+# Moving average of how long this worker takes to fill the cache from the
+# db, in seconds. The XFetch delta
+fill_seconds = 0.01
+
+
+def adaptive_ttl(total_clicks: int) -> int:
+    """
+    Seconds an alias stays cached: CACHE_TTL_MIN for a link nobody clicked,
+    growing with the square root of its clicks up to CACHE_TTL_MAX. Jittered
+    by 10% so aliases cached together don't expire together.
+    """
+    ttl = min(settings.CACHE_TTL_MAX, settings.CACHE_TTL_MIN * math.sqrt(1 + max(0, total_clicks or 0)))
+    return max(1, int(ttl * random.uniform(0.9, 1.1)))
+
+
+def cap_ttl(ttl: int, expires_at: datetime = None):
+    """
+    ttl in seconds, no longer than the link has left to live. None once the
+    link expired, it must not be cached at all.
+    """
+    if expires_at is None:
+        return ttl
+    left = (expires_at - datetime.now(UTC).replace(tzinfo=None)).total_seconds()
+    if left < 1:
+        return None
+    return min(ttl, int(left))
+
+
+def record_fill_duration(seconds: float):
+    global fill_seconds
+    fill_seconds += 0.1 * (seconds - fill_seconds)
+
+
+def should_refresh_early(ttl_ms, beta: float = None) -> bool:
+    """
+    XFetch (Vattani et al., "Optimal Probabilistic Cache Stampede
+    Prevention"): refresh when delta * beta * -ln(random) reaches the time
+    left. Unlikely far from the expiry, certain at it, so the more often an
+    alias is read the likelier one read refreshes it before it expires.
+    """
+    if ttl_ms is None or ttl_ms < 0:
+        # No expiry (-1) or already gone (-2)
+        return False
+    beta = settings.CACHE_XFETCH_BETA if beta is None else beta
+    return fill_seconds * 1000 * beta * -math.log(1.0 - random.random()) >= ttl_ms
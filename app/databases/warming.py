@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from time import perf_counter
+
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.databases.general import DBActions
+from app.databases.redis import acquire_lock, cache_nodes, save_many_to_cache
+from app.databases.ttl import adaptive_ttl
+
+logger = logging.getLogger(__name__)
+
+# Outcome of the last warming run of this worker
+warming_status = {"running": False, "loaded": 0, "written": 0, "duration": None, "run_id": None}
+
+
+async def warm_cache(top_n: int, recent_n: int, batch_size: int) -> dict:
+    """
+    Load the hottest and newest aliases from the db into Redis.
+
+    Rows are streamed and written with one pipelined SET NX EX per batch,
+    entries already in the cache are left untouched.
+    """
+    start = perf_counter()
+    warming_status.update(running=True, loaded=0, written=0, duration=None)
+    try:
+        async for rows in DBActions().iter_hot_urls(top_n, recent_n, batch_size=batch_size):
+            results = await save_many_to_cache(
+                {alias: url for alias, url, _, _ in rows},
+                expire={alias: adaptive_ttl(clicks) for alias, _, clicks, _ in rows},
+                expires_at={alias: expires_at for alias, _, _, expires_at in rows if expires_at},
+            ) or []
+            warming_status["loaded"] += len(rows)
+            warming_status["written"] += sum(1 for result in results if result)
+            logger.info(f"Cache warming: {warming_status['loaded']} aliases loaded")
+    finally:
+        warming_status.update(running=False, duration=round(perf_counter() - start, 3))
+    logger.info(
+        f"Cache warming done: {warming_status['loaded']} aliases loaded, "
+        f"{warming_status['written']} written in {warming_status['duration']}s"
+    )
+    return warming_status
+
+
+class RunIdUnavailable(Exception):
+    """Redis doesn't tell its run_id, e.g. INFO is disabled by the provider"""
+
+
+async def cache_run_id() -> str:
+    """run_id of every cache node, joined"""
+    nodes = await cache_nodes.nodes()
+    try:
+        return ",".join(await asyncio.gather(*(cache_nodes.run_id(node) for node in nodes)))
+    except (ResponseError, KeyError) as e:
+        raise RunIdUnavailable(str(e)) from e
+
+
+async def watch_redis_restarts(check_interval: float = None):
+    """
+    Long running task that warms the cache at startup and whenever Redis
+    restarted (its run_id changed). Only one worker warms per Redis run.
+    With several cache nodes a restart of any of them warms again, keys that
+    are still cached are left as they are. Stops when the run_id can't be
+    read, restarts can't be detected then.
+    """
+    if not settings.WARM_TOP_N and not settings.WARM_RECENT_N:
+        return
+    check_interval = check_interval or settings.WARM_CHECK_INTERVAL
+    run_id = None
+    while True:
+        try:
+            current = await cache_run_id()
+            if current != run_id:
+                # The lock outlives the warming on purpose, it is lost with the run
+                if await acquire_lock(f"lock:warming:{current}", ttl_ms=24 * 3600 * 1000):
+                    if run_id is not None:
+                        logger.warning(f"Redis restart detected (run_id {current}), warming the cache")
+                    warming_status["run_id"] = current
+                    await warm_cache(settings.WARM_TOP_N, settings.WARM_RECENT_N, settings.WARM_BATCH_SIZE)
+                run_id = current
+        except asyncio.CancelledError:
+            raise
+        except RunIdUnavailable as e:
+            logger.warning(f"Redis restart detection unavailable, the cache won't be warmed: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Cache warming failed: {e}")
+        await asyncio.sleep(check_interval)
@@ -1,5 +1,20 @@
 from fastapi import HTTPException, status
 
+class BadRequest(HTTPException):
+    def __init__(self, detail: str = "Bad request"):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
 class NotFound(HTTPException):
     def __init__(self, detail: str = "Not found"):
         super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class Conflict(HTTPException):
+    def __init__(self, detail: str = "Conflict"):
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+class Gone(HTTPException):
+    def __init__(self, detail: str = "Gone"):
+        super().__init__(status_code=status.HTTP_410_GONE, detail=detail)
@@ -1,19 +1,28 @@
+from time import perf_counter
+
+IMPORT_STARTED = perf_counter()
+
 import os
+import asyncio
 import logging.config
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-
-from sqladmin import Admin
-from fastapi.staticfiles import StaticFiles
-from starlette.responses import FileResponse
+from fastapi import FastAPI, Request
 
-from app.admin.admin import UrlsAdmin
 from app.api import base as api_endpoints
 from app.core.config import settings
-from app.core.rate_limit import limiter
+from app.core.fast_redirect import FastRedirectMiddleware
+from app.core.metrics import CallbackMetric, MetricsMiddleware
+from app.core.rate_limit import RateLimitExceeded, rate_limit_exceeded_handler
+from app.core.static_assets import StaticAssets
+from app.databases.bloom import maintain_alias_filter
+from app.databases.click_events import click_events
+from app.databases.clicks import click_buffer
+from app.databases.local_cache import alias_events_subscribed, listen_for_alias_events
 from app.databases.manager import DatabaseManager
+from app.databases.purge import run_purge_worker
+from app.databases.redis import cache_nodes, redis_cache, setup_redis, warm_up_redis
+from app.databases.warming import watch_redis_restarts
 from app.loggers import LOGGING_CONFIG
 from app.router import main_router
 
@@ -21,6 +30,51 @@ from app.router import main_router
 logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
+# Seconds spent importing this module and opening the pools, per worker
+startup_timings = {}
+
+
+async def warm_up_pools():
+    started = perf_counter()
+    try:
+        await DatabaseManager.warm_up(settings.DB_POOL_PREWARM)
+    except Exception as e:
+        logger.error(f"Failed to pre-open db connections: {e}")
+    try:
+        await warm_up_redis(settings.REDIS_POOL_PREWARM)
+    except Exception as e:
+        logger.error(f"Failed to pre-open Redis connections: {e}")
+    startup_timings["warm_up"] = perf_counter() - started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_redis()
+    await warm_up_pools()
+    logger.info(
+        f"Startup: imports {startup_timings['import']:.3f}s, "
+        f"pools warmed up in {startup_timings['warm_up']:.3f}s"
+    )
+    # Keep the per-worker alias cache coherent across workers
+    alias_events = asyncio.create_task(listen_for_alias_events())
+    alias_filter = asyncio.create_task(maintain_alias_filter(alias_events_subscribed))
+    click_flusher = asyncio.create_task(click_buffer.run())
+    click_event_flusher = asyncio.create_task(click_events.run())
+    cache_warmer = asyncio.create_task(watch_redis_restarts())
+    expired_purger = asyncio.create_task(run_purge_worker())
+    yield
+    for task in (alias_events, alias_filter, click_flusher, click_event_flusher, cache_warmer, expired_purger):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # Write whatever clicks are still buffered before closing the pool
+    await click_buffer.flush()
+    await click_events.flush()
+    # Release pooled connections so workers exit cleanly
+    await DatabaseManager.dispose()
+    await cache_nodes.aclose()
+    await redis_cache.aclose()
+
 
 app = FastAPI(
     title="miniurl.gr",
@@ -30,21 +84,44 @@ app = FastAPI(
         "name": "Stefanos I. Tsaklidis",
         "url": "https://tsaklidis.gr",
     },
-    docs_url=None, redoc_url=None, openapi_url=None
+    docs_url=None, redoc_url=None, openapi_url=None,
+    lifespan=lifespan,
 )
 
-# Add exception handler and limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.state.limiter = limiter
+# Add exception handler for the rate limiter
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+# Added first so that MetricsMiddleware wraps it and times fast redirects too
+if settings.FAST_REDIRECT:
+    app.add_middleware(FastRedirectMiddleware)
+app.add_middleware(MetricsMiddleware)
 
-db_manager = DatabaseManager()
-engine = db_manager.get_db_instance()
-admin = Admin(
-    app,
-    engine,
-    base_url=settings.ADMIN_URL,
-)
-admin.add_view(UrlsAdmin)
+
+def setup_admin(app: FastAPI):
+    """
+    Mount the admin panel. sqladmin and the sync engine it needs are
+    only imported / created when it is enabled.
+    """
+    from sqladmin import Admin
+    from app.admin.admin import UrlsAdmin
+
+    if not settings.ADMIN_URL.startswith("/"):
+        raise ValueError(f"ADMIN_URL must start with '/', got {settings.ADMIN_URL!r}")
+    # sqladmin is sync only, it keeps using the sync engine
+    admin = Admin(
+        app,
+        DatabaseManager.get_db_instance(),
+        base_url=settings.ADMIN_URL,
+    )
+    admin.add_view(UrlsAdmin)
+    return admin
+
+
+# Mounted before the catch-all /{alias} so it takes precedence
+if settings.ADMIN_URL:
+    setup_admin(app)
+
+# Single segment path, must come before the catch-all /{alias}
+app.include_router(api_endpoints.metrics_router)
 
 # Register the catch-all router LAST
 app.include_router(main_router)
@@ -54,12 +131,24 @@ app.include_router(api_endpoints.api_router)
 app.include_router(api_endpoints.health_router)
 
 
-# Serve static assets
-app.mount("/static/js", StaticFiles(directory="front-end/static/js"), name="js")
-app.mount("/static/css", StaticFiles(directory="front-end/static/css"), name="css")
-app.mount("/static/img", StaticFiles(directory="front-end/static/img"), name="img")
+# Serve static assets from memory, precompressed, under content hashed urls
+static_assets = StaticAssets(
+    os.path.join("front-end", "static"), index_file=os.path.join("front-end", "html", "index.html")
+)
+app.mount("/static", static_assets, name="static")
 
 # Serve index.html for root
 @app.get("/")
-def read_index():
-    return FileResponse(os.path.join("front-end", "html", "index.html"))
+def read_index(request: Request):
+    return static_assets.index_response(request)
+
+
+startup_timings["import"] = perf_counter() - IMPORT_STARTED
+
+CallbackMetric(
+    "miniurl_startup_seconds",
+    "Time spent importing the app and warming up the pools, per phase",
+    "gauge",
+    lambda: {(phase,): seconds for phase, seconds in startup_timings.items()},
+    labelnames=("phase",),
+)
@@ -1,12 +1,13 @@
 import logging
 
-from fastapi import APIRouter, BackgroundTasks, Request
+from fastapi import APIRouter, Request
 from starlette.responses import RedirectResponse, Response
 
 from app.core.rate_limit import rate_limit_response, limiter
-from app.databases.general import resolve_url_from_dbs, increase_click
-from app.databases.redis import save_to_cache
-from app.errors.api_errors import NotFound
+from app.databases.click_events import record_click
+from app.databases.clicks import increase_click
+from app.databases.general import AliasExpired, resolve_url_from_dbs
+from app.errors.api_errors import Gone, NotFound
 
 logger = logging.getLogger(__name__)
 
@@ -17,17 +18,27 @@ main_router = APIRouter(
 
 @main_router.get("/{alias}", responses=rate_limit_response)
 @limiter.limit("60/minute")
-async def resolve_url(request: Request, alias: str, background_tasks: BackgroundTasks) -> Response:
+async def resolve_url(request: Request, alias: str) -> Response:
     """
     Resolve a minified url alias to its original url
     """
-    original_url, got_from_cache = await resolve_url_from_dbs(alias, got_from_cache=True)
-    background_tasks.add_task(increase_click, alias)
+    original_url = await resolve_redirect(request, alias)
+    return RedirectResponse(url=original_url, status_code=301)
+
+
+async def resolve_redirect(request: Request, alias: str) -> str:
+    """
+    Original url of alias with its click counted, raises NotFound, or Gone
+    when the link expired. Shared with the ASGI fast path (app.core.fast_redirect).
+    """
+    try:
+        original_url = await resolve_url_from_dbs(alias)
+    except AliasExpired as exc:
+        raise Gone(detail="Requested url has expired") from exc
 
     if not original_url:
         raise NotFound(detail="Requested url not found")
 
-    if not got_from_cache:
-        background_tasks.add_task(save_to_cache, alias, original_url)
-
-    return RedirectResponse(url=original_url, status_code=301)
+    increase_click(alias)
+    record_click(alias, request)
+    return original_url
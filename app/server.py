@@ -0,0 +1,103 @@
+"""
+Production entry point: python -m app.server
+
+Gunicorn master with uvicorn workers. The app is imported once in the
+master and forked, so workers start fast and share the read-only memory.
+On SIGTERM every worker stops accepting connections, lets the in-flight
+requests and their background tasks finish (DRAIN_TIMEOUT), then runs the
+lifespan shutdown which flushes the click buffers and closes Redis and the
+db pools.
+"""
+import logging
+import math
+import os
+from pathlib import Path
+
+from gunicorn.app.base import BaseApplication
+from uvicorn_worker import UvicornWorker
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """CPUs this process may use, honouring the container's CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    return settings.WEB_CONCURRENCY or available_cpus()
+
+
+class MiniURLWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "lifespan": "on",
+        "timeout_graceful_shutdown": settings.DRAIN_TIMEOUT,
+        "server_header": False,
+    }
+
+
+def post_fork(server, worker):
+    # Pools created by the master while importing the app must not be shared
+    from app.databases.manager import DatabaseManager
+    from app.databases.redis import reset_redis
+
+    DatabaseManager.after_fork()
+    reset_redis()
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app.main import app
+
+        return app
+
+
+def server_options() -> dict:
+    return {
+        "bind": settings.BIND,
+        "workers": worker_count(),
+        "worker_class": "app.server.MiniURLWorker",
+        "preload_app": True,
+        "keepalive": settings.KEEPALIVE,
+        "backlog": settings.BACKLOG,
+        "timeout": settings.WORKER_TIMEOUT,
+        "graceful_timeout": settings.GRACEFUL_TIMEOUT,
+        "max_requests": settings.MAX_REQUESTS,
+        "max_requests_jitter": settings.MAX_REQUESTS // 10,
+        # Heartbeat files on tmpfs, a disk backed /tmp can stall workers
+        "worker_tmp_dir": "/dev/shm" if os.path.isdir("/dev/shm") else None,
+        "post_fork": post_fork,
+    }
+
+
+def main():
+    options = server_options()
+    logger.warning(f"Starting {options['workers']} workers on {options['bind']}")
+    Server(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import hashlib
 import secrets
 import string
 
@@ -8,3 +9,37 @@ def get_random_url_string(length=8, prefix='', suffix=''):
         length = 8
     rand_part = ''.join(secrets.choice(allowed_chars) for _ in range(length))
     return f'{prefix}{rand_part}{suffix}'
+
+
+BASE62_ALPHABET = string.digits + string.ascii_lowercase + string.ascii_uppercase
+
+
+def encode_base62(number, min_length=1):
+    """Encode a non negative integer, left padded to min_length"""
+    if number < 0:
+        raise ValueError("Only non negative numbers can be encoded")
+    chars = []
+    while number:
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[remainder])
+    encoded = ''.join(reversed(chars)) or BASE62_ALPHABET[0]
+    return encoded.rjust(min_length, BASE62_ALPHABET[0])
+
+
+def scramble_id(number, key, bits=34, rounds=4):
+    """
+    Keyed permutation of the lowest `bits` bits of a number (Feistel network).
+
+    Distinct numbers always give distinct results, so sequential ids can be
+    turned into non guessable ones without any collision check.
+    """
+    if bits % 2:
+        raise ValueError("bits must be even")
+    half = bits // 2
+    mask = (1 << half) - 1
+    block = number & ((1 << bits) - 1)
+    left, right = block >> half, block & mask
+    for round_no in range(rounds):
+        digest = hashlib.blake2b(f'{round_no}:{right}'.encode(), key=key.encode(), digest_size=8).digest()
+        left, right = right, left ^ (int.from_bytes(digest, 'big') & mask)
+    return (number >> bits << bits) | (left << half) | right
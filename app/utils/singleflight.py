@@ -0,0 +1,30 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key.
+
+    The first caller starts the work, everyone arriving while it runs awaits
+    the same task instead of starting their own. Cancelling a waiter never
+    cancels the shared work.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: str, fn, *args):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,197 @@
+"""
+Redis memory used per cached alias, for each cache encoding.
+
+Loads the same synthetic aliases with every mode into an empty Redis
+database and compares INFO used_memory before and after, plus the read
+latency of random aliases. Needs a real Redis, use a database nothing else
+uses, it is flushed between modes:
+
+    python -m benchmarks.memory --redis-url redis://localhost:6379/15 --aliases 1000000
+
+With --fake it runs against fakeredis, which can't report memory, and only
+compares the payload bytes stored per alias.
+"""
+import argparse
+import asyncio
+import json
+import random
+import string
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.run import ROOT, git_revision, percentile
+
+MODES = ("keys", "buckets", "buckets+compression")
+
+URL_TEMPLATES = (
+    "https://www.youtube.com/watch?v={id11}",
+    "https://youtu.be/{id11}?si={id16}",
+    "https://docs.google.com/document/d/{id44}/edit?usp=sharing",
+    "https://www.instagram.com/p/{id11}/",
+    "https://example{number}.com/blog/{slug}",
+    "https://www.shop{number}.gr/products/{slug}?utm_source=newsletter&utm_medium=email&utm_campaign={word}",
+    "https://en.wikipedia.org/wiki/{word}_{word}",
+    "https://github.com/{word}/{word}",
+    "http://{word}{number}.net/{word}.php?id={number}",
+)
+
+
+def random_id(rng, length):
+    return "".join(rng.choices(string.ascii_letters + string.digits + "-_", k=length))
+
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+
+def synthetic_urls(count: int, seed: int = 42) -> dict:
+    """alias -> url, the same ones on every run"""
+    rng = random.Random(seed)
+    urls = {}
+    while len(urls) < count:
+        url = rng.choice(URL_TEMPLATES).format(
+            id11=random_id(rng, 11),
+            id16=random_id(rng, 16),
+            id44=random_id(rng, 44),
+            number=rng.randint(1, 99999),
+            word=random_word(rng),
+            slug="-".join(random_word(rng) for _ in range(rng.randint(2, 6))),
+        )
+        urls[random_id(rng, 6)] = url
+    return urls
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the Redis memory used by the cache encodings")
+    parser.add_argument("--aliases", type=int, default=100_000)
+    parser.add_argument("--redis-url", help="empty Redis database to use, it is flushed")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis, payload sizes only")
+    parser.add_argument("--buckets", type=int, help="hashes per generation, defaults to aliases / 100")
+    parser.add_argument("--reads", type=int, default=10_000, help="random aliases read per mode")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    if not args.fake and not args.redis_url:
+        parser.error("--redis-url or --fake is required")
+    return args
+
+
+def make_cache(mode: str, nodes, buckets: int):
+    from app.databases.compact_cache import BucketedCache
+
+    if mode == "keys":
+        return nodes
+    return BucketedCache(nodes, buckets=buckets, ttl=86400, compress=mode.endswith("compression"))
+
+
+async def stored_bytes(client) -> int:
+    """Bytes of the keys, fields and values stored, without Redis' own overhead"""
+    total = 0
+    async for key in client.scan_iter(count=1000):
+        if await client.type(key) == b"hash":
+            total += len(key)
+            for field, value in (await client.hgetall(key)).items():
+                total += len(field) + len(value)
+        else:
+            total += len(key) + len(await client.get(key))
+    return total
+
+
+async def measure(mode: str, client, raw_client, urls: dict, buckets: int, reads: int, fake: bool) -> dict:
+    from app.databases.redis import ShardedRedis
+
+    cache = make_cache(mode, ShardedRedis({"bench": client}), buckets)
+    await client.flushdb()
+    before = None if fake else (await client.info("memory"))["used_memory"]
+
+    started = perf_counter()
+    items = list(urls.items())
+    for start in range(0, len(items), 1000):
+        await cache.set_many(dict(items[start:start + 1000]), expire=86400, nx=True)
+    load_seconds = perf_counter() - started
+
+    latencies = []
+    for alias in random.Random(7).sample(list(urls), min(reads, len(urls))):
+        started = perf_counter()
+        assert await cache.get(alias) == urls[alias]
+        latencies.append(perf_counter() - started)
+    latencies.sort()
+
+    result = {
+        "keys": await client.dbsize(),
+        "load_s": round(load_seconds, 3),
+        "get_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "get_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    if fake:
+        result["payload_bytes_per_alias"] = round(await stored_bytes(raw_client) / len(urls), 1)
+    else:
+        used = (await client.info("memory"))["used_memory"] - before
+        result["used_memory_bytes"] = used
+        result["bytes_per_alias"] = round(used / len(urls), 1)
+    await client.flushdb()
+    return result
+
+
+async def run(args) -> dict:
+    import redis.asyncio as redis
+
+    if args.fake:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        # Compressed values aren't utf-8, they are measured undecoded
+        raw_client = fakeredis.FakeAsyncRedis(server=server)
+    else:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+        raw_client = None
+        if await client.dbsize():
+            raise SystemExit(f"{args.redis_url} isn't empty, use a database nothing else uses")
+
+    urls = synthetic_urls(args.aliases)
+    buckets = args.buckets or max(1, args.aliases // 100)
+    results = {}
+    try:
+        for mode in MODES:
+            results[mode] = await measure(mode, client, raw_client, urls, buckets, args.reads, args.fake)
+            print(format_result(mode, results[mode]), flush=True)
+    finally:
+        await client.aclose()
+        if raw_client is not None:
+            await raw_client.aclose()
+    return results
+
+
+def format_result(mode: str, result: dict) -> str:
+    size = (
+        f"{result['bytes_per_alias']:>8.1f} B/alias"
+        if "bytes_per_alias" in result
+        else f"{result['payload_bytes_per_alias']:>8.1f} payload B/alias"
+    )
+    return (
+        f"{mode:<20} {size}  {result['keys']:>9} keys  "
+        f"get p50 {result['get_p50_ms']:.3f}ms  p99 {result['get_p99_ms']:.3f}ms"
+    )
+
+
+def main(argv=None):
+    import os
+    import sys
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    if args.output:
+        report = {
+            "revision": git_revision(),
+            "aliases": args.aliases,
+            "redis": "fakeredis" if args.fake else "redis",
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Offline load and latency benchmark for the hot endpoints.
+
+Drives the ASGI app in-process through httpx, with an in-process fake Redis
+and a throwaway SQLite database by default, so runs need no services and are
+comparable between commits. Pass --redis to use the Redis configured by the
+REDIS_CACHE_* settings and --database-url for a local Postgres instead.
+
+    python -m benchmarks.run --requests 2000 --concurrency 50 --output after.json --compare before.json
+
+The redirect scenarios go through the ASGI fast path (FAST_REDIRECT) unless
+--no-fast-redirect is given, compare both with:
+
+    python -m benchmarks.run --scenarios redirect_hit redirect_404 --no-fast-redirect --output route.json
+    python -m benchmarks.run --scenarios redirect_hit redirect_404 --compare route.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ("redirect_hit", "redirect_miss", "redirect_404", "api_hit", "minify")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark redirect and minify on a local app instance")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--database-url", help="sync database url, defaults to a temporary SQLite file")
+    parser.add_argument("--redis", action="store_true", help="use the configured Redis instead of fakeredis")
+    parser.add_argument("--no-fast-redirect", dest="fast_redirect", action="store_false",
+                        help="serve redirects through the FastAPI route instead of the ASGI fast path")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    """Settings are read at import time, so this must run before importing the app"""
+    if not args.database_url:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp(prefix='miniurl-bench-')}/bench.db"
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("APP_API_TOKEN", uuid.uuid4().hex)
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+
+    if not args.redis:
+        import fakeredis
+        import app.databases.redis
+
+        fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+        app.databases.redis.redis_cache = fake
+        app.databases.redis.cache_nodes = app.databases.redis.ShardedRedis({"fakeredis": fake})
+        app.databases.redis.url_cache = app.databases.redis.setup_url_cache(app.databases.redis.cache_nodes)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+async def run_scenario(client, make_request, expected_status, total, concurrency):
+    """Send `total` requests with `concurrency` of them in flight, return the stats"""
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def worker():
+        nonlocal errors, sent
+        while sent < total:
+            number = sent
+            sent += 1
+            started = perf_counter()
+            try:
+                response = await make_request(client, number)
+                ok = response.status_code == expected_status
+            except Exception:
+                ok = False
+            latencies.append(perf_counter() - started)
+            errors += not ok
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    elapsed = perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+
+async def seed(count, prefix):
+    """Insert urls straight into the db, bypassing every cache"""
+    from app.databases.general import DBActions
+
+    aliases = [f"{prefix}{number:06d}" for number in range(count)]
+    await DBActions().add_urls([{"alias": alias, "original_url": f"https://example.com/{alias}"} for alias in aliases])
+    return aliases
+
+
+async def run_benchmarks(args):
+    from sqlmodel import SQLModel
+
+    import app.databases.models  # noqa: F401 register the tables
+    from app.core.fast_redirect import FastRedirectMiddleware
+    from app.core.rate_limit import limiter
+    from app.databases.manager import DatabaseManager
+    from app.main import app
+
+    SQLModel.metadata.create_all(DatabaseManager.get_db_instance())
+    limiter.enabled = False
+    FastRedirectMiddleware.enabled = args.fast_redirect
+    try:
+        return await _run_benchmarks(args, app)
+    finally:
+        await DatabaseManager.dispose()
+
+
+async def _run_benchmarks(args, app):
+    import httpx
+
+    from app.databases.local_cache import alias_cache, missing_aliases
+    from app.databases.redis import save_many_to_cache
+
+    hot = await seed(100, "hot")
+    cold = await seed(args.requests, "cold")
+    await save_many_to_cache({alias: f"https://example.com/{alias}" for alias in hot})
+
+    scenarios = {
+        # Same few aliases over and over, served by the local/Redis cache
+        "redirect_hit": (lambda c, n: c.get(f"/{hot[n % len(hot)]}"), 301),
+        # Every alias requested once, so each one goes to the db
+        "redirect_miss": (lambda c, n: c.get(f"/{cold[n]}"), 301),
+        # Aliases that don't exist
+        "redirect_404": (lambda c, n: c.get(f"/nx{n:07d}"), 404),
+        "api_hit": (lambda c, n: c.get(f"/api/v1.0/{hot[n % len(hot)]}"), 200),
+        "minify": (lambda c, n: c.post("/api/v1.0/minify", json={"url": f"https://example.com/new/{n}"}), 200),
+    }
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Warm up imports, pools and the hot aliases
+            for alias in hot:
+                await client.get(f"/{alias}")
+            for name in args.scenarios:
+                if name == "redirect_miss":
+                    alias_cache.clear()
+                    missing_aliases.clear()
+                make_request, expected_status = scenarios[name]
+                results[name] = await run_scenario(
+                    client, make_request, expected_status, args.requests, args.concurrency
+                )
+                print(format_result(name, results[name]), flush=True)
+    return results
+
+
+def format_result(name, result, baseline=None):
+    line = (
+        f"{name:<14} {result['throughput_rps']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.3f}ms  p95 {result['p95_ms']:>8.3f}ms  p99 {result['p99_ms']:>8.3f}ms  "
+        f"errors {result['errors']}"
+    )
+    if baseline:
+        change = (result["p95_ms"] - baseline["p95_ms"]) / baseline["p95_ms"] * 100
+        rps_change = (result["throughput_rps"] - baseline["throughput_rps"]) / baseline["throughput_rps"] * 100
+        line += f"  (p95 {change:+.1f}%, req/s {rps_change:+.1f}%)"
+    return line
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    results = asyncio.run(run_benchmarks(args))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": args.database_url.split(":", 1)[0],
+        "redis": "redis" if args.redis else "fakeredis",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "fast_redirect": args.fast_redirect,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        print(f"\nCompared with {baseline.get('revision')} ({args.compare}):")
+        for name, result in results.items():
+            print(format_result(name, result, baseline["results"].get(name)))
+
+
+if __name__ == "__main__":
+    main()
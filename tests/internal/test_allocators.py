@@ -0,0 +1,60 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.databases.allocators import SequenceAliasAllocator
+from app.utils.generators import encode_base62, scramble_id
+
+
+def test_encode_base62_pads_to_min_length():
+    assert encode_base62(0, 6) == "000000"
+    assert encode_base62(61, 6) == "00000Z"
+    assert encode_base62(62, 1) == "10"
+
+
+def test_encoded_ids_are_unique():
+    encoded = {encode_base62(number, 6) for number in range(100000)}
+    assert len(encoded) == 100000
+
+
+def test_scramble_is_a_permutation():
+    scrambled = [scramble_id(number, "secret", bits=8) for number in range(256)]
+    assert sorted(scrambled) == list(range(256))
+    assert scrambled != list(range(256))
+
+
+def test_scramble_keeps_high_bits():
+    number = (5 << 8) | 3
+    assert scramble_id(number, "secret", bits=8) >> 8 == 5
+
+
+@pytest.mark.asyncio
+async def test_sequence_allocator_reserves_blocks():
+    allocator = SequenceAliasAllocator(block_size=100, min_length=6, scramble_key="secret")
+    reserve = AsyncMock(side_effect=[list(range(1, 101)), list(range(101, 201))])
+
+    with patch("app.databases.allocators.DBActions.reserve_alias_ids", new=reserve):
+        aliases = await allocator.allocate_many(60)
+        aliases += await allocator.allocate_many(60)
+
+    assert len(set(aliases)) == 120
+    assert all(len(alias) == 6 for alias in aliases)
+    assert reserve.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_sequence_allocator_falls_back_to_random_without_sequence():
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    allocator = SequenceAliasAllocator(block_size=100, min_length=6)
+    engine = create_async_engine("sqlite+aiosqlite://")
+
+    with patch("app.databases.allocators.DBActions.__init__", return_value=None), \
+            patch("app.databases.allocators.DBActions.db_session", engine, create=True), \
+            patch("app.databases.allocators.DBActions.reserve_alias_ids", new=AsyncMock()) as reserve:
+        aliases = await allocator.allocate_many(10)
+        aliases.append(await allocator.allocate())
+
+    assert len(aliases) == 11
+    assert all(len(alias) == 6 for alias in aliases)
+    assert allocator.fallback is not None
+    reserve.assert_not_awaited()
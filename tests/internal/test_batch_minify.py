@@ -0,0 +1,82 @@
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.rate_limit import limiter
+from app.databases.allocators import alias_allocator
+from app.databases.manager import DatabaseManager
+from app.databases.models import Urls
+
+
+@pytest.fixture
+def engine(tmp_path):
+    SQLModel.metadata.create_all(create_engine(f"sqlite:///{tmp_path / 'batch.db'}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'batch.db'}")
+    with patch.object(DatabaseManager, "get_async_db_instance", return_value=engine), \
+            patch.object(DatabaseManager, "get_read_db_instance", return_value=engine), \
+            patch("app.databases.general.register_aliases", new=AsyncMock()), \
+            patch.object(limiter, "hit", new=AsyncMock(return_value=(True, 0))):
+        yield engine
+
+
+@pytest.mark.asyncio
+async def test_batch_results_follow_request_order(engine):
+    from app.main import app
+
+    async with AsyncSession(engine) as session:
+        session.add_all([
+            Urls(alias="taken1", original_url="https://old.com"),
+            Urls(alias="clash1", original_url="https://old.com"),
+        ])
+        await session.commit()
+    items = [
+        {"url": "https://a.com", "preferred_alias": "taken1"},
+        {"url": "https://b.com"},
+        {"url": "https://c.com", "preferred_alias": "mine01"},
+        {"url": "https://d.com", "preferred_alias": "mine01"},
+        {"url": "https://e.com"},
+    ]
+
+    # The second generated alias exists already, it is retried with a fresh one
+    with patch.object(alias_allocator, "allocate_many", new=AsyncMock(return_value=["gen001", "clash1"])), \
+            patch.object(alias_allocator, "allocate", new=AsyncMock(return_value="gen002")), \
+            patch("app.api.v1.routers.save_many_to_cache", new=AsyncMock()) as save_many:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/v1.0/minify/batch", json={"items": items})
+
+    assert response.status_code == 200
+    base = settings.BASE_URL
+    assert response.json()["results"] == [
+        {"url": "https://a.com", "error": "Alias 'taken1' already exists."},
+        {"url": "https://b.com", "minified_url": f"{base}/gen001"},
+        {"url": "https://c.com", "minified_url": f"{base}/mine01"},
+        {"url": "https://d.com", "error": "Alias 'mine01' already exists."},
+        {"url": "https://e.com", "minified_url": f"{base}/gen002"},
+    ]
+    # One pipelined cache write for the whole batch
+    save_many.assert_awaited_once_with(
+        {"gen001": "https://b.com", "mine01": "https://c.com", "gen002": "https://e.com"}, expires_at={}
+    )
+
+
+@pytest.mark.asyncio
+async def test_generated_alias_gives_up_after_three_attempts(engine):
+    from app.main import app
+
+    async with AsyncSession(engine) as session:
+        session.add_all([Urls(alias=f"clash{number}", original_url="https://old.com") for number in range(3)])
+        await session.commit()
+
+    with patch.object(alias_allocator, "allocate_many", new=AsyncMock(return_value=["clash0"])), \
+            patch.object(alias_allocator, "allocate", new=AsyncMock(side_effect=["clash1", "clash2"])) as allocate, \
+            patch("app.api.v1.routers.save_many_to_cache", new=AsyncMock()) as save_many:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/v1.0/minify/batch", json={"items": [{"url": "https://a.com"}]})
+
+    assert response.json()["results"] == [{"url": "https://a.com", "error": "Alias 'clash2' already exists."}]
+    assert allocate.await_count == 2
+    save_many.assert_awaited_once_with({}, expires_at={})
@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.databases.bloom import BloomFilter
+from app.databases.local_cache import alias_cache, handle_alias_event, missing_aliases
+
+
+@pytest.mark.asyncio
+async def test_added_aliases_are_found():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    await bloom.add_many(f"alias{i}" for i in range(1000))
+    await bloom.mark_built()
+
+    for i in range(1000):
+        assert await bloom.might_contain(f"alias{i}")
+
+
+@pytest.mark.asyncio
+async def test_false_positive_rate_is_bounded():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    await bloom.add_many(f"alias{i}" for i in range(1000))
+    await bloom.mark_built()
+
+    false_positives = [i for i in range(10000) if await bloom.might_contain(f"unknown{i}")]
+    assert len(false_positives) < 300
+
+
+@pytest.mark.asyncio
+async def test_filter_answers_maybe_until_built():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+
+    assert await bloom.might_contain("anything")
+
+
+@pytest.mark.asyncio
+async def test_unknown_alias_rejected_without_network():
+    from app.databases.general import resolve_url_from_dbs
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    await bloom.mark_built()
+
+    with patch("app.databases.general.alias_filter", new=bloom), \
+            patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock()) as redis_get, \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock()) as db_get:
+        url, from_cache = await resolve_url_from_dbs("nosuchalias", got_from_cache=True)
+
+    assert url is None
+    assert not from_cache
+    redis_get.assert_not_awaited()
+    db_get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_filter_rejections_end_with_the_added_event():
+    from app.databases.general import resolve_url_from_dbs
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    await bloom.mark_built()
+
+    # Created by another worker, this one hasn't got its "added" event yet
+    with patch("app.databases.general.alias_filter", new=bloom), \
+            patch("app.databases.local_cache.alias_filter", new=bloom), \
+            patch("app.databases.general.fetch_alias", new=AsyncMock(return_value=("https://a.com", None, None))):
+        assert await resolve_url_from_dbs("elsewhere") is None
+        assert missing_aliases.get("elsewhere") is None
+        await handle_alias_event("added:elsewhere")
+        assert await resolve_url_from_dbs("elsewhere") == "https://a.com"
+    alias_cache.delete("elsewhere")
+
+
+@pytest.mark.asyncio
+async def test_added_event_clears_negative_cache():
+    missing_aliases.set("newalias", True)
+    await handle_alias_event("added:newalias")
+
+    assert missing_aliases.get("newalias") is None
+
+
+@pytest.mark.asyncio
+async def test_alias_created_in_admin_resolves_with_built_filter():
+    from types import SimpleNamespace
+
+    from app.admin.admin import UrlsAdmin
+    from app.databases.general import resolve_url_from_dbs
+    from app.databases.models import Urls
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    await bloom.mark_built()
+    admin = UrlsAdmin()
+    created = Urls(alias="admin1", original_url="https://example.com")
+    renamed = Urls(alias="admin2", original_url="https://example.com")
+    request = SimpleNamespace(state=SimpleNamespace())
+
+    with patch("app.databases.general.alias_filter", new=bloom), \
+            patch("app.databases.general.publish_alias_event", new=AsyncMock()), \
+            patch("app.databases.general.delete_from_cache", new=AsyncMock()), \
+            patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock(return_value=(None, None))), \
+            patch("app.databases.general.save_to_cache", new=AsyncMock()), \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock(side_effect=[created, renamed])):
+        await admin.on_model_change({}, created, True, request)
+        await admin.after_model_change({}, created, True, request)
+        assert await resolve_url_from_dbs("admin1") == "https://example.com"
+
+        await admin.on_model_change({}, renamed, False, request)
+        renamed.alias = "admin3"
+        await admin.after_model_change({}, renamed, False, request)
+        assert await resolve_url_from_dbs("admin3") == "https://example.com"
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine
+
+import app.databases.models  # noqa: F401 register the tables
+from app.databases.bulk import clean_record, export_urls, import_urls, read_records
+from app.databases.manager import DatabaseManager
+
+
+@pytest.fixture
+def engine(tmp_path):
+    SQLModel.metadata.create_all(create_engine(f"sqlite:///{tmp_path / 'bulk.db'}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bulk.db'}")
+    with patch.object(DatabaseManager, "get_async_db_instance", return_value=engine), \
+            patch.object(DatabaseManager, "get_replica_instances", return_value=[]), \
+            patch("app.databases.general.register_aliases", new=AsyncMock()):
+        yield engine
+
+
+def test_clean_record():
+    row = clean_record({"url": "https://example.com/", "created_at": "2026-01-02T03:04:05+02:00"})
+
+    assert row["alias"] is None
+    assert row["original_url"] == "https://example.com"
+    assert row["created_at"].isoformat() == "2026-01-02T01:04:05"
+    assert clean_record({"url": "javascript:alert(1)"}) is None
+    assert clean_record({"url": "https://example.com", "alias": "a/b"}) is None
+    assert clean_record({"url": "https://example.com", "total_clicks": "many"}) is None
+
+
+@pytest.mark.asyncio
+async def test_import_reports_conflicts_and_generated_aliases(engine):
+    lines = [
+        json.dumps({"alias": "first", "original_url": "https://a.com"}),
+        json.dumps({"alias": "first", "original_url": "https://b.com"}),
+        "not json",
+        json.dumps({"url": "https://c.com", "total_clicks": 7}),
+        json.dumps({"alias": "later", "original_url": "https://d.com"}),
+    ]
+    report = io.StringIO()
+
+    with patch("app.databases.redis.save_many_to_cache", new=AsyncMock()) as warm:
+        stats = await import_urls(read_records(lines, "jsonl"), chunk_size=2, warm=True, report=csv.writer(report))
+        # A second run only conflicts
+        again = await import_urls(read_records(lines[:1], "jsonl"), chunk_size=2)
+
+    assert {key: stats[key] for key in ("read", "inserted", "conflicts", "invalid")} == {
+        "read": 5, "inserted": 3, "conflicts": 1, "invalid": 1,
+    }
+    assert again["conflicts"] == 1 and again["inserted"] == 0
+    statuses = [row[3] for row in csv.reader(io.StringIO(report.getvalue()))]
+    assert statuses == ["conflict", "invalid", "generated"]
+    warmed = {alias: url for call in warm.await_args_list for alias, url in call.args[0].items()}
+    assert warmed["first"] == "https://a.com" and len(warmed) == 3
+
+    exported = io.StringIO()
+    assert await export_urls(exported, "jsonl", chunk_size=2) == 3
+    records = [json.loads(line) for line in exported.getvalue().splitlines()]
+    assert sorted(record["original_url"] for record in records) == ["https://a.com", "https://c.com", "https://d.com"]
+    assert [record["total_clicks"] for record in records if record["original_url"] == "https://c.com"] == [7]
@@ -17,7 +17,7 @@ async def test_save_and_get_from_cache():
     value = "testvalue"
     expire = 1
 
-    with patch("app.databases.redis.redis_cache", autospec=True) as mock_cache:
+    with patch("app.databases.redis.url_cache", autospec=True) as mock_cache:
         # Simulate cache miss on first get, then return stored value
         mock_cache.get = AsyncMock(side_effect=[None, value.encode()])
         mock_cache.set = AsyncMock(return_value=True)
@@ -37,7 +37,7 @@ async def test_save_to_cache_no_expiration():
     key = f"testkey_{random_str()}"
     value = "persistent_value"
 
-    with patch("app.databases.redis.redis_cache", autospec=True) as mock_cache:
+    with patch("app.databases.redis.url_cache", autospec=True) as mock_cache:
         mock_cache.set = AsyncMock(return_value=True)
         # First get: cache miss, second get: return cached value
         mock_cache.get = AsyncMock(side_effect=[None, value.encode()])
@@ -59,7 +59,7 @@ async def test_save_to_cache_prevents_overwrites():
     value1 = "value1"
     value2 = "value2"
 
-    with patch("app.databases.redis.redis_cache", autospec=True) as mock_cache:
+    with patch("app.databases.redis.url_cache", autospec=True) as mock_cache:
         mock_cache.set = AsyncMock(return_value=True)
         # get() call sequence:
         # 1️⃣ Before first save: None (empty cache)
@@ -92,7 +92,7 @@ async def test_save_to_cache_prevents_overwrites():
 @pytest.mark.asyncio
 async def test_get_from_cache_missing_key():
     key = f"missing_{random_str()}"
-    with patch("app.databases.redis.redis_cache", autospec=True) as mock_cache:
+    with patch("app.databases.redis.url_cache", autospec=True) as mock_cache:
         mock_cache.get = AsyncMock(return_value=None)
 
         result = await get_from_cache(key)
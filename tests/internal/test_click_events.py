@@ -0,0 +1,51 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.databases.click_events import ClickEventSink, ClickSpool, build_click_event
+
+
+def test_click_event_normalizes_country():
+    request = MagicMock(headers={"cf-ipcountry": "gr", "referer": "https://t.co/x"})
+    event = build_click_event("abc123", request)
+
+    assert event["country"] == "GR"
+    assert event["referrer"] == "https://t.co/x"
+    assert event["user_agent"] == ""
+    assert len(event["event_id"]) == 32
+
+    request = MagicMock(headers={"cf-ipcountry": "XX"})
+    assert build_click_event("abc123", request)["country"] == ""
+
+
+def test_spool_segment_is_claimed_once(tmp_path):
+    spool = ClickSpool(str(tmp_path), segment_size=1024)
+    spool.append([{"event_id": "1"}, {"event_id": "2"}])
+    spool.append([{"event_id": "3"}])
+
+    claimed = list(spool.claim())
+    assert len(claimed) == 1
+    assert [event["event_id"] for event in claimed[0][1]] == ["1", "2", "3"]
+    assert list(spool.claim()) == []
+
+    spool.release(claimed[0][0])
+    assert len(list(spool.claim())) == 1
+
+
+@pytest.mark.asyncio
+async def test_events_are_spooled_while_redis_is_down(tmp_path):
+    sink = ClickEventSink("clicks", 1000, 1, ClickSpool(str(tmp_path), segment_size=1024))
+    sink.add({"event_id": "1", "alias": "abc123", "ts": "1.0"})
+
+    broken = MagicMock()
+    broken.pipeline.return_value.execute = AsyncMock(side_effect=ConnectionError("down"))
+    with patch("app.databases.click_events.redis_cache", broken):
+        assert await sink.flush() == 0
+    assert sink.pending == 0
+    assert len(list(tmp_path.glob("*.ndjson"))) == 1
+
+    working = MagicMock()
+    working.pipeline.return_value.execute = AsyncMock()
+    with patch("app.databases.click_events.redis_cache", working):
+        assert await sink.replay() == 1
+    working.pipeline.return_value.xadd.assert_called_once()
+    assert list(tmp_path.iterdir()) == []
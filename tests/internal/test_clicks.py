@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.databases.clicks import ClickBuffer
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_aggregated_counts():
+    buffer = ClickBuffer(flush_interval=60, flush_threshold=100)
+    for _ in range(3):
+        buffer.add("abc123")
+    buffer.add("xyz789")
+
+    with patch("app.databases.clicks.DBActions.add_clicks", new=AsyncMock(return_value=2)) as add_clicks:
+        flushed = await buffer.flush()
+
+    assert flushed == 2
+    assert buffer.pending == 0
+    add_clicks.assert_awaited_once_with({"abc123": 3, "xyz789": 1})
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_counts():
+    buffer = ClickBuffer(flush_interval=60, flush_threshold=100)
+    buffer.add("abc123", count=2)
+
+    with patch("app.databases.clicks.DBActions.add_clicks", new=AsyncMock(side_effect=Exception("db down"))):
+        assert await buffer.flush() == 0
+
+    buffer.add("abc123")
+    with patch("app.databases.clicks.DBActions.add_clicks", new=AsyncMock(return_value=1)) as add_clicks:
+        await buffer.flush()
+
+    add_clicks.assert_awaited_once_with({"abc123": 3})
+
+
+@pytest.mark.asyncio
+async def test_threshold_triggers_flush():
+    buffer = ClickBuffer(flush_interval=60, flush_threshold=2)
+
+    with patch("app.databases.clicks.DBActions.add_clicks", new=AsyncMock(return_value=2)) as add_clicks:
+        buffer.add("a")
+        buffer.add("b")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    add_clicks.assert_awaited_once_with({"a": 1, "b": 1})
+    assert buffer.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_empty_flush_skips_db():
+    buffer = ClickBuffer(flush_interval=60, flush_threshold=100)
+
+    with patch("app.databases.clicks.DBActions.add_clicks", new=AsyncMock()) as add_clicks:
+        assert await buffer.flush() == 0
+
+    add_clicks.assert_not_awaited()
@@ -0,0 +1,58 @@
+import fakeredis
+import pytest
+from unittest.mock import patch
+
+from app.databases.compact_cache import BucketedCache, compress_url, decode_url
+from app.databases.redis import ShardedRedis
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+
+
+def bucketed(redis, **kwargs):
+    return BucketedCache(ShardedRedis({"main": redis}), buckets=4, ttl=100, **kwargs)
+
+
+def test_compressed_urls_round_trip_and_shrink():
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&utm_source=newsletter"
+
+    compressed = compress_url(url)
+
+    assert len(compressed) < len(url) * 0.7
+    assert decode_url(compressed) == url
+    # Values written before compression was turned on
+    assert decode_url(url.encode()) == url
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compress", [False, True])
+async def test_aliases_share_bucket_hashes(redis, compress):
+    cache = bucketed(redis, compress=compress)
+    items = {f"alias{number}": f"https://example.com/{number}" for number in range(100)}
+
+    assert await cache.set_many(items, nx=True) == [True] * 100
+
+    assert len(await redis.keys("*")) == 4
+    assert await cache.mget(["missing", "alias7"]) == [None, "https://example.com/7"]
+    assert await cache.set("alias7", "https://other.com", nx=True) is False
+    assert await cache.delete("alias7") == 1
+    assert await cache.get("alias7") is None
+
+
+@pytest.mark.asyncio
+async def test_previous_generation_is_read_and_carried_forward(redis):
+    cache = bucketed(redis)
+    with patch("app.databases.compact_cache.time", return_value=1050):
+        await cache.set("abc", "https://a.com")
+        key = cache.bucket_key("abc", 10)
+        assert await redis.ttl(key) == 200
+
+    with patch("app.databases.compact_cache.time", return_value=1150):
+        assert await cache.get("abc") == "https://a.com"
+        assert await redis.hget(cache.bucket_key("abc", 11), "abc") == "https://a.com"
+
+    with patch("app.databases.compact_cache.time", return_value=1350):
+        # Two generations later
+        assert await cache.get("abc") is None
@@ -0,0 +1,133 @@
+import fakeredis
+import httpx
+import pytest
+from datetime import UTC, datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.rate_limit import limiter
+from app.databases.compact_cache import BucketedCache
+from app.databases.general import AliasExpired
+from app.databases.models import ClickCountryDaily, ClickDaily, ClickEvent, ClickHourly, Urls
+from app.databases.purge import purge_expired
+from app.databases.redis import ShardedRedis, save_to_cache
+from app.databases.stats import get_alias_stats
+from app.databases.ttl import cap_ttl
+
+
+def now():
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    SQLModel.metadata.create_all(create_engine(f"sqlite:///{tmp_path / 'expiry.db'}"))
+    return create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'expiry.db'}")
+
+
+@pytest.mark.asyncio
+async def test_cache_entries_never_outlive_the_link():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+    nodes = ShardedRedis({"main": client})
+
+    assert cap_ttl(3600, None) == 3600
+    assert cap_ttl(3600, now() + timedelta(seconds=100)) in (99, 100)
+    assert cap_ttl(3600, now() - timedelta(seconds=1)) is None
+    with patch("app.databases.redis.url_cache", new=nodes):
+        await save_to_cache("soon", "https://example.com", expire=3600, expires_at=now() + timedelta(seconds=100))
+        await save_to_cache("gone", "https://example.com", expires_at=now() - timedelta(seconds=1))
+    with patch("app.databases.redis.url_cache", new=BucketedCache(nodes, buckets=4, ttl=3600)):
+        await save_to_cache("bucketed", "https://example.com", expires_at=now() + timedelta(seconds=100))
+
+    assert 0 < await client.ttl("soon") <= 100
+    assert await client.get("gone") is None
+    assert await client.keys("cb:*") == []
+
+
+@pytest.mark.asyncio
+async def test_expired_alias_answers_gone():
+    from app.databases.general import resolve_url_from_dbs
+    from app.databases.local_cache import missing_aliases
+    from app.main import app
+
+    url = Urls(alias="old123", original_url="https://example.com", expires_at=now() - timedelta(minutes=1))
+    with patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock(return_value=(None, None))), \
+            patch("app.databases.general.acquire_lock", new=AsyncMock(return_value=None)), \
+            patch("app.databases.general.get_fill_state", new=AsyncMock(return_value=(False, None))), \
+            patch("app.databases.general.save_to_cache", new=AsyncMock()) as save, \
+            patch("app.databases.general.alias_filter", new=None), \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock(return_value=url)) as db_get:
+        with pytest.raises(AliasExpired):
+            await resolve_url_from_dbs("old123")
+        # Answered from the negative cache, on the fast path and through the route
+        with patch.object(limiter, "hit", new=AsyncMock(return_value=(True, 0))):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                redirect = await client.get("/old123")
+                api = await client.get("/api/v1.0/old123")
+
+    assert redirect.status_code == 410
+    assert api.status_code == 410
+    db_get.assert_awaited_once()
+    save.assert_not_awaited()
+    missing_aliases.delete("old123")
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_only_links_past_retention_in_batches(engine):
+    async with AsyncSession(engine) as session:
+        session.add_all([
+            Urls(alias="forever", original_url="https://a.com"),
+            Urls(alias="future", original_url="https://b.com", expires_at=now() + timedelta(days=1)),
+            Urls(alias="recent", original_url="https://c.com", expires_at=now() - timedelta(hours=1)),
+            *(
+                Urls(alias=f"old{number}", original_url="https://d.com", expires_at=now() - timedelta(days=number))
+                for number in range(2, 7)
+            ),
+        ])
+        await session.commit()
+
+    with patch("app.databases.purge.invalidate_aliases", new=AsyncMock()) as invalidate:
+        purged = await purge_expired(retention=86400, batch_size=2, db_session=engine)
+
+    async with AsyncSession(engine) as session:
+        left = set((await session.exec(select(Urls.alias))).all())
+    assert purged == 5
+    assert left == {"forever", "future", "recent"}
+    # Oldest first, at most a batch per transaction
+    assert [set(call.args[0]) for call in invalidate.await_args_list] == [{"old6", "old5"}, {"old4", "old3"}, {"old2"}]
+
+
+@pytest.mark.asyncio
+async def test_purged_alias_comes_back_without_stats(engine):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+    clicked_at = now() - timedelta(days=1)
+    async with AsyncSession(engine) as session:
+        session.add_all([
+            Urls(alias="reused", original_url="https://old.com", expires_at=now() - timedelta(days=2)),
+            ClickEvent(event_id="e1", alias="reused", clicked_at=clicked_at, country="GR"),
+            ClickHourly(alias="reused", hour=clicked_at.replace(minute=0, second=0, microsecond=0), clicks=1),
+            ClickDaily(alias="reused", day=clicked_at.date(), clicks=1),
+            ClickCountryDaily(alias="reused", day=clicked_at.date(), country="GR", clicks=1),
+        ])
+        await session.commit()
+
+    with patch("app.databases.stats.cache_nodes", new=ShardedRedis({"main": redis})), \
+            patch("app.databases.general.DatabaseManager.get_read_db_instance", return_value=engine), \
+            patch("app.databases.general.DatabaseManager.get_async_db_instance", return_value=engine), \
+            patch("app.databases.purge.invalidate_aliases", new=AsyncMock()):
+        assert (await get_alias_stats("reused", "day", 7))["total"] == 1
+        assert await purge_expired(retention=86400, db_session=engine) == 1
+        assert await redis.keys("stats:*") == []
+
+        async with AsyncSession(engine) as session:
+            session.add(Urls(alias="reused", original_url="https://new.com"))
+            await session.commit()
+        stats = await get_alias_stats("reused", "day", 7)
+
+    assert stats["total"] == 0
+    assert stats["countries"] == []
+    async with AsyncSession(engine) as session:
+        for table in (ClickEvent, ClickHourly, ClickDaily, ClickCountryDaily):
+            assert (await session.exec(select(table))).all() == []
@@ -0,0 +1,63 @@
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.core.fast_redirect import FastRedirectMiddleware
+from app.core.rate_limit import limiter
+
+
+async def get_both_ways(app, path: str) -> list:
+    """(status, headers, body) of path through the fast path and through the route"""
+    responses = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for enabled in (True, False):
+            with patch.object(FastRedirectMiddleware, "enabled", enabled):
+                response = await client.get(path)
+            responses.append((response.status_code, response.headers.multi_items(), response.content))
+    return responses
+
+
+@pytest.fixture
+def app():
+    from app.main import app
+
+    with patch.object(limiter, "hit", new=AsyncMock(return_value=(True, 0))):
+        yield app
+
+
+@pytest.mark.asyncio
+async def test_redirect_matches_the_route(app):
+    with patch("app.router.resolve_url_from_dbs", new=AsyncMock(return_value="https://example.com/a b?x=1")), \
+            patch("app.router.increase_click") as increase_click, \
+            patch("app.router.record_click") as record_click:
+        fast, route = await get_both_ways(app, "/abc123")
+
+    assert fast == route
+    assert fast[0] == 301
+    assert ("location", "https://example.com/a%20b?x=1") in fast[1]
+    assert increase_click.call_count == record_click.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_not_found_and_rate_limited_match_the_route(app):
+    with patch("app.router.resolve_url_from_dbs", new=AsyncMock(return_value=None)):
+        fast, route = await get_both_ways(app, "/missing")
+    assert fast == route
+    assert fast[0] == 404
+
+    with patch.object(limiter, "hit", new=AsyncMock(return_value=(False, 12.5))):
+        fast, route = await get_both_ways(app, "/abc123")
+    assert fast == route
+    assert fast[0] == 429
+
+
+@pytest.mark.asyncio
+async def test_other_routes_go_to_the_app(app):
+    with patch("app.core.fast_redirect.resolve_redirect", new=AsyncMock()) as resolve:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.get("/metrics")
+            await client.get("/static/css/missing.css")
+            await client.post("/abc123")
+
+    resolve.assert_not_awaited()
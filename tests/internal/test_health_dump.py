@@ -0,0 +1,91 @@
+import fakeredis
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.api.health_checks.routers import stream_redis_data
+from app.databases.compact_cache import BucketedCache
+from app.databases.redis import ShardedRedis
+
+
+async def collect(stream):
+    return [json.loads(line) for chunk in [c async for c in stream] for line in chunk.splitlines()]
+
+
+def nodes_mock(*names):
+    nodes = AsyncMock()
+    nodes.nodes.return_value = list(names)
+    return nodes
+
+
+def filled_redis():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+    return client, ShardedRedis({"main": client})
+
+
+@pytest.mark.asyncio
+async def test_dump_lists_cached_urls_only():
+    client, nodes = filled_redis()
+    await nodes.set_many({"abc123": "https://a.com", "xyz789": "https://b.com"}, expire=60)
+    await client.set("lock:alias:abc123", "token")
+    await client.set("stats:abc123:day:7", "{}")
+    await client.sadd("stats:abc123", "stats:abc123:day:7")
+    await client.hset("cb:1:2", "other", "https://c.com")
+
+    with patch("app.api.health_checks.routers.cache_nodes", nodes), \
+            patch("app.api.health_checks.routers.url_cache", nodes):
+        lines = await collect(stream_redis_data(None, "0", 100, None))
+        assert await collect(stream_redis_data("xyz*", "0", 100, None)) == [
+            {"key": "xyz789", "value": "https://b.com"}, {"cursor": "0"}
+        ]
+
+    assert sorted(lines[:-1], key=lambda line: line["key"]) == [
+        {"key": "abc123", "value": "https://a.com"},
+        {"key": "xyz789", "value": "https://b.com"},
+    ]
+    assert lines[-1] == {"cursor": "0"}
+
+
+@pytest.mark.asyncio
+async def test_dump_reads_the_url_buckets():
+    client, nodes = filled_redis()
+    buckets = BucketedCache(nodes, buckets=4, ttl=3600, compress=True)
+    await buckets.set_many({"abc123": "https://a.com", "xyz789": "https://b.com"})
+    await client.set("plain1", "https://c.com")
+    await client.set("stats:abc123:day:7", "{}")
+
+    with patch("app.api.health_checks.routers.cache_nodes", nodes), \
+            patch("app.api.health_checks.routers.url_cache", buckets):
+        lines = await collect(stream_redis_data(None, "0", 100, None))
+        assert await collect(stream_redis_data("abc*", "0", 100, None)) == [
+            {"key": "abc123", "value": "https://a.com"}, {"cursor": "0"}
+        ]
+
+    assert sorted(line["key"] for line in lines[:-1]) == ["abc123", "xyz789"]
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_at_limit_and_returns_cursor():
+    nodes = nodes_mock("a:6379")
+    nodes.scan_urls.side_effect = [(7, [("a", "1"), ("b", "2")]), (9, [("c", "3"), ("d", "4")]), (0, [("e", "5")])]
+    with patch("app.api.health_checks.routers.cache_nodes", nodes), \
+            patch("app.api.health_checks.routers.url_cache", nodes):
+        lines = await collect(stream_redis_data("*", "0", 2, 3))
+
+    assert len(lines) == 5
+    assert lines[-1] == {"cursor": "0:9"}
+    nodes.scan_urls.assert_awaited_with("a:6379", 7, match="*", count=2)
+
+
+@pytest.mark.asyncio
+async def test_stream_walks_every_node_and_resumes_on_the_next():
+    nodes = nodes_mock("a:6379", "b:6379")
+    nodes.scan_urls.side_effect = [(0, [("a", "1")]), (0, [("b", "2")])]
+    with patch("app.api.health_checks.routers.cache_nodes", nodes), \
+            patch("app.api.health_checks.routers.url_cache", nodes):
+        lines = await collect(stream_redis_data(None, "0", 100, 1))
+        assert lines == [{"key": "a", "value": "1"}, {"cursor": "1:0"}]
+
+        lines = await collect(stream_redis_data(None, "1:0", 100, None))
+        assert lines == [{"key": "b", "value": "2"}, {"cursor": "0"}]
+    nodes.scan_urls.assert_awaited_with("b:6379", 0, match=None, count=100)
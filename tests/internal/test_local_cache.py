@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.databases.local_cache import LocalCache, alias_cache, handle_alias_event
+
+
+def test_get_returns_stored_value():
+    cache = LocalCache(maxsize=10, ttl=60)
+    cache.set("abc123", "https://example.com")
+
+    assert cache.get("abc123") == "https://example.com"
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire():
+    cache = LocalCache(maxsize=10, ttl=5)
+    with patch("app.databases.local_cache.monotonic", return_value=100.0):
+        cache.set("a", "1")
+    with patch("app.databases.local_cache.monotonic", return_value=104.0):
+        assert cache.get("a") == "1"
+    with patch("app.databases.local_cache.monotonic", return_value=105.0):
+        assert cache.get("a") is None
+
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = LocalCache(maxsize=0, ttl=60)
+    cache.set("a", "1")
+
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_invalidate_event_drops_alias():
+    alias_cache.set("abc123", "https://example.com")
+    await handle_alias_event("invalidate:abc123")
+
+    assert alias_cache.get("abc123") is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_prefers_local_cache():
+    from app.databases.general import resolve_url_from_dbs
+
+    alias_cache.set("local1", "https://example.com/local")
+    with patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock()) as redis_get:
+        url, from_cache = await resolve_url_from_dbs("local1", got_from_cache=True)
+
+    assert url == "https://example.com/local"
+    assert from_cache
+    redis_get.assert_not_awaited()
@@ -0,0 +1,31 @@
+from app.core.metrics import Counter, Histogram, render_metrics, route_template
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_latency_seconds", "Test latency", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[("test_latency_seconds_bucket", '{le="0.1"}')] == 1
+    assert samples[("test_latency_seconds_bucket", '{le="1.0"}')] == 2
+    assert samples[("test_latency_seconds_bucket", '{le="+Inf"}')] == 3
+    assert samples[("test_latency_seconds_count", "")] == 3
+
+
+def test_render_includes_labelled_counter():
+    counter = Counter("test_lookups_total", "Test lookups", labelnames=("tier",))
+    counter.inc("local")
+    counter.inc("local")
+
+    output = render_metrics()
+    assert "# TYPE test_lookups_total counter" in output
+    assert 'test_lookups_total{tier="local"} 2' in output
+
+
+def test_route_template_restores_path_params():
+    scope = {"endpoint": object(), "path": "/api/v1.0/abc123", "path_params": {"alias": "abc123"}}
+
+    assert route_template(scope) == "/api/v1.0/{alias}"
+    assert route_template({"path": "/nope"}) == "unmatched"
@@ -0,0 +1,40 @@
+from unittest.mock import MagicMock
+
+from app.databases.partitioning import INITIAL_COLUMNS, copy_rows, create_mirror_function, create_partitioned_table
+
+
+def test_partitions_cover_every_remainder():
+    connection = MagicMock()
+
+    create_partitioned_table(connection, 4)
+
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert "PARTITION BY HASH (alias)" in statements[0]
+    assert "PRIMARY KEY (id, alias)" in statements[0]
+    partitions = [statement for statement in statements if "PARTITION OF" in statement]
+    assert [f"REMAINDER {remainder})" in partitions[remainder] for remainder in range(4)] == [True] * 4
+    assert all("MODULUS 4," in statement for statement in partitions)
+
+
+def test_copy_resumes_after_the_last_copied_id():
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+    connection.execute.return_value.one.side_effect = [(100, 100), (150, 50), (None, 0)]
+
+    assert copy_rows(engine, batch_size=100) == 150
+
+    after_ids = [call.args[1]["after_id"] for call in connection.execute.call_args_list]
+    assert after_ids == [0, 100, 150]
+
+
+def test_mirror_copies_the_columns_of_its_revision():
+    connection = MagicMock()
+
+    create_mirror_function(connection, INITIAL_COLUMNS)
+    create_mirror_function(connection)
+
+    before, after = (str(call.args[0]) for call in connection.execute.call_args_list)
+    assert "expires_at" not in before
+    assert "NEW.total_clicks, NEW.expires_at)" in after
+    assert "expires_at = EXCLUDED.expires_at;" in after
+    assert "alias = EXCLUDED.alias" not in after
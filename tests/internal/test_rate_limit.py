@@ -0,0 +1,34 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from app.core.rate_limit import RateLimiter, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate("60/minute") == (60, 60)
+    assert parse_rate("100/5 minutes") == (100, 300)
+    assert parse_rate("10/second") == (10, 1)
+    with pytest.raises(ValueError):
+        parse_rate("10 per fortnight")
+
+
+@pytest.mark.asyncio
+async def test_refused_keys_are_rejected_locally():
+    limiter = RateLimiter()
+    limiter._script = AsyncMock(return_value=[0, 2000])
+
+    assert await limiter.hit("k", 10, 60) == (False, 2.0)
+    allowed, retry_after = await limiter.hit("k", 10, 60)
+
+    assert not allowed
+    assert 0 < retry_after <= 2.0
+    limiter._script.assert_awaited_once()
+    limiter._script.assert_awaited_with(keys=["k"], args=[6000.0, 60000])
+
+
+@pytest.mark.asyncio
+async def test_fails_open_when_redis_is_down():
+    limiter = RateLimiter()
+    limiter._script = AsyncMock(side_effect=ConnectionError("down"))
+
+    assert await limiter.hit("k", 10, 60) == (True, 0)
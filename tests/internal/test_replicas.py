@@ -0,0 +1,104 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+
+import app.databases.models  # noqa: F401 register the tables
+from app.databases.general import DBActions
+from app.databases.local_cache import recently_written
+from app.databases.manager import DatabaseManager
+from app.databases.models import Urls
+
+
+@pytest.fixture
+def replicas():
+    primary, first, second = MagicMock(name="primary"), MagicMock(name="first"), MagicMock(name="second")
+    with patch.object(DatabaseManager, "get_async_db_instance", return_value=primary), \
+            patch.object(DatabaseManager, "get_replica_instances", return_value=[first, second]), \
+            patch.object(DatabaseManager, "_replica_down_until", {}):
+        yield primary, first, second
+
+
+def test_reads_rotate_over_replicas(replicas):
+    _, first, second = replicas
+
+    picked = {DatabaseManager.get_read_db_instance() for _ in range(4)}
+
+    assert picked == {first, second}
+
+
+def test_unhealthy_replicas_are_skipped(replicas):
+    primary, first, second = replicas
+
+    DatabaseManager.mark_unhealthy(first)
+    assert {DatabaseManager.get_read_db_instance() for _ in range(4)} == {second}
+
+    DatabaseManager.mark_unhealthy(second)
+    assert DatabaseManager.get_read_db_instance() is primary
+
+
+async def sqlite_engine(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    return engine
+
+
+@pytest.mark.asyncio
+async def test_replica_miss_is_not_checked_on_the_primary(tmp_path):
+    primary = await sqlite_engine(tmp_path / "primary.db")
+    replica = await sqlite_engine(tmp_path / "replica.db")
+    try:
+        # Written to the primary by another worker, not replicated yet
+        async with primary.begin() as connection:
+            await connection.execute(Urls.__table__.insert(), {"alias": "lagged", "original_url": "https://a.com"})
+        actions = DBActions(db_session=primary, read_session=replica)
+
+        assert await actions.get_url_by_alias("lagged") is None
+        # Until its "added" event comes in
+        recently_written.set("lagged", True)
+        assert await actions.get_url_by_alias("lagged") == "https://a.com"
+        assert await actions.get_last_id() == 1
+    finally:
+        recently_written.clear()
+        await primary.dispose()
+        await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_recently_written_aliases_skip_the_replica(tmp_path):
+    primary = await sqlite_engine(tmp_path / "primary.db")
+    replica = await sqlite_engine(tmp_path / "replica.db")
+    try:
+        async with replica.begin() as connection:
+            await connection.execute(Urls.__table__.insert(), {"alias": "changed", "original_url": "https://old.com"})
+        async with primary.begin() as connection:
+            await connection.execute(Urls.__table__.insert(), {"alias": "changed", "original_url": "https://new.com"})
+        actions = DBActions(db_session=primary, read_session=replica)
+
+        assert await actions.get_url_by_alias("changed") == "https://old.com"
+        recently_written.set("changed", True)
+        assert await actions.get_url_by_alias("changed") == "https://new.com"
+    finally:
+        recently_written.clear()
+        await primary.dispose()
+        await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failing_replica_is_marked_unhealthy(tmp_path):
+    primary = await sqlite_engine(tmp_path / "primary.db")
+    # No such directory, every connection attempt fails
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db")
+    try:
+        async with primary.begin() as connection:
+            await connection.execute(Urls.__table__.insert(), {"alias": "abc", "original_url": "https://a.com"})
+        actions = DBActions(db_session=primary, read_session=replica)
+
+        with patch.object(DatabaseManager, "_replica_down_until", {}) as down_until:
+            assert await actions.get_url_by_alias("abc") == "https://a.com"
+            assert replica in down_until
+        assert actions.read_session is primary
+    finally:
+        await primary.dispose()
+        await replica.dispose()
@@ -0,0 +1,19 @@
+from unittest.mock import patch
+
+from app.server import available_cpus, server_options, worker_count
+
+
+def test_cpu_quota_caps_the_worker_count():
+    with patch("app.server.os.sched_getaffinity", return_value=set(range(16))), \
+            patch("app.server.Path.read_text", return_value="200000 100000\n"):
+        assert available_cpus() == 2
+    with patch("app.server.os.sched_getaffinity", return_value=set(range(4))), \
+            patch("app.server.Path.read_text", return_value="max 100000\n"):
+        assert available_cpus() == 4
+
+
+def test_web_concurrency_overrides_autosizing():
+    with patch("app.server.settings.WEB_CONCURRENCY", 3):
+        assert worker_count() == 3
+        assert server_options()["workers"] == 3
+    assert server_options()["preload_app"]
@@ -0,0 +1,168 @@
+import fakeredis
+import pytest
+from unittest.mock import AsyncMock, patch
+from fakeredis.aioredis import FakeAsyncRedisConnection
+from redis.asyncio.cluster import ClusterNode, NodesManager, RedisCluster
+from redis.cluster import PRIMARY
+from redis.exceptions import ConnectionError
+
+from app.api.health_checks.routers import check_redis_nodes
+from app.databases.redis import ClusterRedis, HashRing, ShardedRedis, parse_nodes
+
+
+def fake_nodes(*names):
+    # One FakeServer per node, they share nothing
+    return {name: fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer()) for name in names}
+
+
+def counted(method, name, calls):
+    async def wrapper(*args, **kwargs):
+        calls.append(name)
+        return await method(*args, **kwargs)
+    return wrapper
+
+
+def test_parse_nodes():
+    assert parse_nodes(" a:6379, b:6380 ,") == [("a", 6379), ("b", 6380)]
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    keys = [f"alias{number}" for number in range(10000)]
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+
+    moved = [key for key in keys if before.get_node(key) != after.get_node(key)]
+
+    assert {after.get_node(key) for key in moved} == {"d"}
+    assert 0.15 < len(moved) / len(keys) < 0.35
+    counts = [sum(1 for key in keys if before.get_node(key) == node) for node in "abc"]
+    assert min(counts) > 2500
+
+
+@pytest.mark.asyncio
+async def test_batches_are_grouped_per_node():
+    clients = fake_nodes("a", "b", "c")
+    cache = ShardedRedis(clients)
+    items = {f"alias{number}": f"https://example.com/{number}" for number in range(300)}
+
+    assert await cache.set_many(items, expire=60) == [True] * 300
+
+    for name, client in clients.items():
+        stored = await client.keys("*")
+        assert stored and all(cache.node_for(key) == name for key in stored)
+    calls = []
+    for name, client in clients.items():
+        client.mget = counted(client.mget, name, calls)
+    keys = ["missing", *items]
+    assert await cache.mget(keys) == [None, *items.values()]
+    assert sorted(calls) == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_a_failing_node_only_fails_its_keys():
+    clients = fake_nodes("a", "b")
+    cache = ShardedRedis(clients)
+    pipeline = clients["b"].pipeline
+
+    def broken_pipeline(**kwargs):
+        pipe = pipeline(**kwargs)
+        pipe.execute = AsyncMock(side_effect=ConnectionError("down"))
+        return pipe
+
+    clients["b"].pipeline = broken_pipeline
+    items = {f"alias{number}": "url" for number in range(50)}
+
+    results = await cache.set_many(items, expire=60)
+
+    assert results == [True if cache.node_for(key) == "a" else None for key in items]
+
+
+@pytest.mark.asyncio
+async def test_health_is_reported_per_node():
+    clients = fake_nodes("a:1", "b:1")
+    clients["b:1"].ping = AsyncMock(side_effect=ConnectionError("down"))
+    main = AsyncMock(return_value=True)
+    with patch("app.api.health_checks.routers.cache_nodes", ShardedRedis(clients)) as cache:
+        result = await check_redis_nodes(main, cache.ping)
+
+    assert result["healthy"] is False
+    assert result["nodes"]["a:1"] == {"healthy": True}
+    assert result["nodes"]["b:1"] == {"healthy": False, "error": "down"}
+    assert len(result["nodes"]) == 3
+
+
+class ClusterNodeConnection(FakeAsyncRedisConnection):
+    """A fake cluster node connection, answering INFO like a real node"""
+
+    info_requested = False
+
+    def pack_command(self, *args):
+        self.info_requested = str(args[0]).upper() == "INFO"
+        # No INFO in fakeredis, a PING takes its place on the wire
+        return super().pack_command(*(("PING",) if self.info_requested else args))
+
+    async def read_response(self, **kwargs):
+        response = await super().read_response(**kwargs)
+        if self.info_requested:
+            self.info_requested = False
+            return f"# Server\r\nrun_id:run-{self.port}\r\n"
+        return response
+
+
+@pytest.fixture
+def cluster():
+    """
+    A real RedisCluster client over two fake primaries, slots 0-8191 and
+    8192-16383, so replies go through redis-py's own cluster callbacks.
+    """
+    servers = {("a", 7000): fakeredis.FakeServer(), ("b", 7001): fakeredis.FakeServer()}
+
+    async def initialize(self):
+        nodes = [
+            ClusterNode(host, port, PRIMARY, **{
+                **self.connection_kwargs, "connection_class": ClusterNodeConnection, "server": server,
+            })
+            for (host, port), server in servers.items()
+        ]
+        self.nodes_cache = {node.name: node for node in nodes}
+        self.slots_cache = {slot: [nodes[slot * 2 // 16384]] for slot in range(16384)}
+        self.default_node = nodes[0]
+
+    with patch.object(NodesManager, "initialize", initialize):
+        yield ClusterRedis(RedisCluster(startup_nodes=[ClusterNode("a", 7000)], decode_responses=True))
+
+
+@pytest.mark.asyncio
+async def test_cluster_node_operations(cluster):
+    keys = [f"key{i}" for i in range(20)]
+    assert await cluster.set_many({key: key.upper() for key in keys}, expire=100) == [True] * 20
+
+    nodes = await cluster.nodes()
+    assert nodes == ["a:7000", "b:7001"]
+    scanned = []
+    for node in nodes:
+        cursor, found = await cluster.scan(node, 0, match="key*", count=100)
+        assert cursor == 0
+        assert {cluster.node_for(key) for key in found} == {node}
+        # Keys of one node, but of many slots
+        assert await cluster.node_mget(node, found) == [key.upper() for key in found]
+        scanned += found
+        assert await cluster.ping(node) is True
+        assert await cluster.read_write_check(node)
+        # Only the url keys, not the health check key just written
+        _, urls = await cluster.scan_urls(node, 0, count=100)
+        assert sorted(urls) == sorted((key, key.upper()) for key in found)
+    assert sorted(scanned) == sorted(keys)
+    assert [await cluster.run_id(node) for node in nodes] == ["run-7000", "run-7001"]
+
+
+@pytest.mark.asyncio
+async def test_cluster_batches_keep_key_order(cluster):
+    keys = [f"key{i}" for i in range(20)]
+    await cluster.set_many({key: key.upper() for key in keys}, expire=100)
+
+    assert await cluster.mget(keys) == [key.upper() for key in keys]
+    value, ttl = await cluster.get_with_ttl("key1")
+    assert value == "KEY1" and 0 < ttl <= 100_000
+    assert await cluster.delete_many(keys[:5]) == 5
+    assert await cluster.mget(keys[:6]) == [None] * 5 + ["KEY5"]
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.core.config import settings
+from app.databases.models import Urls
+from app.utils.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = 0
+
+    async def lookup(alias):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return f"https://example.com/{alias}"
+
+    results = await asyncio.gather(*(flights.do("abc123", lookup, "abc123") for _ in range(50)))
+
+    assert calls == 1
+    assert set(results) == {"https://example.com/abc123"}
+    assert flights.shared == 49
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    results = await asyncio.gather(*(flights.do("abc123", failing) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_miss_waits_for_fill_by_another_worker():
+    from app.databases.general import fetch_alias
+
+    with patch("app.databases.general.acquire_lock", new=AsyncMock(return_value=None)), \
+            patch("app.databases.general.get_from_cache_with_ttl",
+                  new=AsyncMock(side_effect=[(None, None), (None, None), ("https://example.com", 60000)])), \
+            patch("app.databases.general.get_fill_state", new=AsyncMock(return_value=(True, None))), \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock()) as db_get:
+        url, from_cache, max_age = await fetch_alias("abc123")
+
+    assert url == "https://example.com"
+    assert from_cache
+    # The ttl left in Redis bounds the local cache, like on a plain hit
+    assert max_age == 60
+    db_get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_waiters_get_the_missing_marker_without_the_db():
+    from app.databases.general import MISSING, fetch_alias
+
+    with patch("app.databases.general.acquire_lock", new=AsyncMock(return_value=None)), \
+            patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock(return_value=(None, None))), \
+            patch("app.databases.general.get_fill_state", new=AsyncMock(return_value=(False, MISSING))), \
+            patch("app.databases.general.asyncio.sleep", new=AsyncMock()) as sleep, \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock()) as db_get:
+        assert await fetch_alias("nope123") == (None, None, None)
+
+    sleep.assert_awaited_once()
+    db_get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_waiters_stop_waiting_once_the_lock_is_released():
+    from app.databases.general import fetch_alias
+
+    with patch("app.databases.general.acquire_lock", new=AsyncMock(return_value=None)), \
+            patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock(return_value=(None, None))), \
+            patch("app.databases.general.get_fill_state", new=AsyncMock(side_effect=[(True, None), (False, None)])), \
+            patch("app.databases.general.asyncio.sleep", new=AsyncMock()) as sleep, \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock(return_value=None)) as db_get:
+        assert await fetch_alias("abc123") == (None, None, None)
+
+    assert sleep.await_count == 2
+    db_get.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_lock_holder_fills_cache():
+    from app.databases.general import fetch_alias
+
+    with patch("app.databases.general.acquire_lock", new=AsyncMock(return_value="token")), \
+            patch("app.databases.general.release_lock", new=AsyncMock()) as release, \
+            patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock(return_value=(None, None))), \
+            patch("app.databases.general.save_to_cache", new=AsyncMock()) as save, \
+            patch("app.databases.general.adaptive_ttl", return_value=3600), \
+            patch("app.databases.general.DBActions.get_url_by_alias",
+                  new=AsyncMock(return_value=Urls(alias="abc123", original_url="https://example.com"))):
+        url, from_cache, _ = await fetch_alias("abc123")
+
+    assert url == "https://example.com"
+    assert not from_cache
+    save.assert_awaited_once_with("abc123", "https://example.com", expire=3600)
+    release.assert_awaited_once_with("lock:alias:abc123", "token")
+
+
+@pytest.mark.asyncio
+async def test_lock_holder_leaves_a_marker_for_missing_aliases():
+    from app.databases.general import MISSING, fetch_alias
+
+    with patch("app.databases.general.acquire_lock", new=AsyncMock(return_value="token")), \
+            patch("app.databases.general.release_lock", new=AsyncMock()) as release, \
+            patch("app.databases.general.get_from_cache_with_ttl", new=AsyncMock(return_value=(None, None))), \
+            patch("app.databases.general.set_fill_marker", new=AsyncMock()) as marker, \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock(return_value=None)):
+        assert await fetch_alias("nope123") == (None, None, None)
+
+    marker.assert_awaited_once_with("fill:nope123", MISSING, ttl_ms=settings.CACHE_FILL_LOCK_TTL_MS)
+    release.assert_awaited_once()
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+# Generous so slow CI machines pass, tighten it locally with IMPORT_BUDGET_MS
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", 3000))
+
+
+def profile_import(code: str, **env) -> tuple[dict, str]:
+    """Run code in a fresh interpreter, returns {module: cumulative import µs} and stdout"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env={**os.environ, **env}, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules, result.stdout
+
+
+def test_app_import_is_within_budget():
+    modules, _ = profile_import("import app.main", ADMIN_URL="")
+
+    assert modules["app.main"] / 1000 < IMPORT_BUDGET_MS
+
+
+def test_import_opens_nothing_and_skips_admin():
+    code = (
+        "import sys, app.main\n"
+        "from app.databases.manager import DatabaseManager\n"
+        "from app.databases.redis import cache_nodes, redis_cache, url_cache\n"
+        "print(DatabaseManager._db_instance, DatabaseManager._async_db_instance, 'sqladmin' in sys.modules)\n"
+        "print(redis_cache.created, cache_nodes.created, url_cache.created)"
+    )
+    modules, output = profile_import(code, ADMIN_URL="")
+
+    assert output.split() == ["None", "None", "False", "False", "False", "False"]
+    assert "sqladmin" not in modules
@@ -0,0 +1,64 @@
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+
+from app.core.static_assets import IMMUTABLE, StaticAssets, negotiate_encoding
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "static" / "css").mkdir(parents=True)
+    (tmp_path / "static" / "css" / "styles.css").write_text("body { color: red; }\n" * 100)
+    (tmp_path / "static" / ".gitkeep").write_text("")
+    (tmp_path / "index.html").write_text('<link rel="stylesheet" href="../static/css/styles.css">')
+    assets = StaticAssets(tmp_path / "static", index_file=tmp_path / "index.html")
+    app = Starlette(routes=[
+        Route("/", lambda request: assets.index_response(request)),
+        Mount("/static", assets),
+    ])
+    return assets, httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_negotiate_encoding():
+    available = {"br": b"", "gzip": b"", "identity": b""}
+
+    assert negotiate_encoding("gzip, deflate, br", available) == "br"
+    assert negotiate_encoding("br;q=0, gzip;q=0.5", available) == "gzip"
+    assert negotiate_encoding("", available) == "identity"
+    assert negotiate_encoding("br", {"gzip": b"", "identity": b""}) == "identity"
+
+
+@pytest.mark.asyncio
+async def test_index_points_at_hashed_assets(client):
+    assets, client = client
+    url = assets.url_for("css/styles.css")
+
+    async with client:
+        index = await client.get("/", headers={"accept-encoding": "identity"})
+        response = await client.get(url, headers={"accept-encoding": "gzip"})
+
+    assert index.text == f'<link rel="stylesheet" href="{url}">'
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.headers["content-encoding"] == "gzip"
+    # Decoded by httpx
+    assert response.content == b"body { color: red; }\n" * 100
+    assert int(response.headers["content-length"]) < len(response.content) / 5
+    assert url.startswith("/static/css/styles.") and url.endswith(".css")
+
+
+@pytest.mark.asyncio
+async def test_etag_revalidation(client):
+    assets, client = client
+
+    async with client:
+        first = await client.get("/static/css/styles.css", headers={"accept-encoding": "gzip"})
+        second = await client.get(
+            "/static/css/styles.css", headers={"accept-encoding": "gzip", "if-none-match": first.headers["etag"]}
+        )
+        missing = await client.get("/static/.gitkeep")
+
+    assert first.headers["cache-control"] == "no-cache"
+    assert second.status_code == 304
+    assert second.content == b""
+    assert missing.status_code == 404
@@ -0,0 +1,44 @@
+import fakeredis
+import json
+import pytest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, patch
+
+from app.databases.redis import ShardedRedis
+from app.databases.stats import bucket_range, get_alias_stats
+
+
+def test_bucket_range_ends_with_current_bucket():
+    now = datetime(2026, 3, 2, 10, 45)
+
+    assert bucket_range("day", 3, now) == [date(2026, 2, 28), date(2026, 3, 1), date(2026, 3, 2)]
+    hours = bucket_range("hour", 1, now)
+    assert len(hours) == 24
+    assert hours[-1] == datetime(2026, 3, 2, 10)
+    assert hours[0] == datetime(2026, 3, 1, 11)
+
+
+@pytest.mark.asyncio
+async def test_stats_are_zero_filled_and_cached():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+    with patch("app.databases.stats.cache_nodes", ShardedRedis({"main": redis})), \
+            patch("app.databases.stats.bucket_range", return_value=[date(2026, 1, 1), date(2026, 1, 2)]), \
+            patch("app.databases.stats.DBActions") as actions:
+        actions.return_value.get_click_buckets = AsyncMock(return_value=[(date(2026, 1, 2), 5)])
+        actions.return_value.get_click_countries = AsyncMock(return_value=[("GR", 4), ("", 1)])
+        stats = await get_alias_stats("abc123", "day", 2)
+
+    assert stats["total"] == 5
+    assert stats["buckets"] == [{"start": "2026-01-01", "clicks": 0}, {"start": "2026-01-02", "clicks": 5}]
+    assert stats["countries"][1] == {"country": None, "clicks": 1}
+    assert json.loads(await redis.get("stats:abc123:day:2")) == stats
+    assert await redis.smembers("stats:abc123") == {"stats:abc123:day:2"}
+
+
+@pytest.mark.asyncio
+async def test_cached_stats_skip_the_db():
+    redis = AsyncMock()
+    redis.get.return_value = json.dumps({"total": 3})
+    with patch("app.databases.stats.cache_nodes", redis), patch("app.databases.stats.DBActions") as actions:
+        assert await get_alias_stats("abc123", "day", 30) == {"total": 3}
+    actions.assert_not_called()
@@ -0,0 +1,57 @@
+import asyncio
+import fakeredis
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.core.config import settings
+from app.databases.models import Urls
+from app.databases.redis import ShardedRedis
+from app.databases.ttl import adaptive_ttl, should_refresh_early
+
+
+@pytest.fixture
+def redis():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+    with patch("app.databases.redis.redis_cache", new=client), \
+            patch("app.databases.redis.url_cache", new=ShardedRedis({"main": client})):
+        yield client
+
+
+def test_ttl_grows_with_clicks_within_bounds():
+    cold = adaptive_ttl(0)
+    warm = adaptive_ttl(100)
+    hot = adaptive_ttl(10 ** 9)
+
+    assert settings.CACHE_TTL_MIN * 0.9 <= cold <= settings.CACHE_TTL_MIN * 1.1
+    assert warm > cold * 5
+    assert settings.CACHE_TTL_MAX * 0.9 <= hot <= settings.CACHE_TTL_MAX * 1.1
+
+
+def test_early_refresh_likely_only_near_expiry():
+    with patch("app.databases.ttl.fill_seconds", 0.01):
+        near = sum(should_refresh_early(5) for _ in range(1000))
+        far = sum(should_refresh_early(60_000) for _ in range(1000))
+
+    assert near > 500
+    assert far == 0
+    assert not should_refresh_early(None)
+    assert not should_refresh_early(-1)
+
+
+@pytest.mark.asyncio
+async def test_hit_near_expiry_refreshes_once_with_longer_ttl(redis):
+    from app.databases.general import alias_refreshes, fetch_alias
+
+    await redis.set("hot1", "https://example.com", px=50)
+    url = Urls(alias="hot1", original_url="https://example.com", total_clicks=10000)
+    with patch("app.databases.general.should_refresh_early", return_value=True), \
+            patch("app.databases.general.DBActions.get_url_by_alias", new=AsyncMock(return_value=url)) as db_get:
+        results = await asyncio.gather(*(fetch_alias("hot1") for _ in range(20)))
+        await asyncio.gather(*alias_refreshes.values())
+        # Another worker's hit while the refresh lock is held
+        await fetch_alias("hot1")
+        await asyncio.gather(*alias_refreshes.values())
+
+    assert {result[:2] for result in results} == {("https://example.com", "https://example.com")}
+    db_get.assert_awaited_once()
+    assert await redis.ttl("hot1") > settings.CACHE_TTL_MIN * 0.9 * 10
@@ -0,0 +1,105 @@
+import asyncio
+import fakeredis
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.core.config import settings
+from app.databases.redis import ShardedRedis
+from app.databases.warming import warm_cache, warming_status, watch_redis_restarts
+
+
+@pytest.fixture
+def redis():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True, server=fakeredis.FakeServer())
+    with patch("app.databases.redis.redis_cache", new=client), \
+            patch("app.databases.redis.url_cache", new=ShardedRedis({"main": client})):
+        yield client
+
+
+class FakeNodes:
+    """One cache node whose run_id changes when Redis 'restarts'"""
+
+    def __init__(self):
+        self.current = "run-a"
+        self.checks = 0
+
+    async def nodes(self):
+        return ["main"]
+
+    async def run_id(self, node):
+        self.checks += 1
+        return self.current
+
+
+async def wait_for(condition, timeout: float = 2):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_warming_writes_batches_and_reports_counts(redis):
+    from app.main import app
+
+    batches = [
+        [("hot1", "https://a.com", 100, None), ("hot2", "https://b.com", 5, None)],
+        [("new1", "https://c.com", 0, None)],
+    ]
+
+    async def iter_hot_urls(self, top_n, recent_n, batch_size):
+        assert (top_n, recent_n, batch_size) == (10, 20, 2)
+        for rows in batches:
+            yield rows
+
+    await redis.set("hot2", "https://b.com")
+    with patch("app.databases.general.DBActions.iter_hot_urls", new=iter_hot_urls):
+        status = await warm_cache(top_n=10, recent_n=20, batch_size=2)
+
+    assert await redis.get("hot1") == "https://a.com"
+    assert await redis.ttl("hot1") > await redis.ttl("new1") > 0
+    # hot2 was cached already and is left as it was
+    assert (status["loaded"], status["written"], status["running"]) == (3, 2, False)
+    with patch.object(settings, "APP_API_TOKEN", "secret"):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/health/cache_warming", headers={"api-token": "secret"})
+    assert response.json()["loaded"] == 3
+    assert response.json()["written"] == 2
+
+
+@pytest.mark.asyncio
+async def test_one_worker_warms_per_redis_run(redis):
+    nodes = FakeNodes()
+    with patch("app.databases.warming.cache_nodes", new=nodes), \
+            patch("app.databases.warming.warm_cache", new=AsyncMock()) as warm:
+        # Two workers watching the same Redis
+        workers = [asyncio.create_task(watch_redis_restarts(check_interval=0.01)) for _ in range(2)]
+        try:
+            await wait_for(lambda: warm.await_count == 1 and nodes.checks >= 10)
+            assert warm.await_count == 1
+
+            nodes.current = "run-b"
+            checked = nodes.checks
+            await wait_for(lambda: warm.await_count == 2 and nodes.checks >= checked + 10)
+            assert warm.await_count == 2
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    assert warming_status["run_id"] == "run-b"
+    assert await redis.exists("lock:warming:run-a", "lock:warming:run-b") == 2
+
+
+@pytest.mark.asyncio
+async def test_watcher_stops_when_redis_has_no_run_id(redis, caplog):
+    # fakeredis has no INFO command
+    with patch("app.databases.warming.cache_nodes", new=ShardedRedis({"main": redis})), \
+            patch("app.databases.warming.warm_cache", new=AsyncMock()) as warm:
+        async with asyncio.timeout(2):
+            await watch_redis_restarts(check_interval=0.01)
+
+    warm.assert_not_awaited()
+    warnings = [record for record in caplog.records if record.name == "app.databases.warming"]
+    assert [record.levelname for record in warnings] == ["WARNING"]
+    assert "restart detection unavailable" in warnings[0].getMessage()